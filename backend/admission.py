@@ -0,0 +1,193 @@
+import asyncio
+import math
+import time
+from typing import Dict, Iterable, Tuple
+
+import orjson
+
+import metrics
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+# Client buckets kept before idle (fully refilled) ones are dropped
+MAX_TRACKED_CLIENTS = 10000
+
+rejections = metrics.registry.counter(
+    "fishdex_admission_rejections_total", "Requests refused by admission control", ("reason",)
+)
+
+
+class TokenBucket:
+    """Per-key token buckets: `rate` tokens per second, holding at most `burst`"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def take(self, key: str) -> float:
+        """Spend one token; returns 0 when allowed, else seconds until a token is available"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / self.rate
+        if key not in self._buckets and len(self._buckets) >= MAX_TRACKED_CLIENTS:
+            self._prune(now)
+        self._buckets[key] = (tokens - 1, now)
+        return 0.0
+
+    def _prune(self, now: float):
+        # A bucket that has refilled is indistinguishable from a new one
+        self._buckets = {
+            key: (tokens, updated) for key, (tokens, updated) in self._buckets.items()
+            if tokens + (now - updated) * self.rate < self.burst
+        }
+
+
+class AdmissionMiddleware:
+    """ASGI middleware protecting the API from oversized and bursty writes.
+
+    Every request body is limited to max_body_bytes: declared lengths are
+    refused up front, chunked bodies as soon as they cross the limit. Write
+    requests (POST, PUT, PATCH, DELETE) also pass a per-client token bucket
+    (429 when empty) and a global cap on in-flight writes; a write waits up
+    to queue_timeout for a slot and is then refused with 503. Reads never
+    wait for write slots, so they keep their latency during write spikes.
+
+    Streaming uploads to upload_paths may be up to max_upload_bytes and take
+    slots from their own pool of max_inflight_uploads, so a few slow
+    uploaders cannot hold the slots other writes need.
+    """
+
+    def __init__(
+        self,
+        app,
+        max_body_bytes: int,
+        rate: float,
+        burst: float,
+        max_inflight_writes: int,
+        queue_timeout: float,
+        trust_forwarded: bool = False,
+        upload_paths: Iterable[str] = (),
+        max_upload_bytes: int = 0,
+        max_inflight_uploads: int = 1,
+    ):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+        self.buckets = TokenBucket(rate, burst) if rate > 0 else None
+        self.max_inflight_writes = max_inflight_writes
+        self.queue_timeout = queue_timeout
+        self.trust_forwarded = trust_forwarded
+        self.upload_paths = frozenset(upload_paths)
+        self.max_upload_bytes = max_upload_bytes
+        self._write_slots = asyncio.Semaphore(max_inflight_writes)
+        self._upload_slots = asyncio.Semaphore(max_inflight_uploads)
+        self.inflight_writes = 0
+        self.inflight_uploads = 0
+        metrics.registry.gauge(
+            "fishdex_inflight_writes", "Write requests currently being handled", lambda: self.inflight_writes
+        )
+        metrics.registry.gauge(
+            "fishdex_inflight_uploads", "Streaming uploads currently being handled", lambda: self.inflight_uploads
+        )
+
+    def client_key(self, scope) -> str:
+        if self.trust_forwarded:
+            for name, value in scope["headers"]:
+                if name == b"x-forwarded-for":
+                    return value.decode("latin-1").split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        upload = scope["method"] in WRITE_METHODS and scope["path"] in self.upload_paths
+        max_body_bytes = self.max_upload_bytes if upload else self.max_body_bytes
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                if not value.isdigit() or int(value) > max_body_bytes:
+                    await self._reject(send, "body_too_large", 413, "Request body too large")
+                    return
+                break
+
+        if scope["method"] not in WRITE_METHODS:
+            await self._handle(scope, receive, send, max_body_bytes)
+            return
+
+        if self.buckets is not None:
+            wait = self.buckets.take(self.client_key(scope))
+            if wait:
+                await self._reject(send, "rate_limited", 429, "Too many requests", math.ceil(wait))
+                return
+
+        slots = self._upload_slots if upload else self._write_slots
+        try:
+            await asyncio.wait_for(slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            await self._reject(send, "overloaded", 503, "Server busy, retry shortly", math.ceil(self.queue_timeout) or 1)
+            return
+        if upload:
+            self.inflight_uploads += 1
+        else:
+            self.inflight_writes += 1
+        try:
+            await self._handle(scope, receive, send, max_body_bytes)
+        finally:
+            if upload:
+                self.inflight_uploads -= 1
+            else:
+                self.inflight_writes -= 1
+            slots.release()
+
+    async def _handle(self, scope, receive, send, max_body_bytes: int):
+        received = 0
+        started = False
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body_bytes:
+                    # Answer 413 here and hand the app a disconnect: an error
+                    # raised instead would come back as FastAPI's 400 for
+                    # unreadable bodies
+                    rejected = True
+                    if started:
+                        rejections.inc("body_too_large")
+                    else:
+                        await self._reject(send, "body_too_large", 413, "Request body too large")
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def send_wrapper(message):
+            nonlocal started
+            if rejected:
+                # The 413 went out already; drop what the app answers to the disconnect
+                return
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, send_wrapper)
+        except Exception:
+            if not rejected:
+                raise
+
+    async def _reject(self, send, reason: str, status: int, detail: str, retry_after: int = None):
+        rejections.inc(reason)
+        body = orjson.dumps({"detail": detail})
+        headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        if retry_after is not None:
+            headers.append((b"retry-after", str(retry_after).encode()))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,224 @@
+"""Load test for the FishDex API, run in-process.
+
+Starts server.app behind httpx's ASGI transport, seeds a catalog of the
+requested size and drives concurrent traffic at the main endpoints. Each
+scenario reports throughput and p50/p95/p99 latency; results are written as
+JSON so runs from different commits can be compared with --compare.
+
+By default the database is the in-memory backend (MONGO_URL=memory://);
+pass --mongo-url to run against a real mongod. The benchmark database is
+dropped and re-seeded on every run, so never point it at production data.
+
+Run from the backend directory:
+    python benchmarks/load.py --catalog-size 10000 --concurrency 32
+"""
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import typer
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+async def seed(server, catalog_size: int):
+    """Replace the catalog with FISH_DATABASE padded to catalog_size species"""
+    import indexes
+    import stats
+    from serialization import make_catalog
+
+    db = server.db
+    await db.fish.delete_many({})
+    await db.user_catches.delete_many({})
+    await db.stats.delete_many({})
+    await db.jobs.delete_many({})
+
+    documents = [dict(fish, _id=f"seed-{i}") for i, fish in enumerate(server.FISH_DATABASE)]
+    # Numbered after FISH_DATABASE's own generated species, so scientific names stay unique
+    documents += make_catalog(max(0, catalog_size - len(documents)), start=len(documents) + 1)
+    for start in range(0, len(documents), 5000):
+        await db.fish.insert_many(documents[start:start + 5000])
+
+    await indexes.apply_indexes(db)
+    await stats.reconcile(db)
+    server.catalog_cache.invalidate()
+    return [document["_id"] for document in documents]
+
+
+async def run_scenario(client, name, make_request, concurrency: int, duration: float) -> dict:
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await make_request(client)
+                if response.status_code >= 400:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    result = {
+        "scenario": name,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1e3,
+        "p95_ms": percentile(latencies, 0.95) * 1e3,
+        "p99_ms": percentile(latencies, 0.99) * 1e3,
+    }
+    typer.echo(
+        f"{name:<28} {result['throughput_rps']:9.1f} req/s  "
+        f"p50 {result['p50_ms']:7.2f} ms  p95 {result['p95_ms']:7.2f} ms  "
+        f"p99 {result['p99_ms']:7.2f} ms  errors {errors}"
+    )
+    return result
+
+
+async def run(catalog_size, concurrency, duration, mongo_url, db_name, scenarios, coalesce_ms):
+    import httpx
+
+    os.environ["INSERT_COALESCE_MS"] = str(coalesce_ms)
+    # Every simulated client shares one address; don't rate-limit them as one
+    os.environ.setdefault("WRITE_RATE_PER_SECOND", "0")
+
+    # Without --mongo-url the API runs on the in-process memory:// backend
+    os.environ["MONGO_URL"] = mongo_url or "memory://"
+    os.environ["DB_NAME"] = db_name
+    import server
+
+    # server.py logs at INFO, and httpx logs every request at that level:
+    # keep that out of the output and out of the timed region
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    fish_ids = await seed(server, catalog_size)
+    await server.startup_event()
+
+    unlock_body = {"location": "Lago di Garda", "equipment": "Spinning", "date": "16/10/2026"}
+
+    async def list_fish(client):
+        return await client.get("/api/fish")
+
+    async def revalidate_fish(client):
+        return await client.get("/api/fish", headers={"If-None-Match": list_etag})
+
+    async def list_page(client):
+        return await client.get("/api/fish", params={"habitat": "mare", "limit": 50})
+
+    async def get_fish(client):
+        return await client.get(f"/api/fish/{random.choice(fish_ids)}")
+
+    async def unlock(client):
+        return await client.post(f"/api/fish/{random.choice(fish_ids)}/unlock", json=unlock_body)
+
+    async def get_stats(client):
+        return await client.get("/api/stats")
+
+    available = {
+        "GET /api/fish": list_fish,
+        "GET /api/fish (304)": revalidate_fish,
+        "GET /api/fish?habitat&limit": list_page,
+        "GET /api/fish/{id}": get_fish,
+        "POST /api/fish/{id}/unlock": unlock,
+        "GET /api/stats": get_stats,
+    }
+    selected = [name for name in available if not scenarios or any(s in name for s in scenarios)]
+
+    results = []
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=server.app), base_url="http://bench"
+    ) as client:
+        list_etag = (await list_fish(client)).headers.get("etag", "")
+        for name in selected:
+            results.append(await run_scenario(client, name, available[name], concurrency, duration))
+    return results
+
+
+def compare(results, previous_path: Path):
+    previous = {row["scenario"]: row for row in json.loads(previous_path.read_text())["results"]}
+    typer.echo(f"\nCompared with {previous_path.name}:")
+    for row in results:
+        before = previous.get(row["scenario"])
+        if not before:
+            continue
+        typer.echo(
+            f"{row['scenario']:<28} throughput {row['throughput_rps'] / before['throughput_rps'] - 1:+7.1%}  "
+            f"p99 {row['p99_ms'] / before['p99_ms'] - 1:+7.1%}"
+        )
+
+
+def main(
+    catalog_size: int = typer.Option(1000, help="Number of species to seed"),
+    concurrency: int = typer.Option(16, help="Concurrent clients per scenario"),
+    duration: float = typer.Option(5.0, help="Seconds per scenario"),
+    mongo_url: str = typer.Option(None, help="Use this mongod instead of the in-memory stand-in"),
+    db_name: str = typer.Option("fishdex_bench", help="Database to seed (dropped on every run)"),
+    scenario: list[str] = typer.Option(None, help="Only run scenarios containing this text"),
+    coalesce_ms: float = typer.Option(0, help="Group-commit window for unlock inserts (0 = off)"),
+    output: Path = typer.Option(None, help="Results file (default: benchmarks/results/<time>-<commit>.json)"),
+    compare_with: Path = typer.Option(None, "--compare", help="Earlier results file to compare against"),
+):
+    results = asyncio.run(run(catalog_size, concurrency, duration, mongo_url, db_name, scenario, coalesce_ms))
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.utcnow().isoformat(),
+        "backend": "mongodb" if mongo_url else "in-memory",
+        "catalog_size": catalog_size,
+        "concurrency": concurrency,
+        "duration_s": duration,
+        "coalesce_ms": coalesce_ms,
+        "python": platform.python_version(),
+        "results": results,
+    }
+    if output is None:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        output = RESULTS_DIR / f"{datetime.utcnow():%Y%m%d-%H%M%S}-{commit or 'nogit'}.json"
+    output.write_text(json.dumps(report, indent=2))
+    typer.echo(f"\nResults written to {output}")
+
+    if compare_with:
+        compare(results, compare_with)
+
+
+if __name__ == "__main__":
+    typer.run(main)
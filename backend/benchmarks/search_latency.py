@@ -0,0 +1,51 @@
+"""Latency benchmark for the in-memory fish search index.
+
+Builds a SearchIndex over a synthetic catalog plus FISH_DATABASE and reports
+p50/p99 per query. Run from the backend directory:
+    python benchmarks/search_latency.py --size 100000
+"""
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import typer
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from catalog import shape_fish  # noqa: E402
+from search import SearchIndex  # noqa: E402
+from serialization import make_catalog  # noqa: E402
+from server import FISH_DATABASE  # noqa: E402
+
+QUERIES = ["spigla", "dicentrarchus", "luccio", "trota fario", "pesce 4242", "species777", "descrizione", "habitat mare"]
+
+
+def main(
+    size: int = typer.Option(100000, help="Number of synthetic species"),
+    repeat: int = typer.Option(200, help="Runs per query"),
+):
+    catalog = [shape_fish(fish) for fish in make_catalog(size)]
+    catalog += [shape_fish(dict(fish, _id=str(uuid.uuid4()))) for fish in FISH_DATABASE]
+
+    index = SearchIndex()
+    start = time.perf_counter()
+    index.sync(catalog, 1)
+    typer.echo(f"Indexed {len(index)} species in {time.perf_counter() - start:.2f}s")
+
+    for query in QUERIES:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            results = index.search(query, limit=20)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        top = results[0][0]["name"] if results else "-"
+        typer.echo(
+            f"{query:>15}  p50 {timings[len(timings) // 2] * 1e3:6.2f} ms  "
+            f"p99 {timings[int(len(timings) * 0.99) - 1] * 1e3:6.2f} ms  top: {top}"
+        )
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,98 @@
+"""Microbenchmark for the GET /api/fish serialization paths.
+
+Measures per-request CPU time for:
+  * baseline     - build Fish models, validate them again through
+                   response_model=List[Fish] and encode with json (the old path)
+  * orjson       - encode already shaped catalog dicts with ORJSONResponse
+  * preencoded   - send the bytes a CatalogSnapshot encoded once per version
+
+Run from the backend directory:
+    python benchmarks/serialization.py --sizes 150,10000,100000
+"""
+import json
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import List
+
+import typer
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+from pydantic import TypeAdapter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from catalog import CatalogSnapshot, shape_fish  # noqa: E402
+from server import Fish  # noqa: E402
+
+
+def make_catalog(size: int, start: int = 0) -> List[dict]:
+    habitats = ["mare", "fiume", "lago"]
+    return [
+        {
+            "_id": str(uuid.uuid4()),
+            "name": f"Pesce {i}",
+            "scientificName": f"Piscis species{i}",
+            "habitat": habitats[i % 3],
+            "description": f"Descrizione del pesce numero {i} dell'habitat {habitats[i % 3]}.",
+            "referenceImage": f"https://via.placeholder.com/200x100/4A90E2/FFFFFF?text=Pesce{i}",
+        }
+        for i in range(start, start + size)
+    ]
+
+
+def cpu_per_call(fn, min_time: float) -> float:
+    """Average process CPU seconds per call, repeating for at least min_time"""
+    fn()  # warm up
+    calls = 0
+    start = time.process_time()
+    while True:
+        fn()
+        calls += 1
+        elapsed = time.process_time() - start
+        if elapsed >= min_time:
+            return elapsed / calls
+
+
+def main(
+    sizes: str = typer.Option("150,10000,100000", help="Comma separated catalog sizes"),
+    min_time: float = typer.Option(1.0, help="Minimum CPU seconds spent per measurement"),
+    output: Path = typer.Option(None, help="Write the results to this JSON file"),
+):
+    list_adapter = TypeAdapter(List[Fish])
+    results = []
+    for size in [int(value) for value in sizes.split(",")]:
+        docs = make_catalog(size)
+        shaped = [shape_fish(dict(doc)) for doc in docs]
+        snapshot = CatalogSnapshot(0, shaped)
+
+        def baseline():
+            fish = [Fish(**doc) for doc in docs]
+            content = list_adapter.dump_python(
+                list_adapter.validate_python(fish, from_attributes=True), mode="json", by_alias=True
+            )
+            JSONResponse(content=content)
+
+        def orjson_path():
+            ORJSONResponse(content=shaped)
+
+        def preencoded():
+            Response(content=snapshot.body, media_type="application/json")
+
+        row = {"size": size}
+        for name, fn in (("baseline", baseline), ("orjson", orjson_path), ("preencoded", preencoded)):
+            row[name] = cpu_per_call(fn, min_time)
+        results.append(row)
+        typer.echo(
+            f"{size:>7} species  baseline {row['baseline'] * 1e3:9.3f} ms  "
+            f"orjson {row['orjson'] * 1e3:9.3f} ms  "
+            f"preencoded {row['preencoded'] * 1e3:9.4f} ms  "
+            f"({row['baseline'] / row['preencoded']:.0f}x)"
+        )
+
+    if output:
+        output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,251 @@
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import AsyncIterator, Iterator, Optional, Tuple
+
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.concurrency import run_in_threadpool
+
+CHUNK_SIZE = 64 * 1024
+
+DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+# Leading bytes of the image formats the app uploads
+_MAGIC_TYPES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF8", "image/gif"),
+]
+
+
+class BlobTooLarge(Exception):
+    pass
+
+
+class InvalidUpload(Exception):
+    pass
+
+
+def guess_content_type(head: bytes) -> str:
+    for magic, content_type in _MAGIC_TYPES:
+        if head.startswith(magic):
+            return content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:12] in (b"ftypheic", b"ftypheix", b"ftypmif1"):
+        return "image/heic"
+    return "application/octet-stream"
+
+
+class BlobWriter:
+    """Writes one blob to a temporary file, hashing it as the bytes arrive.
+
+    All methods do blocking disk I/O; async callers run them in the thread pool.
+    """
+
+    def __init__(self, store: "BlobStore"):
+        self._store = store
+        self._file = tempfile.NamedTemporaryFile(dir=store.tmp_dir, delete=False)
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self._store.max_bytes:
+            raise BlobTooLarge(f"Blob exceeds {self._store.max_bytes} bytes")
+        self._hash.update(data)
+        self._file.write(data)
+
+    def commit(self) -> str:
+        """Move the finished file to its content address and return the digest"""
+        # On disk before it is visible: a torn file at a content address
+        # would be kept forever, since existing digests are never rewritten
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        digest = self._hash.hexdigest()
+        target = self._store.path_for(digest)
+        if target.exists():
+            # Same content already stored: keep the existing copy
+            os.unlink(self._file.name)
+        else:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(self._file.name, target)
+        return digest
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.unlink(self._file.name)
+        except FileNotFoundError:
+            pass
+
+
+class BlobStore:
+    """Content-addressed file store keyed by the SHA-256 of the content"""
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.tmp_dir = self.root / "tmp"
+        self.max_bytes = max_bytes
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    def variant_dir(self, digest: str) -> Path:
+        """Where resized renditions of a blob are cached"""
+        return self.root / "variants" / digest[:2] / digest
+
+    def exists(self, digest: str) -> bool:
+        return bool(DIGEST_RE.match(digest)) and self.path_for(digest).is_file()
+
+    def writer(self) -> BlobWriter:
+        return BlobWriter(self)
+
+    def put_bytes(self, data: bytes) -> str:
+        writer = self.writer()
+        try:
+            writer.write(data)
+        except Exception:
+            writer.abort()
+            raise
+        return writer.commit()
+
+    def content_type(self, digest: str) -> str:
+        with open(self.path_for(digest), "rb") as f:
+            return guess_content_type(f.read(16))
+
+    def size(self, digest: str) -> int:
+        return self.path_for(digest).stat().st_size
+
+    def describe(self, digest: str) -> Optional[Tuple[int, str]]:
+        """Size and content type of a blob, or None if it is not stored"""
+        if not DIGEST_RE.match(digest):
+            return None
+        try:
+            with open(self.path_for(digest), "rb") as f:
+                return os.fstat(f.fileno()).st_size, guess_content_type(f.read(16))
+        except FileNotFoundError:
+            return None
+
+    def iter_range(self, digest: str, start: int, end: int) -> Iterator[bytes]:
+        """Yield bytes start..end (inclusive) of a blob in CHUNK_SIZE pieces"""
+        remaining = end - start + 1
+        with open(self.path_for(digest), "rb") as f:
+            f.seek(start)
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    async def put_multipart(self, content_type: str, stream: AsyncIterator[bytes]) -> Tuple[str, int]:
+        """Stream the first file part of a multipart body into the store.
+
+        The body is fed to the multipart parser chunk by chunk and file data
+        goes straight to disk, so memory use does not depend on upload size.
+        Parsing and the disk writes run in the thread pool, one chunk at a
+        time, off the event loop.
+        """
+        media_type, params = parse_options_header(content_type)
+        boundary = params.get(b"boundary")
+        if media_type != b"multipart/form-data" or not boundary:
+            raise InvalidUpload("Expected a multipart/form-data body")
+
+        state = {"header_field": b"", "header_value": b"", "headers": {}, "writer": None, "done": None}
+
+        def on_part_begin():
+            state["headers"] = {}
+
+        def on_header_field(data, start, end):
+            state["header_field"] += data[start:end]
+
+        def on_header_value(data, start, end):
+            state["header_value"] += data[start:end]
+
+        def on_header_end():
+            state["headers"][state["header_field"].lower()] = state["header_value"]
+            state["header_field"] = b""
+            state["header_value"] = b""
+
+        def on_headers_finished():
+            _, disposition = parse_options_header(state["headers"].get(b"content-disposition", b""))
+            if state["done"] is None and b"filename" in disposition:
+                state["writer"] = self.writer()
+
+        def on_part_data(data, start, end):
+            if state["writer"] is not None:
+                state["writer"].write(data[start:end])
+
+        def on_part_end():
+            if state["writer"] is not None:
+                writer = state["writer"]
+                state["writer"] = None
+                state["done"] = (writer.commit(), writer.size)
+
+        parser = MultipartParser(boundary, {
+            "on_part_begin": on_part_begin,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+        })
+        def feed(chunk: Optional[bytes]):
+            try:
+                if chunk is None:
+                    parser.finalize()
+                else:
+                    parser.write(chunk)
+            except BlobTooLarge:
+                raise
+            except Exception as e:
+                raise InvalidUpload(f"Malformed multipart body: {e}")
+
+        try:
+            # Errors raised by the stream itself (e.g. a disconnect) propagate as is
+            async for chunk in stream:
+                await run_in_threadpool(feed, chunk)
+            await run_in_threadpool(feed, None)
+        finally:
+            if state["writer"] is not None:
+                await run_in_threadpool(state["writer"].abort)
+
+        if state["done"] is None:
+            raise InvalidUpload("No file part in upload")
+        return state["done"]
+
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single 'bytes=' range into inclusive offsets.
+
+    Returns None when the header is absent or not something we serve as a
+    partial response (e.g. multiple ranges); raises ValueError when the range
+    cannot be satisfied.
+    """
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    spec = range_header[len("bytes="):].strip()
+    if "," in spec:
+        return None
+    first, _, last = spec.partition("-")
+    try:
+        if first == "":
+            suffix = int(last)
+            if suffix <= 0:
+                raise ValueError("Unsatisfiable range")
+            start, end = max(size - suffix, 0), size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else size - 1
+    except ValueError:
+        raise ValueError("Unsatisfiable range")
+    end = min(end, size - 1)
+    if start >= size or start > end:
+        raise ValueError("Unsatisfiable range")
+    return start, end
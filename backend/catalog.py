@@ -0,0 +1,223 @@
+import asyncio
+import base64
+import hashlib
+import json
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import orjson
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+
+
+def encode_json(data) -> bytes:
+    """Encode data the same way the API's ORJSONResponse does"""
+    return orjson.dumps(data)
+
+
+def shape_fish(doc: dict) -> dict:
+    """Give a stored fish document the response fields of the Fish model.
+
+    Catalog documents are written from validated data, so list requests fill
+    in the client-side defaults instead of re-validating through Pydantic.
+    """
+    doc.pop("_rev", None)
+    doc.setdefault("isUnlocked", False)
+    doc.setdefault("userCatch", None)
+    doc.setdefault("ordinal", None)
+    return doc
+
+
+def make_etag(body: bytes) -> str:
+    """Strong ETag derived from the response bytes"""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+class CatalogSnapshot:
+    """Immutable, pre-encoded view of the fish catalog"""
+
+    def __init__(self, version: int, fish: List[dict]):
+        self.version = version
+        self.checked_at = time.monotonic()
+        self.fish = fish
+        self.by_id: Dict[str, dict] = {item["_id"]: item for item in fish}
+
+        self.body = encode_json(fish)
+        self.etag = make_etag(self.body)
+
+        # Single fish responses are encoded up front as well
+        self.item_bodies: Dict[str, bytes] = {}
+        self.item_etags: Dict[str, str] = {}
+        for fish_id, item in self.by_id.items():
+            item_body = encode_json(item)
+            self.item_bodies[fish_id] = item_body
+            self.item_etags[fish_id] = make_etag(item_body)
+
+    def habitat_and_ordinal(self, fish_id: str) -> Optional[Tuple[Optional[str], Optional[int]]]:
+        fish = self.by_id.get(fish_id)
+        return (fish.get("habitat"), fish.get("ordinal")) if fish is not None else None
+
+
+class CatalogCache:
+    """Process-wide catalog snapshot, loaded once and refreshed when the catalog changes.
+
+    Writes made by this process call invalidate(). Writes made elsewhere (the
+    import CLI, other workers) are noticed by re-reading the catalog version
+    at most every refresh_interval seconds, which is a single small read;
+    the catalog itself is only reloaded when the version moved.
+
+    Concurrent misses share a single in-flight load, so a cold cache costs one
+    Mongo query no matter how many requests arrive at the same time.
+
+    snapshot_factory builds the cached object from the version and the
+    loader's result; it must allow setting a checked_at attribute. With
+    build_in_thread it runs in the thread pool, off the event loop. With
+    serve_stale, a snapshot past refresh_interval is still returned at once
+    while the refresh runs in the background; only a cold cache waits.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[], Awaitable[List[dict]]],
+        version_reader: Optional[Callable[[], Awaitable[int]]] = None,
+        refresh_interval: float = 5.0,
+        snapshot_factory: Callable = CatalogSnapshot,
+        build_in_thread: bool = False,
+        serve_stale: bool = False,
+    ):
+        self._loader = loader
+        self._version_reader = version_reader
+        self._refresh_interval = refresh_interval
+        self._snapshot_factory = snapshot_factory
+        self._build_in_thread = build_in_thread
+        self._serve_stale = serve_stale
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._loading: Optional[asyncio.Task] = None
+        self._generation = 0
+
+    @property
+    def snapshot(self) -> Optional[CatalogSnapshot]:
+        return self._snapshot
+
+    async def get(self) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and (
+            self._version_reader is None
+            or time.monotonic() - snapshot.checked_at < self._refresh_interval
+        ):
+            return snapshot
+
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(self._load(self._generation))
+        if snapshot is not None and self._serve_stale:
+            return snapshot
+        # Shield the shared load so one cancelled request does not abort it for the others
+        return await asyncio.shield(self._loading)
+
+    def invalidate(self):
+        """Drop the current snapshot; the next get() reloads from Mongo"""
+        self._generation += 1
+        self._snapshot = None
+        self._loading = None
+
+    async def _load(self, generation: int) -> CatalogSnapshot:
+        task = asyncio.current_task()
+        current = self._snapshot
+        try:
+            version = await self._version_reader() if self._version_reader else generation
+            if current is not None and current.version == version:
+                snapshot = current
+            elif self._build_in_thread:
+                snapshot = await run_in_threadpool(self._snapshot_factory, version, await self._loader())
+            else:
+                snapshot = self._snapshot_factory(version, await self._loader())
+            snapshot.checked_at = time.monotonic()
+            # Only keep the result if nobody invalidated the cache meanwhile
+            if generation == self._generation:
+                self._snapshot = snapshot
+            return snapshot
+        except Exception:
+            if current is None:
+                raise
+            # Keep serving the last good snapshot while Mongo is unavailable
+            current.checked_at = time.monotonic()
+            return current
+        finally:
+            if self._loading is task:
+                self._loading = None
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag (RFC 7232)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def cached_response(body: bytes, etag: str, if_none_match: Optional[str], max_age: int) -> Response:
+    """JSON response with ETag/Cache-Control, or an empty 304 if the client is current"""
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={max_age}, must-revalidate",
+    }
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# Fields a list request may project with ?fields=; _id and name are always
+# returned because the pagination cursor is built from them
+PROJECTABLE_FIELDS = ("_id", "name", "scientificName", "habitat", "description", "referenceImage", "ordinal")
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Dict[str, int]]:
+    """Turn a comma separated ?fields= value into a Mongo projection"""
+    if not fields:
+        return None
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in PROJECTABLE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    projection = {"_id": 1, "name": 1}
+    for field in requested:
+        projection[field] = 1
+    return projection
+
+
+def encode_cursor(fish: dict) -> str:
+    """Opaque keyset cursor pointing just past the given fish"""
+    raw = json.dumps([fish["name"], fish["_id"]], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        name, fish_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(name, str) or not isinstance(fish_id, str):
+        raise ValueError("Invalid cursor")
+    return name, fish_id
+
+
+def page_query(habitat: Optional[str], cursor: Optional[str]) -> dict:
+    """Mongo filter for one page of the (name, _id) ordered catalog"""
+    query = {}
+    if habitat:
+        query["habitat"] = habitat
+    if cursor:
+        name, fish_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"name": {"$gt": name}},
+            {"name": name, "_id": {"$gt": fish_id}},
+        ]
+    return query
@@ -0,0 +1,153 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Iterable, Optional
+
+from pymongo import ReturnDocument, UpdateOne
+
+# Catalog revision counters (the last allocated and the last committed
+# revision), the oldest revision the change log still covers and the next
+# free species ordinal
+META_ID = "catalog"
+
+# Number of catalog revisions kept in fish_changes; clients further behind
+# than this get a full snapshot instead of a delta
+CHANGE_LOG_RETENTION = 1000
+
+# Seconds a writer waits for earlier revisions to commit before committing
+# its own anyway (the writer of the earlier revision died half way)
+COMMIT_WAIT_SECONDS = 30.0
+COMMIT_POLL_SECONDS = 0.05
+
+
+def committed_of(meta: Optional[dict]) -> int:
+    """Last committed revision; catalogs written before commits existed only have `revision`"""
+    if not meta:
+        return 0
+    return meta.get("committed", meta.get("revision", 0))
+
+
+async def get_meta(db) -> dict:
+    meta = await db.catalog_meta.find_one({"_id": META_ID})
+    return meta or {"_id": META_ID, "revision": 0, "committed": 0, "log_start": 0}
+
+
+async def current_revision(db, session=None) -> int:
+    """The last committed revision: every change up to it is in the catalog and the change log"""
+    meta = await db.catalog_meta.find_one({"_id": META_ID}, {"revision": 1, "committed": 1}, session=session)
+    return committed_of(meta)
+
+
+async def next_revision(db) -> int:
+    """Allocate the revision for one catalog write.
+
+    Readers do not see the revision until the writer calls commit_revision()
+    after writing its documents and change log entries.
+    """
+    meta = await db.catalog_meta.find_one({"_id": META_ID}, {"revision": 1, "committed": 1})
+    if meta and "committed" not in meta:
+        # Written before commits existed: every revision so far is complete
+        await db.catalog_meta.update_one(
+            {"_id": META_ID, "committed": {"$exists": False}, "revision": meta.get("revision", 0)},
+            {"$set": {"committed": meta.get("revision", 0)}},
+        )
+    meta = await db.catalog_meta.find_one_and_update(
+        {"_id": META_ID},
+        {"$inc": {"revision": 1}, "$setOnInsert": {"committed": 0, "log_start": 0}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return meta["revision"]
+
+
+async def commit_revision(db, revision: int):
+    """Publish a revision once its documents and change log entries are written.
+
+    Revisions are committed in order, so a reader at revision N has seen
+    every change up to N: a writer that finishes before the writer of an
+    earlier revision waits for it, for at most COMMIT_WAIT_SECONDS.
+    """
+    deadline = time.monotonic() + COMMIT_WAIT_SECONDS
+    while True:
+        result = await db.catalog_meta.update_one(
+            {"_id": META_ID, "$or": [{"committed": {"$gte": revision - 1}}, {"committed": {"$exists": False}}]},
+            {"$max": {"committed": revision}},
+        )
+        if result.matched_count:
+            return
+        if time.monotonic() >= deadline:
+            await db.catalog_meta.update_one({"_id": META_ID}, {"$max": {"committed": revision}})
+            return
+        await asyncio.sleep(COMMIT_POLL_SECONDS)
+
+
+async def log_changes(db, revision: int, upserted: Iterable[str] = (), deleted: Iterable[str] = ()):
+    """Record which species a catalog revision touched and prune old entries.
+
+    Writers allocate the revision with next_revision(), store it as `_rev` on
+    the documents they write, call this and then commit_revision().
+    """
+    now = datetime.utcnow()
+    entries = [{"rev": revision, "fish_id": fish_id, "op": "upsert", "at": now} for fish_id in upserted]
+    entries += [{"rev": revision, "fish_id": fish_id, "op": "delete", "at": now} for fish_id in deleted]
+    if entries:
+        await db.fish_changes.insert_many(entries)
+
+    log_start = revision - CHANGE_LOG_RETENTION
+    if log_start > 0:
+        await db.fish_changes.delete_many({"rev": {"$lte": log_start}})
+        await db.catalog_meta.update_one(
+            {"_id": META_ID, "log_start": {"$lt": log_start}}, {"$set": {"log_start": log_start}}
+        )
+
+
+async def changes_since(db, since: int) -> Optional[dict]:
+    """Species upserted and deleted after `since`, or None if the log no longer reaches back that far"""
+    meta = await get_meta(db)
+    revision = committed_of(meta)
+    if since < meta.get("log_start", 0) or since > revision:
+        return None
+
+    latest_op = {}
+    async for change in db.fish_changes.find(
+        {"rev": {"$gt": since, "$lte": revision}}, {"fish_id": 1, "op": 1}
+    ).sort("rev", 1):
+        latest_op[change["fish_id"]] = change["op"]
+
+    upserted_ids = [fish_id for fish_id, op in latest_op.items() if op == "upsert"]
+    deleted = [fish_id for fish_id, op in latest_op.items() if op == "delete"]
+    upserted = await db.fish.find({"_id": {"$in": upserted_ids}}).to_list(None) if upserted_ids else []
+    return {"revision": revision, "upserted": upserted, "deleted": deleted}
+
+
+async def allocate_ordinals(db, count: int) -> int:
+    """Reserve `count` consecutive catalog ordinals and return the first.
+
+    Ordinals are never reused, so they can index per-user progress bitmaps.
+    """
+    meta = await db.catalog_meta.find_one_and_update(
+        {"_id": META_ID},
+        {"$inc": {"next_ordinal": count}, "$setOnInsert": {"revision": 0, "log_start": 0}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return meta["next_ordinal"] - count
+
+
+async def assign_missing_ordinals(db) -> int:
+    """Give an ordinal to every species that predates them; returns how many"""
+    missing = [
+        fish["_id"]
+        async for fish in db.fish.find({"ordinal": {"$exists": False}}, {"_id": 1}).sort("_id", 1)
+    ]
+    if not missing:
+        return 0
+    first = await allocate_ordinals(db, len(missing))
+    revision = await next_revision(db)
+    await db.fish.bulk_write([
+        UpdateOne({"_id": fish_id, "ordinal": {"$exists": False}}, {"$set": {"ordinal": first + i, "_rev": revision}})
+        for i, fish_id in enumerate(missing)
+    ], ordered=False)
+    await log_changes(db, revision, upserted=missing)
+    await commit_revision(db, revision)
+    return len(missing)
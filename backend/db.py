@@ -1,13 +1,39 @@
-import os
-from pymongo import MongoClient
+"""Synchronous MongoDB handle for scripts and notebooks.
+
+`from db import db` connects on first access, not at import, using the same
+MONGO_* settings as the API (see repository.MongoSettings).
+"""
+import logging
+
 from dotenv import load_dotenv
+from pymongo import MongoClient
+
+from repository import MongoSettings, memory_client
 
 load_dotenv()  # carica le variabili dal .env
 
-MONGO_URL = os.getenv("MONGO_URL")
-DB_NAME = os.getenv("DB_NAME")
+logger = logging.getLogger(__name__)
+
+settings = MongoSettings.from_env()
+
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        if settings.in_memory:
+            _client = memory_client(sync=True)
+        else:
+            _client = MongoClient(settings.url, **settings.client_options())
+        logger.info("MongoDB client created for database %s", settings.db_name)
+    return _client
 
-client = MongoClient(MONGO_URL)
-db = client[DB_NAME]
 
-print("✅ MongoDB connesso!")
+def __getattr__(name):
+    # Module-level `client` and `db`, created lazily
+    if name == "client":
+        return get_client()
+    if name == "db":
+        return get_client()[settings.db_name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,64 @@
+import csv
+import io
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional
+
+import orjson
+
+# Column order of CSV exports; documents may lack some of them
+CSV_COLUMNS = [
+    "_id", "fish_id", "user_id", "idempotency_key", "photo_blob",
+    "location", "equipment", "date", "caught_at", "created_at",
+]
+
+# Bookkeeping of the catches.created job kept on each catch; not exported
+JOB_FIELDS = ("applied", "first_unlock", "pending_job")
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def export_query(since: Optional[datetime], after_id: Optional[str]) -> dict:
+    query = {}
+    if since is not None:
+        if since.tzinfo is not None:
+            # created_at is stored as naive UTC
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+        query["created_at"] = {"$gte": since}
+    if after_id:
+        query["_id"] = {"$gt": after_id}
+    return query
+
+
+async def iter_batches(cursor, batch_size: int) -> AsyncIterator[list]:
+    """Pull a cursor batch_size documents at a time; only one batch is held in memory"""
+    while True:
+        batch = await cursor.to_list(batch_size)
+        if not batch:
+            return
+        yield batch
+
+
+async def iter_ndjson(cursor, batch_size: int) -> AsyncIterator[bytes]:
+    async for batch in iter_batches(cursor, batch_size):
+        yield b"".join(orjson.dumps(doc) + b"\n" for doc in batch)
+
+
+async def iter_csv(cursor, batch_size: int, columns) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    async for batch in iter_batches(cursor, batch_size):
+        for doc in batch:
+            for column in ("caught_at", "created_at"):
+                if isinstance(doc.get(column), datetime):
+                    doc[column] = doc[column].isoformat()
+            writer.writerow(doc)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Header only: the export matched nothing
+        yield buffer.getvalue().encode("utf-8")
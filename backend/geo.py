@@ -0,0 +1,177 @@
+import math
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from stats import HABITATS
+
+# Heatmap tiles use the Web Mercator (slippy map) grid the map SDKs use:
+# zoom z splits the world into 2**z x 2**z tiles. Tiles are kept for every
+# zoom up to MAX_TILE_ZOOM, and each one is a CELL_GRID x CELL_GRID grid of
+# cells, so the finest cells are tiles of zoom MAX_TILE_ZOOM + CELL_BITS
+# (about 600 m across at the equator).
+MAX_TILE_ZOOM = 12
+CELL_BITS = 4
+CELL_GRID = 1 << CELL_BITS
+
+# Web Mercator does not reach the poles
+MAX_LATITUDE = 85.05112878
+
+# Documents read per batch when rebuilding
+REBUILD_BATCH_SIZE = 1000
+
+
+def point(lat: float, lon: float) -> dict:
+    """GeoJSON point for the 2dsphere index (longitude first)"""
+    return {"type": "Point", "coordinates": [lon, lat]}
+
+
+def tile_id(z: int, x: int, y: int) -> str:
+    return f"{z}/{x}/{y}"
+
+
+def _cell_coordinates(lat: float, lon: float) -> Tuple[int, int]:
+    """x, y of the finest cell containing a position"""
+    n = 1 << (MAX_TILE_ZOOM + CELL_BITS)
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_cells(lat: float, lon: float) -> List[Tuple[int, int, int, int]]:
+    """(z, x, y, cell index) of a position for every tile zoom"""
+    cell_x, cell_y = _cell_coordinates(lat, lon)
+    cells = []
+    for z in range(MAX_TILE_ZOOM + 1):
+        # Cells of tile z are the tiles of zoom z + CELL_BITS
+        shift = MAX_TILE_ZOOM - z
+        x, y = cell_x >> shift, cell_y >> shift
+        cells.append((z, x >> CELL_BITS, y >> CELL_BITS, (y % CELL_GRID) * CELL_GRID + x % CELL_GRID))
+    return cells
+
+
+def _increments(catches, habitat_of) -> Dict[Tuple[int, int, int], Dict[str, int]]:
+    """(z, x, y) -> $inc fields for the catches that carry a position"""
+    increments = {}
+    for catch in catches:
+        if not catch.get("geo"):
+            continue
+        lon, lat = catch["geo"]["coordinates"]
+        habitat = habitat_of(catch["fish_id"])
+        for z, x, y, cell in tile_cells(lat, lon):
+            inc = increments.setdefault((z, x, y), {})
+            fields = ["total", f"cells.{cell}"]
+            if habitat:
+                fields += [f"by_habitat.{habitat}", f"habitat_cells.{habitat}.{cell}"]
+            for field in fields:
+                inc[field] = inc.get(field, 0) + 1
+    return increments
+
+
+async def record_catches(db, catches: List[dict], habitat_of):
+    """Add catches with a geo point to the heatmap tiles of every zoom.
+
+    habitat_of maps a fish_id to its habitat (or None). Catches without a
+    position are skipped; the rest go out in one unordered bulk write.
+    """
+    increments = _increments(catches, habitat_of)
+    if not increments:
+        return
+    await db.catch_tiles.bulk_write([
+        UpdateOne(
+            {"_id": tile_id(z, x, y)},
+            {"$inc": inc, "$setOnInsert": {"z": z, "x": x, "y": y}},
+            upsert=True,
+        )
+        for (z, x, y), inc in increments.items()
+    ], ordered=False)
+
+
+async def rebuild(db) -> int:
+    """Recompute every heatmap tile from the catches that have a position.
+
+    Like rollups.rebuild(), increments that land while this runs may be
+    lost. Returns the number of catches counted.
+    """
+    habitat_of = {}
+    async for fish in db.fish.find({}, {"habitat": 1}):
+        habitat_of[fish["_id"]] = fish.get("habitat")
+
+    totals: Dict[Tuple[int, int, int], Dict[str, int]] = {}
+    counted = 0
+    cursor = db.user_catches.find(
+        {"geo": {"$exists": True}}, {"fish_id": 1, "geo": 1}, batch_size=REBUILD_BATCH_SIZE
+    )
+    while True:
+        batch = await cursor.to_list(REBUILD_BATCH_SIZE)
+        if not batch:
+            break
+        for key, inc in _increments(batch, habitat_of.get).items():
+            merged = totals.setdefault(key, {})
+            for field, count in inc.items():
+                merged[field] = merged.get(field, 0) + count
+        counted += len(batch)
+
+    documents = []
+    for (z, x, y), inc in totals.items():
+        document = {"_id": tile_id(z, x, y), "z": z, "x": x, "y": y, "total": inc.get("total", 0),
+                    "by_habitat": {}, "cells": {}, "habitat_cells": {}}
+        for field, count in inc.items():
+            parts = field.split(".")
+            if len(parts) == 2:
+                document[parts[0]][parts[1]] = count
+            elif len(parts) == 3:
+                document[parts[0]].setdefault(parts[1], {})[parts[2]] = count
+        documents.append(document)
+
+    await db.catch_tiles.delete_many({})
+    for start in range(0, len(documents), REBUILD_BATCH_SIZE):
+        await db.catch_tiles.insert_many(documents[start:start + REBUILD_BATCH_SIZE])
+    return counted
+
+
+async def heatmap_tile(db, z: int, x: int, y: int, habitat: Optional[str]) -> dict:
+    """Catch counts per cell of one tile: a single _id lookup"""
+    if habitat and habitat not in HABITATS:
+        # The habitat becomes a projection key, so only known ones get that far
+        raise ValueError(f"Unknown habitat {habitat!r}")
+    if habitat:
+        projection = {f"by_habitat.{habitat}": 1, f"habitat_cells.{habitat}": 1}
+    else:
+        projection = {"total": 1, "cells": 1}
+    document = await db.catch_tiles.find_one({"_id": tile_id(z, x, y)}, projection) or {}
+    if habitat:
+        total = document.get("by_habitat", {}).get(habitat, 0)
+        counts = document.get("habitat_cells", {}).get(habitat, {})
+    else:
+        total = document.get("total", 0)
+        counts = document.get("cells", {})
+    cells = []
+    for index, count in sorted(counts.items(), key=lambda item: int(item[0])):
+        row, column = divmod(int(index), CELL_GRID)
+        cells.append([column, row, count])
+    return {"z": z, "x": x, "y": y, "habitat": habitat, "grid": CELL_GRID, "total": total, "cells": cells}
+
+
+# What a nearby catch shows to anyone asking: not whose catch it is, and
+# not its photo
+NEARBY_FIELDS = ("fish_id", "geo", "date", "distance_m")
+
+
+def nearby_pipeline(lat: float, lon: float, radius_m: float, fish_id: Optional[str], limit: int) -> list:
+    """Catches within radius_m of a position, nearest first, with their distance"""
+    near = {
+        "near": point(lat, lon),
+        "key": "geo",
+        "distanceField": "distance_m",
+        "maxDistance": radius_m,
+        "spherical": True,
+    }
+    if fish_id:
+        near["query"] = {"fish_id": fish_id}
+    return [{"$geoNear": near}, {"$limit": limit}, {"$project": {"_id": 0, **{field: 1 for field in NEARBY_FIELDS}}}]
+
+
+async def nearby(db, lat: float, lon: float, radius_m: float, fish_id: Optional[str], limit: int) -> List[dict]:
+    return await db.user_catches.aggregate(nearby_pipeline(lat, lon, radius_m, fish_id, limit)).to_list(limit)
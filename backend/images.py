@@ -0,0 +1,93 @@
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Longest side, in pixels, of each rendered variant
+VARIANT_SIZES = (128, 512, 1024)
+
+# URL suffix -> (Pillow format, media type, save options)
+VARIANT_FORMATS: Dict[str, Tuple[str, str, dict]] = {
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "jpg": ("JPEG", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+# Refuse to decode anything larger; guards against decompression bombs
+MAX_PIXELS = 50_000_000
+
+
+class UnsupportedImage(Exception):
+    pass
+
+
+def variant_name(size: int, fmt: str) -> str:
+    return f"{size}.{fmt}"
+
+
+def parse_variant(name: str) -> Tuple[int, str]:
+    """Split e.g. '512.webp' into (512, 'webp'); ValueError if it is not a known variant"""
+    size, _, fmt = name.partition(".")
+    if not size.isdigit() or int(size) not in VARIANT_SIZES or fmt not in VARIANT_FORMATS:
+        raise ValueError(f"Unknown variant {name}")
+    return int(size), fmt
+
+
+def render_variants(source: str, target_dir: str) -> List[str]:
+    """Decode an image once and write every missing size/format variant.
+
+    Runs in a worker process, so it only takes and returns plain values.
+    Files are written under a temporary name and renamed into place, so a
+    variant path either does not exist or holds a complete image.
+    """
+    target = Path(target_dir)
+    missing = [
+        (size, fmt) for size in VARIANT_SIZES for fmt in VARIANT_FORMATS
+        if not (target / variant_name(size, fmt)).is_file()
+    ]
+    if not missing:
+        return []
+
+    Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+    try:
+        with Image.open(source) as original:
+            # Phone photos are often stored sideways with an EXIF rotation
+            image = ImageOps.exif_transpose(original)
+            image = image.convert("RGB")
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise UnsupportedImage(f"Cannot decode image: {e}")
+
+    target.mkdir(parents=True, exist_ok=True)
+    written = []
+    # Largest first, so each smaller size is resampled from the previous one
+    for size in sorted({size for size, _ in missing}, reverse=True):
+        if max(image.size) > size:
+            image = image.copy()
+            image.thumbnail((size, size), Image.LANCZOS)
+        for fmt in VARIANT_FORMATS:
+            if (size, fmt) not in missing:
+                continue
+            pil_format, _, options = VARIANT_FORMATS[fmt]
+            fd, tmp_path = tempfile.mkstemp(dir=target, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    image.save(f, pil_format, **options)
+                os.replace(tmp_path, target / variant_name(size, fmt))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            written.append(variant_name(size, fmt))
+    return written
+
+
+def render_job(payload: dict) -> List[str]:
+    """Job handler: render the variants of one stored photo.
+
+    Blobs that are not decodable images simply get no variants; retrying
+    would not change that.
+    """
+    try:
+        return render_variants(payload["source"], payload["target"])
+    except UnsupportedImage:
+        return []
@@ -0,0 +1,163 @@
+import csv
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Union
+
+import orjson
+from pymongo import UpdateOne
+
+import changelog
+import stats
+
+# Species fields an import file provides; ids, ordinals and unlock state are
+# owned by the server
+CATALOG_FIELDS = ("name", "scientificName", "habitat", "description", "referenceImage")
+
+# uuid5 namespace for species ids, so a species gets the same _id in every
+# database it is seeded or imported into
+SPECIES_NAMESPACE = uuid.UUID("5f0c7a52-3b9e-4d61-9a8e-2c4f1d7b6e30")
+
+# Invalid records reported in detail; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+
+@dataclass
+class ImportReport:
+    read: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    invalid: int = 0
+    errors: List[Tuple[int, str]] = field(default_factory=list)
+
+    def add_error(self, line: int, message: str):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def species_id(scientific_name: str) -> str:
+    return str(uuid.uuid5(SPECIES_NAMESPACE, scientific_name))
+
+
+def read_records(path: Path, fmt: Optional[str] = None) -> Iterator[Tuple[int, Union[dict, ValueError]]]:
+    """Stream (line number, record) pairs from a JSON Lines or CSV file.
+
+    The format follows the file extension unless given. Lines that are not
+    valid JSON come through as a ValueError in place of the record.
+    """
+    fmt = fmt or ("csv" if path.suffix.lower() == ".csv" else "jsonl")
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            # Line 1 is the header
+            for line, row in enumerate(csv.DictReader(f), start=2):
+                yield line, row
+            return
+        for line, text in enumerate(f, start=1):
+            if not text.strip():
+                continue
+            try:
+                record = orjson.loads(text)
+            except orjson.JSONDecodeError as e:
+                yield line, ValueError(f"Invalid JSON: {e}")
+                continue
+            if not isinstance(record, dict):
+                yield line, ValueError("Expected a JSON object")
+                continue
+            yield line, record
+
+
+async def import_species(
+    db,
+    records: Iterable[Tuple[int, Union[dict, ValueError]]],
+    validate: Callable[[dict], dict],
+    chunk_size: int = 1000,
+    on_progress: Optional[Callable[[ImportReport], None]] = None,
+) -> ImportReport:
+    """Upsert species into the catalog in chunks, keyed on scientificName.
+
+    validate() turns a raw record into the CATALOG_FIELDS of a species or
+    raises ValueError. New species get an _id derived from their scientific
+    name; species that already exist keep their _id and ordinal and are
+    only rewritten when a field changed. Each chunk that writes anything
+    gets its own catalog revision, so running servers and delta-syncing
+    clients pick the changes up as the import goes.
+    """
+    report = ImportReport()
+    chunk = {}
+    for line, record in records:
+        report.read += 1
+        try:
+            if isinstance(record, ValueError):
+                raise record
+            species = validate(record)
+            if species["habitat"] not in stats.HABITATS:
+                raise ValueError(f"Unknown habitat {species['habitat']!r}")
+        except ValueError as e:
+            report.add_error(line, str(e).replace("\n", " "))
+            continue
+        # A later record for the same species replaces an earlier one
+        chunk[species["scientificName"]] = species
+        if len(chunk) >= chunk_size:
+            await _import_chunk(db, chunk, report)
+            chunk = {}
+            if on_progress:
+                on_progress(report)
+    if chunk:
+        await _import_chunk(db, chunk, report)
+    if on_progress:
+        on_progress(report)
+    return report
+
+
+async def _import_chunk(db, chunk: dict, report: ImportReport):
+    projection = {name: 1 for name in CATALOG_FIELDS}
+    existing = {
+        fish["scientificName"]: fish
+        async for fish in db.fish.find({"scientificName": {"$in": list(chunk)}}, projection)
+    }
+    new = [species for name, species in chunk.items() if name not in existing]
+    changed = [
+        (existing[name], species) for name, species in chunk.items()
+        if name in existing and any(existing[name].get(f) != species[f] for f in CATALOG_FIELDS)
+    ]
+    report.unchanged += len(chunk) - len(new) - len(changed)
+    if not new and not changed:
+        return
+
+    revision = await changelog.next_revision(db)
+    first_ordinal = await changelog.allocate_ordinals(db, len(new)) if new else 0
+    operations = [
+        # $setOnInsert: if another writer created the species meanwhile, theirs wins
+        UpdateOne(
+            {"scientificName": species["scientificName"]},
+            {"$setOnInsert": {
+                "_id": species_id(species["scientificName"]),
+                **species,
+                "ordinal": first_ordinal + i,
+                "_rev": revision,
+            }},
+            upsert=True,
+        )
+        for i, species in enumerate(new)
+    ]
+    operations += [
+        UpdateOne({"_id": current["_id"]}, {"$set": {**species, "_rev": revision}})
+        for current, species in changed
+    ]
+    result = await db.fish.bulk_write(operations, ordered=False)
+
+    inserted_ids = list(result.upserted_ids.values())
+    await changelog.log_changes(
+        db, revision, upserted=inserted_ids + [current["_id"] for current, _ in changed]
+    )
+    await changelog.commit_revision(db, revision)
+    added = [new[index]["habitat"] for index in result.upserted_ids]
+    moved = [(current["habitat"], species["habitat"]) for current, species in changed
+             if current.get("habitat") != species["habitat"]]
+    await stats.record_species(
+        db, added + [after for _, after in moved], removed=[before for before, _ in moved if before]
+    )
+    report.inserted += len(inserted_ids)
+    report.updated += len(changed)
@@ -0,0 +1,124 @@
+import logging
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, IndexModel
+from pymongo.errors import OperationFailure
+
+from catalog import page_query
+from jobs import JOB_RETENTION_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Every index the API relies on, per collection. apply_indexes() creates them
+# idempotently at startup; add new query shapes here together with an entry
+# in REGISTERED_QUERIES so verify_query_plans() keeps covering them.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "fish": [
+        IndexModel([("habitat", ASCENDING)], name="habitat_1"),
+        # Keyset pagination order for GET /api/fish
+        IndexModel([("name", ASCENDING), ("_id", ASCENDING)], name="name_1__id_1"),
+        IndexModel(
+            [("habitat", ASCENDING), ("name", ASCENDING), ("_id", ASCENDING)],
+            name="habitat_1_name_1__id_1",
+        ),
+        IndexModel([("ordinal", ASCENDING)], name="ordinal_1", unique=True, sparse=True),
+        # Bulk imports upsert species by scientific name
+        IndexModel([("scientificName", ASCENDING)], name="scientificName_1", unique=True),
+    ],
+    "user_catches": [
+        IndexModel([("fish_id", ASCENDING)], name="fish_id_1"),
+        IndexModel([("created_at", DESCENDING)], name="created_at_-1"),
+        IndexModel([("fish_id", ASCENDING), ("created_at", DESCENDING)], name="fish_id_1_created_at_-1"),
+        # Idempotency keys are only set by batch sync; single unlocks omit the
+        # field, and a sparse index leaves those documents out
+        IndexModel([("idempotency_key", ASCENDING)], name="idempotency_key_1", unique=True, sparse=True),
+        # GET /api/catches/nearby, optionally for one fish; catches without a
+        # position are left out of 2dsphere indexes
+        IndexModel([("geo", GEOSPHERE), ("fish_id", ASCENDING)], name="geo_2dsphere_fish_id_1"),
+        # Catches whose catches.created job the sweep has not seen queued yet
+        IndexModel(
+            [("created_at", ASCENDING)],
+            name="created_at_1_pending_job",
+            partialFilterExpression={"pending_job": {"$exists": True}},
+        ),
+    ],
+    "fish_changes": [
+        IndexModel([("rev", ASCENDING)], name="rev_1"),
+    ],
+    "catch_rollups": [
+        IndexModel([("granularity", ASCENDING), ("start", ASCENDING)], name="granularity_1_start_1"),
+    ],
+    "jobs": [
+        # Claiming the next due job, and finding expired leases
+        IndexModel([("status", ASCENDING), ("run_at", ASCENDING)], name="status_1_run_at_1"),
+        # Finished jobs expire; dead ones are kept for inspection
+        IndexModel(
+            [("finished_at", ASCENDING)],
+            name="finished_at_1_ttl",
+            expireAfterSeconds=JOB_RETENTION_SECONDS,
+            partialFilterExpression={"status": "done"},
+        ),
+    ],
+}
+
+_PAGE_SORT = [("name", ASCENDING), ("_id", ASCENDING)]
+
+# (description, collection, filter, sort) for each query the API issues
+# against a collection that can grow large
+REGISTERED_QUERIES: List[Tuple[str, str, dict, list]] = [
+    ("fish: first page", "fish", page_query(None, None), _PAGE_SORT),
+    ("fish: first page by habitat", "fish", page_query("mare", None), _PAGE_SORT),
+    ("fish: next page", "fish", {"$or": [{"name": {"$gt": "M"}}, {"name": "M", "_id": {"$gt": ""}}]}, _PAGE_SORT),
+    ("fish: next page by habitat", "fish",
+     {"habitat": "mare", "$or": [{"name": {"$gt": "M"}}, {"name": "M", "_id": {"$gt": ""}}]}, _PAGE_SORT),
+    ("fish: by scientific name", "fish", {"scientificName": {"$in": [""]}}, []),
+    ("user_catches: by fish", "user_catches", {"fish_id": ""}, [("created_at", DESCENDING)]),
+    ("user_catches: recent", "user_catches", {}, [("created_at", DESCENDING)]),
+    ("user_catches: idempotency key", "user_catches", {"idempotency_key": ""}, []),
+    ("user_catches: nearby", "user_catches",
+     {"geo": {"$nearSphere": {"$geometry": {"type": "Point", "coordinates": [0, 0]}, "$maxDistance": 1000}}}, []),
+    ("user_catches: export", "user_catches", {"_id": {"$gt": ""}}, [("_id", ASCENDING)]),
+    ("user_catches: pending jobs", "user_catches",
+     {"pending_job": {"$exists": True}, "created_at": {"$lt": datetime(2000, 1, 1)}}, []),
+    ("fish_changes: since revision", "fish_changes", {"rev": {"$gt": 0, "$lte": 1}}, [("rev", ASCENDING)]),
+    ("catch_rollups: timeline", "catch_rollups", {"granularity": "day"}, [("start", DESCENDING)]),
+    ("jobs: next due", "jobs", {"status": "pending", "run_at": {"$lte": datetime(2000, 1, 1)}}, [("run_at", ASCENDING)]),
+]
+
+
+async def apply_indexes(db):
+    """Create all registered indexes; existing ones are left untouched"""
+    for collection, models in INDEXES.items():
+        try:
+            await db[collection].create_indexes(models)
+        except OperationFailure as e:
+            # Usually an index with the same name but different options
+            logger.error("Error creating indexes on %s: %s", collection, e)
+
+
+def plan_stages(plan) -> List[str]:
+    """All stage names in an explain() plan tree, classic or SBE"""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(plan_stages(item))
+    return stages
+
+
+async def verify_query_plans(db) -> List[Tuple[str, bool, List[str]]]:
+    """Explain every registered query; a plan is ok when it does no COLLSCAN"""
+    results = []
+    for description, collection, query, sort in REGISTERED_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+        results.append((description, "COLLSCAN" not in stages, stages))
+    return results
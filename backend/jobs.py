@@ -0,0 +1,261 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds completed jobs are kept before the TTL index removes them
+JOB_RETENTION_SECONDS = 7 * 24 * 3600
+
+job_wait = metrics.registry.histogram(
+    "fishdex_job_wait_seconds", "Time jobs spent queued before a worker picked them up", ("job",)
+)
+job_duration = metrics.registry.histogram(
+    "fishdex_job_duration_seconds", "Job run time", ("job",)
+)
+job_outcomes = metrics.registry.counter(
+    "fishdex_jobs_total", "Finished job attempts by outcome (done, retry, dead)", ("job", "outcome")
+)
+
+
+class JobQueue:
+    """Mongo-backed job queue drained by a bounded pool of asyncio workers.
+
+    Jobs are documents in the `jobs` collection, so they survive restarts.
+    A worker claims a job by atomically flipping it to `running` with a
+    lease; jobs whose lease expires (the process died) are put back. Failed
+    attempts are retried with exponential backoff and end up `dead` after
+    max_attempts. Handlers registered with cpu=True must be plain module
+    level functions; they run in a process pool, off the event loop.
+
+    Delivery is at-least-once, so handlers should tolerate being re-run.
+    """
+
+    def __init__(
+        self,
+        get_db: Callable,
+        workers: int = 4,
+        process_workers: int = 2,
+        max_attempts: int = 5,
+        backoff_seconds: float = 1.0,
+        max_backoff_seconds: float = 300.0,
+        lease_seconds: float = 300.0,
+        poll_interval: float = 1.0,
+        insert: Optional[Callable] = None,
+    ):
+        self._get_db = get_db
+        # Inserts new job documents; defaults to a plain insert_one
+        self._insert = insert
+        self.workers = workers
+        self.process_workers = process_workers
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+
+        self._handlers: Dict[str, Tuple[Callable, bool]] = {}
+        self._tasks = []
+        # Futures of idle workers; each enqueued job wakes just one of them
+        self._idle: Deque[asyncio.Future] = deque()
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._running_ids = set()
+
+        # Refreshed by the workers while idle; read by the metrics gauges
+        self.depth = 0
+        self.running = 0
+        metrics.registry.gauge("fishdex_job_queue_depth", "Jobs waiting to run", lambda: self.depth)
+        metrics.registry.gauge("fishdex_jobs_running", "Jobs currently running in this process", lambda: self.running)
+
+    def handler(self, name: str, cpu: bool = False):
+        """Register the function that runs jobs called `name`"""
+        def register(fn):
+            self._handlers[name] = (fn, cpu)
+            return fn
+        return register
+
+    async def enqueue(self, name: str, payload: dict, delay: float = 0, job_id: Optional[str] = None) -> str:
+        """Queue a job and return its id.
+
+        A caller-chosen job_id makes the enqueue idempotent: when a job with
+        that id exists already (done jobs are kept JOB_RETENTION_SECONDS),
+        nothing is added.
+        """
+        now = datetime.utcnow()
+        chosen = job_id is not None
+        job_id = job_id if chosen else str(uuid.uuid4())
+        insert = self._insert or self._get_db().jobs.insert_one
+        try:
+            await insert({
+                "_id": job_id,
+                "name": name,
+                "payload": payload,
+                "status": "pending",
+                "attempts": 0,
+                "run_at": now + timedelta(seconds=delay),
+                "created_at": now,
+            })
+        except DuplicateKeyError:
+            if not chosen:
+                raise
+            return job_id
+        self.depth += 1
+        while self._idle:
+            waiter = self._idle.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+        return job_id
+
+    async def start(self):
+        await self._release_expired_leases()
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        interrupted = list(self._running_ids)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if interrupted:
+            # Hand interrupted jobs back now rather than when their lease expires
+            await self._get_db().jobs.update_many(
+                {"_id": {"$in": interrupted}, "status": "running"},
+                {"$set": {"status": "pending"}},
+            )
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+
+    async def run_in_process(self, fn: Callable, *args):
+        """Run a module-level function in the shared process pool"""
+        if self._process_pool is None:
+            self._process_pool = ProcessPoolExecutor(
+                self.process_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return await asyncio.get_running_loop().run_in_executor(self._process_pool, partial(fn, *args))
+
+    async def summary(self) -> dict:
+        """Job counts by status plus the most recent dead jobs"""
+        db = self._get_db()
+        counts = {
+            group["_id"]: group["n"]
+            async for group in db.jobs.aggregate([{"$group": {"_id": "$status", "n": {"$sum": 1}}}])
+        }
+        dead = await db.jobs.find(
+            {"status": "dead"}, {"payload": 0}
+        ).sort("finished_at", -1).limit(20).to_list(20)
+        return {"counts": counts, "running_here": self.running, "dead": dead}
+
+    async def _release_expired_leases(self):
+        await self._get_db().jobs.update_many(
+            {"status": "running", "locked_until": {"$lt": datetime.utcnow()}},
+            {"$set": {"status": "pending"}},
+        )
+
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.utcnow()
+        return await self._get_db().jobs.find_one_and_update(
+            {"status": "pending", "run_at": {"$lte": now}},
+            {
+                "$set": {
+                    "status": "running",
+                    "started_at": now,
+                    "locked_until": now + timedelta(seconds=self.lease_seconds),
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("run_at", 1)],
+            return_document=True,
+        )
+
+    async def _worker(self):
+        last_maintenance = 0.0
+        while True:
+            try:
+                job = await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Error claiming job: %s", e)
+                job = None
+
+            if job is not None:
+                await self._run(job)
+                continue
+
+            # Idle: refresh the depth gauge, recover stale leases, then sleep
+            if time.monotonic() - last_maintenance >= self.poll_interval:
+                last_maintenance = time.monotonic()
+                try:
+                    await self._release_expired_leases()
+                    self.depth = await self._get_db().jobs.count_documents({"status": "pending"})
+                except Exception as e:
+                    logger.error("Error refreshing job queue state: %s", e)
+            waiter = asyncio.get_running_loop().create_future()
+            self._idle.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                if waiter in self._idle:
+                    self._idle.remove(waiter)
+
+    async def _run(self, job: dict):
+        name = job["name"]
+        db = self._get_db()
+        job_wait.observe((job["started_at"] - job["run_at"]).total_seconds(), name)
+        self.depth = max(0, self.depth - 1)
+        self.running += 1
+        self._running_ids.add(job["_id"])
+        start = time.perf_counter()
+        try:
+            fn, cpu = self._handlers[name]
+            if cpu:
+                await self.run_in_process(fn, job["payload"])
+            else:
+                await fn(job["payload"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if job["attempts"] >= self.max_attempts or name not in self._handlers:
+                await db.jobs.update_one(
+                    {"_id": job["_id"]},
+                    {"$set": {"status": "dead", "error": error, "finished_at": datetime.utcnow()}},
+                )
+                job_outcomes.inc(name, "dead")
+                logger.error("Job %s %s is dead after %d attempts: %s", name, job["_id"], job["attempts"], error)
+            else:
+                backoff = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** (job["attempts"] - 1))
+                await db.jobs.update_one(
+                    {"_id": job["_id"]},
+                    {"$set": {
+                        "status": "pending",
+                        "error": error,
+                        "run_at": datetime.utcnow() + timedelta(seconds=backoff),
+                    }},
+                )
+                job_outcomes.inc(name, "retry")
+        else:
+            await db.jobs.update_one(
+                {"_id": job["_id"]},
+                {"$set": {"status": "done", "finished_at": datetime.utcnow()}},
+            )
+            job_outcomes.inc(name, "done")
+        finally:
+            self.running -= 1
+            self._running_ids.discard(job["_id"])
+            job_duration.observe(time.perf_counter() - start, name)
@@ -0,0 +1,69 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+
+def worker_id() -> str:
+    """Identifies this process as a lease owner, e.g. "web-1:4242:9f2c1a\""""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class Lease:
+    """A named lock in the leases collection that expires unless renewed.
+
+    Holders renew well before ttl_seconds pass, so a lease only changes
+    hands when it is released or its holder died. Acquiring is one upsert:
+    it matches the lease document when it is ours or expired, and when it
+    is held by someone else the upsert collides with the existing _id.
+    """
+
+    def __init__(self, get_db, name: str, owner: str, ttl_seconds: float = 30.0):
+        self._get_db = get_db
+        self.name = name
+        self.owner = owner
+        self.ttl_seconds = ttl_seconds
+
+    async def try_acquire(self) -> bool:
+        """Take the lease, or extend it if it is already ours; False when someone else holds it"""
+        now = datetime.utcnow()
+        try:
+            await self._get_db().leases.update_one(
+                {"_id": self.name, "$or": [{"owner": self.owner}, {"expires_at": {"$lte": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=self.ttl_seconds)}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def release(self):
+        await self._get_db().leases.delete_one({"_id": self.name, "owner": self.owner})
+
+    @asynccontextmanager
+    async def hold(self, poll_interval: float = 0.5):
+        """Wait for the lease, keep renewing it while the block runs, then release it"""
+        while not await self.try_acquire():
+            await asyncio.sleep(poll_interval)
+
+        async def renew():
+            while True:
+                await asyncio.sleep(self.ttl_seconds / 3)
+                try:
+                    await self.try_acquire()
+                except Exception as e:
+                    logger.error("Error renewing lease %s: %s", self.name, e)
+
+        renewer = asyncio.ensure_future(renew())
+        try:
+            yield
+        finally:
+            renewer.cancel()
+            await self.release()
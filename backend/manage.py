@@ -0,0 +1,117 @@
+"""FishDex backend maintenance commands.
+
+Run from the backend directory, e.g. `python manage.py reconcile-stats`.
+"""
+import asyncio
+import time
+from pathlib import Path
+
+import typer
+from pydantic import ValidationError
+
+import geo
+import importer
+import indexes
+import recommend
+import rollups
+import stats
+from server import Fish, db
+
+cli = typer.Typer(help="FishDex backend maintenance commands")
+
+
+@cli.command("reconcile-stats")
+def reconcile_stats():
+    """Rebuild the /api/stats counters from the fish and user_catches collections"""
+    counters = asyncio.run(stats.reconcile(db))
+    typer.echo(
+        f"Stats reconciled: {counters['total_fish']} species, "
+        f"{counters['total_catches']} catches"
+    )
+
+
+@cli.command("rebuild-rollups")
+def rebuild_rollups():
+    """Recompute the daily and monthly catch rollups behind /api/stats/timeline"""
+    counted = asyncio.run(rollups.rebuild(db))
+    typer.echo(f"Rollups rebuilt from {counted} catches")
+
+
+@cli.command("rebuild-heatmap")
+def rebuild_heatmap():
+    """Recompute the heatmap tiles behind /api/catches/heatmap from catches with a position"""
+    counted = asyncio.run(geo.rebuild(db))
+    typer.echo(f"Heatmap tiles rebuilt from {counted} catches")
+
+
+@cli.command("rebuild-recommendations")
+def rebuild_recommendations():
+    """Recompute the co-occurrence and affinity counts behind recommendations"""
+    counted = asyncio.run(recommend.rebuild(db))
+    typer.echo(f"Recommendation counts rebuilt from {counted} catches")
+
+
+@cli.command("import-species")
+def import_species(
+    path: Path = typer.Argument(..., exists=True, dir_okay=False, help="JSON Lines or CSV species file"),
+    fmt: str = typer.Option(None, "--format", help="jsonl or csv (default: from the file extension)"),
+    chunk_size: int = typer.Option(1000, min=1, help="Species upserted per bulk write"),
+):
+    """Upsert species from a file into the catalog, matching existing ones by scientificName"""
+    def validate(record: dict) -> dict:
+        try:
+            fish = Fish.model_validate({name: record.get(name) for name in importer.CATALOG_FIELDS})
+        except ValidationError as e:
+            raise ValueError("; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()))
+        return {name: getattr(fish, name) for name in importer.CATALOG_FIELDS}
+
+    start = time.perf_counter()
+
+    def progress(report: importer.ImportReport):
+        elapsed = time.perf_counter() - start
+        typer.echo(
+            f"{report.read} read, {report.inserted} new, {report.updated} updated, "
+            f"{report.unchanged} unchanged, {report.invalid} invalid "
+            f"({report.read / elapsed if elapsed else 0:.0f} records/s)"
+        )
+
+    async def run():
+        await indexes.apply_indexes(db)
+        return await importer.import_species(
+            db, importer.read_records(path, fmt), validate, chunk_size=chunk_size, on_progress=progress
+        )
+
+    report = asyncio.run(run())
+    for line, message in report.errors:
+        typer.echo(f"line {line}: {message}", err=True)
+    if report.invalid > len(report.errors):
+        typer.echo(f"... and {report.invalid - len(report.errors)} more invalid records", err=True)
+    typer.echo(f"Import finished in {time.perf_counter() - start:.1f}s")
+
+
+@cli.command("ensure-indexes")
+def ensure_indexes():
+    """Create every index in the index registry"""
+    asyncio.run(indexes.apply_indexes(db))
+    typer.echo("Indexes applied")
+
+
+@cli.command("verify-indexes")
+def verify_indexes():
+    """Explain each registered API query and fail if any of them plans a COLLSCAN"""
+    async def run():
+        await indexes.apply_indexes(db)
+        return await indexes.verify_query_plans(db)
+
+    failed = 0
+    for description, ok, stages in asyncio.run(run()):
+        typer.echo(f"{'ok  ' if ok else 'FAIL'} {description}: {' <- '.join(stages)}")
+        if not ok:
+            failed += 1
+    if failed:
+        typer.echo(f"{failed} queries plan a collection scan", err=True)
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,197 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Optional, Tuple
+
+from pymongo import monitoring
+
+# Seconds; chosen to resolve both sub-millisecond cache hits and slow Mongo calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labelvalues, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {value}"
+
+
+class Gauge:
+    """A gauge read from a callback at scrape time, e.g. a queue length"""
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {self.read()}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # labelvalues -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labelvalues, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = _format_labels(self.labelnames, labelvalues, f'le="{bound}"')
+                yield f"{self.name}_bucket{le} {cumulative}"
+            cumulative += series[len(self.buckets)]
+            inf = _format_labels(self.labelnames, labelvalues, 'le="+Inf"')
+            yield f"{self.name}_bucket{inf} {cumulative}"
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield f"{self.name}_count{labels} {cumulative}"
+            yield f"{self.name}_sum{labels} {series[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name, help, read) -> Gauge:
+        return self._register(Gauge(name, help, read))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    "fishdex_http_requests_total", "HTTP requests by route and status", ("method", "route", "status")
+)
+http_latency = registry.histogram(
+    "fishdex_http_request_duration_seconds", "HTTP request latency by route", ("method", "route")
+)
+mongo_latency = registry.histogram(
+    "fishdex_mongo_command_duration_seconds", "MongoDB command latency", ("collection", "command")
+)
+mongo_failures = registry.counter(
+    "fishdex_mongo_command_failures_total", "Failed MongoDB commands", ("collection", "command")
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request counts and latency per route template.
+
+    Routes are labelled with their path template (e.g. /api/fish/{fish_id}),
+    so label cardinality stays bounded; unmatched paths share one label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            label = getattr(route, "path", None) or "unmatched"
+            http_requests.inc(scope["method"], label, str(status))
+            http_latency.observe(time.perf_counter() - start, scope["method"], label)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Times every command the Mongo client sends, by collection and operation.
+
+    pymongo calls listeners from Motor's worker threads; the metrics guard
+    their own state, and the pending map only sees atomic dict operations.
+    """
+
+    def __init__(self):
+        self._pending: Dict[int, Tuple[str, str]] = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        if not isinstance(target, str):
+            # e.g. getMore, whose first value is the cursor id
+            target = event.command.get("collection", "")
+        self._pending[event.request_id] = (target, event.command_name)
+
+    def _finish(self, event) -> Optional[Tuple[str, str]]:
+        labels = self._pending.pop(event.request_id, None)
+        if labels is not None:
+            mongo_latency.observe(event.duration_micros / 1e6, *labels)
+        return labels
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        labels = self._finish(event)
+        if labels is not None:
+            mongo_failures.inc(*labels)
+
+
+mongo_listener = MongoCommandListener()
@@ -0,0 +1,370 @@
+import asyncio
+import hmac
+import itertools
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import orjson
+from pymongo import monitoring
+
+import metrics
+
+FORMATS = ("speedscope", "collapsed")
+
+# Header that asks for a profile of the request; its value must equal the
+# configured token
+PROFILE_HEADER = b"x-debug-profile"
+
+# Requests profiled at the same time; further ones run unprofiled
+MAX_CONCURRENT = 4
+
+# Samples kept per profile, and frames kept per sample
+MAX_SAMPLES = 100_000
+MAX_DEPTH = 256
+
+# Pseudo-frame at the end of a stack whose request was suspended in an
+# await (Mongo, the thread pool, the network) when it was sampled
+WAITING = ("(waiting)", "", 0)
+
+profiles_written = metrics.registry.counter(
+    "fishdex_profiles_total", "Request profiles written", ("trigger",)
+)
+
+_current: ContextVar[Optional["Recording"]] = ContextVar("profiling_recording", default=None)
+
+
+def _frame_key(code) -> Tuple[str, str, int]:
+    return getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno
+
+
+class Recording:
+    """Samples and Mongo commands of one request while it is being profiled"""
+
+    def __init__(self, coro, thread_id: int, method: str, path: str, trigger: str):
+        self.id = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+        self.coro = coro
+        # The request's outermost frame; it is on the loop thread's stack
+        # exactly while this request is running
+        self.root = coro.cr_frame
+        self.thread_id = thread_id
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.started = time.perf_counter()
+        self.started_at = datetime.utcnow()
+        self.finished: Optional[float] = None
+        self.last_sample = self.started
+        self.samples: List[Tuple[Tuple[int, ...], float]] = []
+        self.frames: Dict[Tuple[str, str, int], int] = {}
+        self.commands: List[dict] = []
+        self._pending_commands: Dict[int, dict] = {}
+
+    def _frame_index(self, key: Tuple[str, str, int]) -> int:
+        index = self.frames.get(key)
+        if index is None:
+            index = self.frames[key] = len(self.frames)
+        return index
+
+    def _suspended_stack(self) -> List[Tuple[str, str, int]]:
+        """Where the request is parked: its chain of awaiting coroutines"""
+        stack = []
+        awaitable = self.coro
+        while awaitable is not None and len(stack) < MAX_DEPTH:
+            frame = (getattr(awaitable, "cr_frame", None) or getattr(awaitable, "ag_frame", None)
+                     or getattr(awaitable, "gi_frame", None))
+            if frame is None:
+                break
+            stack.append(_frame_key(frame.f_code))
+            awaitable = (getattr(awaitable, "cr_await", None) or getattr(awaitable, "ag_await", None)
+                         or getattr(awaitable, "gi_yieldfrom", None))
+        stack.append(WAITING)
+        return stack
+
+    def sample(self, frame, now: float):
+        """Record the request's stack (root first), weighted by the time since the last sample"""
+        weight = now - self.last_sample
+        self.last_sample = now
+        if len(self.samples) >= MAX_SAMPLES:
+            return
+        running = []
+        while frame is not None and len(running) < MAX_DEPTH:
+            running.append(_frame_key(frame.f_code))
+            if frame is self.root:
+                stack = running[::-1]
+                break
+            frame = frame.f_back
+        else:
+            stack = self._suspended_stack()
+        self.samples.append((tuple(self._frame_index(key) for key in stack), weight))
+
+    def command_started(self, event):
+        target = event.command.get(event.command_name)
+        if not isinstance(target, str):
+            target = event.command.get("collection", "")
+        self._pending_commands[event.request_id] = {
+            "command": event.command_name,
+            "collection": target,
+            "started_ms": round((time.perf_counter() - self.started) * 1000, 3),
+        }
+
+    def command_finished(self, event, failed: bool):
+        command = self._pending_commands.pop(event.request_id, None)
+        if command is not None:
+            command["duration_ms"] = event.duration_micros / 1000
+            command["failed"] = failed
+            self.commands.append(command)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.finished or time.perf_counter()) - self.started) * 1000
+
+    def metadata(self, status: Optional[int], route: Optional[str], profile_file: str) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": route,
+            "status": status,
+            "trigger": self.trigger,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 3),
+            "samples": len(self.samples),
+            "profile": profile_file,
+            "mongo_commands": self.commands,
+        }
+
+    def to_collapsed(self) -> bytes:
+        """Brendan Gregg's collapsed stacks, one "a;b;c weight" line per stack, weights in microseconds"""
+        names = {index: f"{name} ({Path(file).name}:{line})" if file else name
+                 for (name, file, line), index in self.frames.items()}
+        totals: Dict[Tuple[int, ...], float] = {}
+        for stack, weight in self.samples:
+            totals[stack] = totals.get(stack, 0.0) + weight
+        return "".join(
+            ";".join(names[index] for index in stack) + f" {max(1, round(weight * 1e6))}\n"
+            for stack, weight in totals.items()
+        ).encode("utf-8")
+
+    def to_speedscope(self, name: str) -> bytes:
+        """A sampled profile in speedscope's file format, weights in milliseconds"""
+        frames = [None] * len(self.frames)
+        for (frame_name, file, line), index in self.frames.items():
+            frames[index] = {"name": frame_name, "file": file, "line": line} if file else {"name": frame_name}
+        weights = [weight * 1000 for _, weight in self.samples]
+        return orjson.dumps({
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "exporter": "fishdex",
+            "name": name,
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": [list(stack) for stack, _ in self.samples],
+                "weights": weights,
+            }],
+        })
+
+
+class Profiler:
+    """Sampling profiler for individual requests.
+
+    A daemon thread wakes every `interval` seconds while at least one
+    request is being profiled and reads the event loop thread's stack with
+    sys._current_frames(). A sample belongs to a request when the request's
+    outermost frame is on that stack; otherwise the request is suspended,
+    and its chain of awaiting coroutines is recorded under "(waiting)". So
+    concurrent requests on the same loop are told apart, and time spent
+    waiting on Mongo shows up in the flame graph next to CPU time.
+
+    While anything is being profiled the interpreter's switch interval is
+    lowered to the sampling interval; otherwise a busy loop thread would
+    keep the GIL for 5 ms at a time and short requests would get no samples.
+    """
+
+    def __init__(self, directory: Path, interval: float = 0.001, fmt: str = "speedscope", max_profiles: int = 200):
+        if fmt not in FORMATS:
+            raise ValueError(f"Profile format must be one of {', '.join(FORMATS)}")
+        self.directory = directory
+        self.interval = interval
+        self.fmt = fmt
+        self.max_profiles = max_profiles
+        self._active: Dict[str, Recording] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._switch_interval: Optional[float] = None
+
+    def start(self, coro, method: str, path: str, trigger: str) -> Optional[Recording]:
+        """Start sampling a request coroutine that has not run yet; None when too many are active"""
+        recording = Recording(coro, threading.get_ident(), method, path, trigger)
+        with self._lock:
+            if len(self._active) >= MAX_CONCURRENT:
+                return None
+            self._active[recording.id] = recording
+            if self._thread is None:
+                self._switch_interval = sys.getswitchinterval()
+                sys.setswitchinterval(min(self.interval, self._switch_interval))
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+        return recording
+
+    def stop(self, recording: Recording):
+        recording.finished = time.perf_counter()
+        with self._lock:
+            self._active.pop(recording.id, None)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                recordings = list(self._active.values())
+                if not recordings:
+                    sys.setswitchinterval(self._switch_interval)
+                    self._thread = None
+                    return
+            frames = sys._current_frames()
+            now = time.perf_counter()
+            for recording in recordings:
+                if recording.finished is None:
+                    recording.sample(frames.get(recording.thread_id), now)
+            del frames
+            time.sleep(self.interval)
+
+    def write(self, recording: Recording, status: Optional[int], route: Optional[str]):
+        """Write the profile and its metadata, then drop the oldest profiles beyond max_profiles"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = f"{recording.method} {route or recording.path}"
+        if self.fmt == "collapsed":
+            profile_file = f"{recording.id}.collapsed.txt"
+            body = recording.to_collapsed()
+        else:
+            profile_file = f"{recording.id}.speedscope.json"
+            body = recording.to_speedscope(name)
+        (self.directory / profile_file).write_bytes(body)
+        (self.directory / f"{recording.id}.json").write_bytes(
+            orjson.dumps(recording.metadata(status, route, profile_file))
+        )
+        profiles_written.inc(recording.trigger)
+
+        metadata_files = self._metadata_files()
+        for path in metadata_files[:max(len(metadata_files) - self.max_profiles, 0)]:
+            for stale in self.directory.glob(f"{path.stem}.*"):
+                stale.unlink(missing_ok=True)
+
+    def _metadata_files(self) -> List[Path]:
+        """<id>.json of every stored profile, oldest first (ids start with a timestamp)"""
+        if not self.directory.is_dir():
+            return []
+        return sorted(path for path in self.directory.glob("*.json") if path.name.count(".") == 1)
+
+    def list_profiles(self) -> List[dict]:
+        """Metadata of the stored profiles, newest first"""
+        profiles = []
+        for path in reversed(self._metadata_files()):
+            try:
+                metadata = orjson.loads(path.read_bytes())
+            except (OSError, orjson.JSONDecodeError):
+                continue
+            metadata["mongo_commands"] = len(metadata.get("mongo_commands", []))
+            profiles.append(metadata)
+        return profiles
+
+    def profile_path(self, filename: str) -> Optional[Path]:
+        """Path of a stored profile file, or None for unknown names (no traversal)"""
+        path = self.directory / filename
+        if path.name != filename or not path.is_file():
+            return None
+        return path
+
+
+class ProfilingMiddleware:
+    """Profile requests that carry X-Debug-Profile: <token>, and 1 in every `sample_every` others.
+
+    Only added to the app when profiling is configured, so it costs nothing
+    otherwise. Profiled responses carry an X-Profile-Id header naming the
+    files written to the profile directory.
+    """
+
+    def __init__(self, app, profiler: Profiler, token: str = "", sample_every: int = 0):
+        self.app = app
+        self.profiler = profiler
+        self.token = token.encode("latin-1")
+        self.sample_every = sample_every
+        self._requests = itertools.count(1)
+
+    def _trigger(self, scope) -> Optional[str]:
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER:
+                    return "header" if hmac.compare_digest(value, self.token) else None
+        if self.sample_every and next(self._requests) % self.sample_every == 0:
+            return "sample"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        trigger = self._trigger(scope) if scope["type"] == "http" else None
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = None
+        recording: Optional[Recording] = None
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if recording is not None:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-profile-id", recording.id.encode("ascii")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        coro = self.app(scope, receive, send_wrapper)
+        recording = self.profiler.start(coro, scope["method"], scope["path"], trigger)
+        if recording is None:
+            await coro
+            return
+        token = _current.set(recording)
+        try:
+            await coro
+        finally:
+            _current.reset(token)
+            self.profiler.stop(recording)
+            route = getattr(scope.get("route"), "path", None)
+            # The response has been sent; the client does not wait for this
+            await asyncio.to_thread(self.profiler.write, recording, status, route)
+
+
+class MongoCommandTracer(monitoring.CommandListener):
+    """Adds the Mongo commands a profiled request sends to its profile.
+
+    Motor runs commands in worker threads with a copy of the caller's
+    context, so the recording is found through a context variable.
+    """
+
+    def started(self, event):
+        recording = _current.get()
+        if recording is not None:
+            recording.command_started(event)
+
+    def succeeded(self, event):
+        recording = _current.get()
+        if recording is not None:
+            recording.command_finished(event, failed=False)
+
+    def failed(self, event):
+        recording = _current.get()
+        if recording is not None:
+            recording.command_finished(event, failed=True)
+
+
+mongo_tracer = MongoCommandTracer()
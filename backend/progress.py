@@ -0,0 +1,74 @@
+import base64
+from datetime import datetime
+from typing import Optional
+
+from bson import Binary
+from pymongo.errors import DuplicateKeyError
+
+# Attempts at the compare-and-swap before giving up on a contended document
+MAX_RETRIES = 10
+
+
+def test_bit(bitmap: bytes, ordinal: int) -> bool:
+    byte, bit = divmod(ordinal, 8)
+    return byte < len(bitmap) and bool(bitmap[byte] & (1 << bit))
+
+
+def set_bit(bitmap: bytes, ordinal: int) -> bytes:
+    byte, bit = divmod(ordinal, 8)
+    grown = bytearray(bitmap)
+    if byte >= len(grown):
+        grown.extend(b"\x00" * (byte + 1 - len(grown)))
+    grown[byte] |= 1 << bit
+    return bytes(grown)
+
+
+async def mark_unlocked(db, user_id: str, ordinal: int, habitat: Optional[str]) -> bool:
+    """Set a species' bit in the user's progress bitmap; False if it was already set.
+
+    The bitmap is updated with a compare-and-swap on a version field, so the
+    bit and the counters always change together. Only one user writes to a
+    document, so retries are rare.
+    """
+    for _ in range(MAX_RETRIES):
+        now = datetime.utcnow()
+        progress = await db.user_progress.find_one({"_id": user_id})
+        if progress is None:
+            try:
+                await db.user_progress.insert_one({
+                    "_id": user_id,
+                    "bitmap": Binary(set_bit(b"", ordinal)),
+                    "unlocked": 1,
+                    "by_habitat": {habitat: 1} if habitat else {},
+                    "v": 1,
+                    "updated_at": now,
+                })
+                return True
+            except DuplicateKeyError:
+                continue
+
+        bitmap = bytes(progress["bitmap"])
+        if test_bit(bitmap, ordinal):
+            return False
+        inc = {"v": 1, "unlocked": 1}
+        if habitat:
+            inc[f"by_habitat.{habitat}"] = 1
+        result = await db.user_progress.update_one(
+            {"_id": user_id, "v": progress["v"]},
+            {"$set": {"bitmap": Binary(set_bit(bitmap, ordinal)), "updated_at": now}, "$inc": inc},
+        )
+        if result.modified_count:
+            return True
+    raise RuntimeError(f"Progress for user {user_id} is too contended to update")
+
+
+async def get_progress(db, user_id: str) -> dict:
+    """Progress bitmap (base64, bit n = catalog ordinal n) and unlock counts"""
+    progress = await db.user_progress.find_one({"_id": user_id}) or {}
+    return {
+        "user_id": user_id,
+        "bitmap": base64.b64encode(bytes(progress.get("bitmap", b""))).decode("ascii"),
+        "unlocked": progress.get("unlocked", 0),
+        "by_habitat": progress.get("by_habitat", {}),
+        "updated_at": progress.get("updated_at"),
+    }
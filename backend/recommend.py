@@ -0,0 +1,321 @@
+import math
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from pymongo import UpdateOne
+
+from search import normalize
+
+# Persisted counts, one species_affinity document per catalog ordinal:
+#   catchers           users who caught the species
+#   pairs.<ordinal>    users who caught both species
+#   features.<key>     catches made with an equipment / at a location
+# They are updated on every unlock and only read when a worker rebuilds its
+# in-memory AffinityMatrix.
+META_ID = "affinity"
+
+# Related species kept per species in the in-memory matrix
+RELATED_LIMIT = 50
+
+# Share of the score coming from shared catchers vs. shared equipment and
+# locations
+COOCCURRENCE_WEIGHT = 1.0
+FEATURE_WEIGHT = 0.5
+
+# Only the species most associated with a feature are paired through it, so
+# a feature every species shares (e.g. "canna") does not create n^2 pairs
+MAX_FEATURE_SPECIES = 100
+
+# Longest equipment / location text used as a feature key
+MAX_FEATURE_LENGTH = 64
+
+# Catches read per batch when rebuilding, and pair keys buffered before
+# they are merged
+REBUILD_BATCH_SIZE = 1000
+PAIR_BUFFER = 1_000_000
+
+
+def feature_keys(catch: dict) -> List[str]:
+    """Normalised equipment and location of a catch, e.g. "e:canna da spinning"."""
+    keys = []
+    for field, prefix in (("equipment", "e"), ("location", "l")):
+        text = " ".join(normalize(catch.get(field) or "").split())[:MAX_FEATURE_LENGTH]
+        if text:
+            keys.append(f"{prefix}:{text}")
+    return keys
+
+
+def unpack_ordinals(bitmap: bytes) -> np.ndarray:
+    """Ordinals whose bit is set in a progress bitmap"""
+    return np.flatnonzero(np.unpackbits(np.frombuffer(bitmap, dtype=np.uint8), bitorder="little"))
+
+
+async def current_version(db) -> Optional[int]:
+    """Version of the affinity counts; None until they were first built"""
+    meta = await db.recommend_meta.find_one({"_id": META_ID})
+    if meta is None or "built_at" not in meta:
+        return None
+    return meta.get("version", 0)
+
+
+async def record_catches(db, catches: List[dict], ordinal_of, unlocked: Dict[str, Set[int]]):
+    """Add new catches to the affinity counts.
+
+    ordinal_of maps a fish_id to its catalog ordinal (or None). unlocked
+    holds, per user, the ordinals these catches unlocked for the first time;
+    they are paired with everything else in the user's progress bitmap.
+    """
+    increments: Dict[int, Dict[str, int]] = {}
+
+    def add(ordinal: int, field: str):
+        inc = increments.setdefault(ordinal, {})
+        inc[field] = inc.get(field, 0) + 1
+
+    for catch in catches:
+        ordinal = ordinal_of(catch["fish_id"])
+        if ordinal is not None:
+            for key in feature_keys(catch):
+                add(ordinal, f"features.{key}")
+
+    for user_id, new in unlocked.items():
+        progress = await db.user_progress.find_one({"_id": user_id}, {"bitmap": 1})
+        caught = set(unpack_ordinals(bytes(progress["bitmap"])).tolist()) if progress else set()
+        caught |= new
+        for ordinal in new:
+            add(ordinal, "catchers")
+            for other in caught:
+                if other != ordinal:
+                    add(ordinal, f"pairs.{other}")
+                    if other not in new:
+                        # Pairs between two new species are counted from both sides above
+                        add(other, f"pairs.{ordinal}")
+
+    if not increments:
+        return
+    await db.species_affinity.bulk_write(
+        [UpdateOne({"_id": ordinal}, {"$inc": inc}, upsert=True) for ordinal, inc in increments.items()],
+        ordered=False,
+    )
+    await db.recommend_meta.update_one({"_id": META_ID}, {"$inc": {"version": 1}}, upsert=True)
+
+
+def _merge_pairs(keys: np.ndarray, counts: np.ndarray, new_keys: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Sum duplicate pair keys into (sorted unique keys, counts)"""
+    keys = np.concatenate([keys] + new_keys)
+    counts = np.concatenate([counts] + [np.ones(len(k), dtype=np.int64) for k in new_keys])
+    keys, inverse = np.unique(keys, return_inverse=True)
+    return keys, np.bincount(inverse, weights=counts).astype(np.int64)
+
+
+async def rebuild(db) -> int:
+    """Recompute every affinity count from user_catches; returns the number of catches.
+
+    Catches are streamed in batches. Co-occurrence pairs are encoded as
+    a * size + b and summed with numpy, so memory follows the number of
+    distinct pairs rather than the number of catches. Like the rollups,
+    counts that land while this runs may be lost.
+    """
+    ordinal_of = {}
+    async for fish in db.fish.find({"ordinal": {"$ne": None}}, {"ordinal": 1}):
+        ordinal_of[fish["_id"]] = fish["ordinal"]
+    size = max(ordinal_of.values(), default=-1) + 1
+
+    users: Dict[str, Set[int]] = {}
+    features: Dict[int, Dict[str, int]] = {}
+    counted = 0
+    cursor = db.user_catches.find(
+        {}, {"user_id": 1, "fish_id": 1, "equipment": 1, "location": 1}, batch_size=REBUILD_BATCH_SIZE
+    )
+    while True:
+        batch = await cursor.to_list(REBUILD_BATCH_SIZE)
+        if not batch:
+            break
+        for catch in batch:
+            ordinal = ordinal_of.get(catch.get("fish_id"))
+            if ordinal is None:
+                continue
+            counts = features.setdefault(ordinal, {})
+            for key in feature_keys(catch):
+                counts[key] = counts.get(key, 0) + 1
+            if catch.get("user_id"):
+                users.setdefault(catch["user_id"], set()).add(ordinal)
+        counted += len(batch)
+
+    catchers = np.zeros(size, dtype=np.int64)
+    pair_keys = np.zeros(0, dtype=np.int64)
+    pair_counts = np.zeros(0, dtype=np.int64)
+    buffered, buffered_size = [], 0
+    for caught in users.values():
+        ordinals = np.fromiter(caught, dtype=np.int64, count=len(caught))
+        catchers[ordinals] += 1
+        if len(ordinals) < 2:
+            continue
+        a, b = np.meshgrid(ordinals, ordinals, indexing="ij")
+        off_diagonal = a != b
+        buffered.append(a[off_diagonal] * size + b[off_diagonal])
+        buffered_size += len(buffered[-1])
+        if buffered_size >= PAIR_BUFFER:
+            pair_keys, pair_counts = _merge_pairs(pair_keys, pair_counts, buffered)
+            buffered, buffered_size = [], 0
+    if buffered:
+        pair_keys, pair_counts = _merge_pairs(pair_keys, pair_counts, buffered)
+
+    documents = {ordinal: {"_id": ordinal, "catchers": int(catchers[ordinal]), "pairs": {}, "features": counts}
+                 for ordinal, counts in features.items()}
+    for key, count in zip(pair_keys.tolist(), pair_counts.tolist()):
+        a, b = divmod(key, size)
+        documents[a]["pairs"][str(b)] = count
+
+    await db.species_affinity.delete_many({})
+    documents = list(documents.values())
+    for start in range(0, len(documents), REBUILD_BATCH_SIZE):
+        await db.species_affinity.insert_many(documents[start:start + REBUILD_BATCH_SIZE])
+    await db.recommend_meta.update_one(
+        {"_id": META_ID}, {"$set": {"built_at": datetime.utcnow()}, "$inc": {"version": 1}}, upsert=True
+    )
+    return counted
+
+
+def _feature_pairs(postings: Dict[str, List[Tuple[int, float]]], species: int):
+    """Cosine similarity of species over their (idf-weighted) feature counts, as COO arrays"""
+    weights = {}
+    for key, posting in postings.items():
+        idf = math.log(1 + species / len(posting))
+        weights[key] = [(ordinal, count * idf) for ordinal, count in posting]
+    norms: Dict[int, float] = {}
+    for posting in weights.values():
+        for ordinal, weight in posting:
+            norms[ordinal] = norms.get(ordinal, 0.0) + weight * weight
+
+    rows, cols, values = [], [], []
+    for posting in weights.values():
+        if len(posting) < 2:
+            continue
+        posting = sorted(posting, key=lambda item: -item[1])[:MAX_FEATURE_SPECIES]
+        ordinals = np.array([ordinal for ordinal, _ in posting], dtype=np.int64)
+        weight = np.array([w / math.sqrt(norms[ordinal]) for ordinal, w in posting])
+        a, b = np.meshgrid(np.arange(len(ordinals)), np.arange(len(ordinals)), indexing="ij")
+        off_diagonal = a != b
+        rows.append(ordinals[a[off_diagonal]])
+        cols.append(ordinals[b[off_diagonal]])
+        values.append(weight[a[off_diagonal]] * weight[b[off_diagonal]])
+    return rows, cols, values
+
+
+class AffinityMatrix:
+    """Top related species per catalog ordinal, as CSR arrays.
+
+    The score of a pair is the cosine similarity of the two species over
+    their catchers plus, weighted by FEATURE_WEIGHT, over the equipment and
+    locations they were caught with. Only the best RELATED_LIMIT entries per
+    row are kept, so related() is a slice and recommend() a bincount over
+    the rows of the species a user already caught.
+    """
+
+    def __init__(self, version, data: Tuple[List[dict], List[dict]]):
+        fish, documents = data
+        self.version = version
+        self.checked_at = time.monotonic()
+
+        ordinals = [item for item in fish if item.get("ordinal") is not None]
+        size = max((item["ordinal"] for item in ordinals), default=-1) + 1
+        self.size = size
+        self.fish: List[Optional[dict]] = [None] * size
+        for item in ordinals:
+            self.fish[item["ordinal"]] = item
+        self.present = np.array([item is not None for item in self.fish], dtype=bool)
+        habitats = np.array([item["habitat"] if item else "" for item in self.fish], dtype=object)
+        self.habitat_masks = {habitat: habitats == habitat for habitat in set(habitats.tolist()) if habitat}
+
+        rows, cols, values = [], [], []
+        postings: Dict[str, List[Tuple[int, float]]] = {}
+        catchers = np.zeros(size, dtype=np.float64)
+        for document in documents:
+            ordinal = document["_id"]
+            if not 0 <= ordinal < size:
+                continue
+            catchers[ordinal] = document.get("catchers", 0)
+            for key, count in document.get("features", {}).items():
+                postings.setdefault(key, []).append((ordinal, count))
+        for document in documents:
+            a = document["_id"]
+            if not 0 <= a < size:
+                continue
+            for other, count in document.get("pairs", {}).items():
+                b = int(other)
+                if b < size and b != a and count > 0:
+                    rows.append(a)
+                    cols.append(b)
+                    values.append(count / math.sqrt(max(catchers[a] * catchers[b], 1.0)))
+        # Users who caught each species, for ties and cold starts
+        self.popularity = catchers
+
+        rows = [np.array(rows, dtype=np.int64)]
+        cols = [np.array(cols, dtype=np.int64)]
+        values = [COOCCURRENCE_WEIGHT * np.array(values, dtype=np.float64)]
+        feature_rows, feature_cols, feature_values = _feature_pairs(postings, max(len(documents), 1))
+        rows += feature_rows
+        cols += feature_cols
+        values += [FEATURE_WEIGHT * v for v in feature_values]
+        self._build(np.concatenate(rows), np.concatenate(cols), np.concatenate(values))
+
+    def _build(self, rows: np.ndarray, cols: np.ndarray, values: np.ndarray):
+        size = self.size
+        keys, inverse = np.unique(rows * size + cols, return_inverse=True)
+        scores = np.bincount(inverse, weights=values) if len(keys) else np.zeros(0)
+        rows, cols = keys // max(size, 1), keys % max(size, 1)
+
+        # Best RELATED_LIMIT per row: sort by row, then by descending score
+        order = np.lexsort((-scores, rows))
+        rows, cols, scores = rows[order], cols[order], scores[order]
+        row_starts = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=size))))[:-1]
+        keep = np.arange(len(rows)) - row_starts[rows] < RELATED_LIMIT
+        rows, cols, scores = rows[keep], cols[keep], scores[keep]
+
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=size)))).astype(np.int64)
+        self.indices = cols.astype(np.int32)
+        self.scores = scores.astype(np.float32)
+
+    def related(self, ordinal: int, limit: int) -> List[Tuple[dict, float]]:
+        if not 0 <= ordinal < self.size:
+            return []
+        start, end = self.indptr[ordinal], self.indptr[ordinal + 1]
+        return [
+            (self.fish[other], float(score))
+            for other, score in zip(self.indices[start:end].tolist(), self.scores[start:end].tolist())
+            if self.fish[other] is not None
+        ][:limit]
+
+    def recommend(self, caught: np.ndarray, limit: int, habitat: Optional[str] = None) -> List[Tuple[dict, float]]:
+        """Species the user has not caught yet, by summed affinity to the ones they have.
+
+        Ties (and users with no catches yet) fall back to the most caught
+        species.
+        """
+        caught = caught[caught < self.size]
+        if len(caught):
+            starts, ends = self.indptr[caught], self.indptr[caught + 1]
+            lengths = ends - starts
+            # Positions of every entry in the selected rows
+            offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+            positions = offsets + np.arange(lengths.sum())
+            scores = np.bincount(self.indices[positions], weights=self.scores[positions], minlength=self.size)
+        else:
+            scores = np.zeros(self.size)
+
+        eligible = self.present.copy()
+        eligible[caught] = False
+        if habitat:
+            eligible &= self.habitat_masks.get(habitat, False)
+        candidates = np.flatnonzero(eligible)
+        if not len(candidates):
+            return []
+        if len(candidates) > limit:
+            # Only the candidates scoring at least the limit-th best need sorting
+            kth = len(candidates) - limit
+            threshold = np.partition(scores[candidates], kth)[kth]
+            candidates = candidates[scores[candidates] >= threshold]
+        order = np.lexsort((-self.popularity[candidates], -scores[candidates]))[:limit]
+        return [(self.fish[ordinal], float(scores[ordinal])) for ordinal in candidates[order].tolist()]
@@ -0,0 +1,144 @@
+import os
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+
+# MONGO_URL scheme for the in-process backend (mongomock-motor): no mongod
+# needed, data lives and dies with the process
+MEMORY_SCHEME = "memory://"
+
+
+@dataclass
+class MongoSettings:
+    url: str
+    db_name: str
+    max_pool_size: int = 100
+    min_pool_size: int = 0
+    connect_timeout_ms: int = 10000
+    server_selection_timeout_ms: int = 10000
+    socket_timeout_ms: Optional[int] = None
+    # Read preference for catalog reads, e.g. secondaryPreferred
+    catalog_read_preference: str = "primary"
+
+    @classmethod
+    def from_env(cls) -> "MongoSettings":
+        socket_timeout = os.environ.get('MONGO_SOCKET_TIMEOUT_MS')
+        return cls(
+            url=os.environ.get('MONGO_URL', ''),
+            db_name=os.environ.get('DB_NAME', 'fishdex'),
+            max_pool_size=int(os.environ.get('MONGO_MAX_POOL_SIZE', '100')),
+            min_pool_size=int(os.environ.get('MONGO_MIN_POOL_SIZE', '0')),
+            connect_timeout_ms=int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '10000')),
+            server_selection_timeout_ms=int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '10000')),
+            socket_timeout_ms=int(socket_timeout) if socket_timeout else None,
+            catalog_read_preference=os.environ.get('CATALOG_READ_PREFERENCE', 'primary'),
+        )
+
+    @property
+    def in_memory(self) -> bool:
+        return self.url.startswith(MEMORY_SCHEME)
+
+    def client_options(self) -> dict:
+        return {
+            "maxPoolSize": self.max_pool_size,
+            "minPoolSize": self.min_pool_size,
+            "connectTimeoutMS": self.connect_timeout_ms,
+            "serverSelectionTimeoutMS": self.server_selection_timeout_ms,
+            "socketTimeoutMS": self.socket_timeout_ms,
+        }
+
+
+def memory_client(sync: bool = False):
+    try:
+        if sync:
+            from mongomock import MongoClient
+            return MongoClient()
+        from mongomock_motor import AsyncMongoMockClient
+        return AsyncMongoMockClient()
+    except ImportError:
+        raise RuntimeError(f"{MEMORY_SCHEME} needs the mongomock-motor package")
+
+
+class Repository:
+    """The FishDex database, connected on first use.
+
+    Creating a Repository does no I/O, so importing the app (or a CLI that
+    only needs the models) never touches the network. It stands in for a
+    Motor database: `repository.fish`, `repository["jobs"]` and so on return
+    collections, so data modules keep taking it as their `db` argument.
+    Catalog reads that tolerate replication lag go through `catalog`, which
+    uses the configured read preference.
+    """
+
+    def __init__(self, settings: MongoSettings, event_listeners: Sequence = ()):
+        self.settings = settings
+        self._event_listeners = list(event_listeners)
+        self._client = None
+        self._database = None
+        self._catalog = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            if not self.settings.url:
+                raise RuntimeError(f"MONGO_URL is not set (use {MEMORY_SCHEME} for an in-memory database)")
+            if self.settings.in_memory:
+                self._client = memory_client()
+            else:
+                from motor.motor_asyncio import AsyncIOMotorClient
+                self._client = AsyncIOMotorClient(
+                    self.settings.url,
+                    event_listeners=self._event_listeners,
+                    **self.settings.client_options(),
+                )
+        return self._client
+
+    @property
+    def database(self):
+        if self._database is None:
+            self._database = self.client[self.settings.db_name]
+        return self._database
+
+    @property
+    def catalog(self):
+        """The database with the catalog read preference applied"""
+        if self._catalog is None:
+            if self.settings.in_memory:
+                # No replicas to read from
+                self._catalog = self.database
+            else:
+                mode = read_pref_mode_from_name(self.settings.catalog_read_preference)
+                self._catalog = self.database.with_options(read_preference=make_read_preference(mode, None))
+        return self._catalog
+
+    @asynccontextmanager
+    async def catalog_session(self):
+        """Session for a consistent catalog read: yields None when reads stay on the primary.
+
+        Reads in a causally consistent session never see data older than an
+        earlier read in the same session, so a secondary cannot serve a
+        catalog older than the revision read from the primary just before.
+        """
+        if self.settings.in_memory or self.settings.catalog_read_preference == "primary":
+            yield None
+            return
+        async with await self.client.start_session(causal_consistency=True) as session:
+            yield session
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.database, name)
+
+    def __getitem__(self, name):
+        return self.database[name]
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+            self._database = None
+            self._catalog = None
+
@@ -0,0 +1,165 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+
+from stats import HABITATS
+
+GRANULARITIES = ("day", "month")
+
+# Formats the app has sent in UserCatch.date: the it-IT locale
+# (16/10/2026) and ISO dates
+DATE_FORMATS = ("%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y", "%d.%m.%Y")
+
+# Documents read per batch when rebuilding
+REBUILD_BATCH_SIZE = 1000
+
+
+def parse_catch_date(value: Optional[str]) -> Optional[datetime]:
+    """The day a catch was made, from its free-form date string; None if unparseable"""
+    if not value:
+        return None
+    value = value.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return datetime(parsed.year, parsed.month, parsed.day)
+
+
+def period_start(when: datetime, granularity: str) -> datetime:
+    if granularity == "month":
+        return datetime(when.year, when.month, 1)
+    return datetime(when.year, when.month, when.day)
+
+
+def rollup_id(granularity: str, start: datetime) -> str:
+    return f"{granularity}:{start:%Y-%m}" if granularity == "month" else f"{granularity}:{start:%Y-%m-%d}"
+
+
+def catch_time(catch: dict) -> datetime:
+    """When a catch counts in the timeline: the day it was made, else when it was stored"""
+    return catch.get("caught_at") or catch["created_at"]
+
+
+def _increments(catches: Iterable[dict], habitat_of) -> Dict[tuple, Dict[str, int]]:
+    """(granularity, period start) -> $inc fields for a group of catches"""
+    increments = {}
+    for catch in catches:
+        when = catch_time(catch)
+        habitat = habitat_of(catch["fish_id"])
+        for granularity in GRANULARITIES:
+            inc = increments.setdefault((granularity, period_start(when, granularity)), {})
+            fields = ["total", f"by_fish.{catch['fish_id']}"]
+            if habitat:
+                fields.append(f"by_habitat.{habitat}")
+            for field in fields:
+                inc[field] = inc.get(field, 0) + 1
+    return increments
+
+
+async def record_catches(db, catches: List[dict], habitat_of):
+    """Add catches to their day and month rollups.
+
+    Each catch needs fish_id, created_at and optionally caught_at;
+    habitat_of maps a fish_id to its habitat (or None). All increments go
+    out in one unordered bulk write.
+    """
+    increments = _increments(catches, habitat_of)
+    if not increments:
+        return
+    await db.catch_rollups.bulk_write([
+        UpdateOne(
+            {"_id": rollup_id(granularity, start)},
+            {"$inc": inc, "$setOnInsert": {"granularity": granularity, "start": start}},
+            upsert=True,
+        )
+        for (granularity, start), inc in increments.items()
+    ], ordered=False)
+
+
+async def rebuild(db) -> int:
+    """Recompute every rollup from user_catches, backfilling caught_at on the way.
+
+    Catches are streamed in batches and counted in memory (one counter set
+    per period, not per catch). Increments that land while this runs may be
+    lost, so run it when writes are quiet. Returns the number of catches.
+    """
+    habitat_of = {}
+    async for fish in db.fish.find({}, {"habitat": 1}):
+        habitat_of[fish["_id"]] = fish.get("habitat")
+
+    totals: Dict[tuple, Dict[str, int]] = {}
+    counted = 0
+    cursor = db.user_catches.find(
+        {}, {"fish_id": 1, "date": 1, "caught_at": 1, "created_at": 1}, batch_size=REBUILD_BATCH_SIZE
+    )
+    while True:
+        batch = await cursor.to_list(REBUILD_BATCH_SIZE)
+        if not batch:
+            break
+        backfill = []
+        for catch in batch:
+            if "caught_at" not in catch:
+                catch["caught_at"] = parse_catch_date(catch.get("date"))
+                backfill.append(UpdateOne({"_id": catch["_id"]}, {"$set": {"caught_at": catch["caught_at"]}}))
+        if backfill:
+            await db.user_catches.bulk_write(backfill, ordered=False)
+        for key, inc in _increments(batch, habitat_of.get).items():
+            merged = totals.setdefault(key, {})
+            for field, count in inc.items():
+                merged[field] = merged.get(field, 0) + count
+        counted += len(batch)
+
+    documents = []
+    for (granularity, start), inc in totals.items():
+        document = {"_id": rollup_id(granularity, start), "granularity": granularity, "start": start,
+                    "total": inc.get("total", 0), "by_habitat": {}, "by_fish": {}}
+        for field, count in inc.items():
+            if "." in field:
+                group, key = field.split(".", 1)
+                document[group][key] = count
+        documents.append(document)
+
+    await db.catch_rollups.delete_many({})
+    for start in range(0, len(documents), REBUILD_BATCH_SIZE):
+        await db.catch_rollups.insert_many(documents[start:start + REBUILD_BATCH_SIZE])
+    return counted
+
+
+async def timeline(db, granularity: str, habitat: Optional[str], since: Optional[datetime],
+                   until: Optional[datetime], limit: int) -> List[dict]:
+    """Catch counts per period, oldest first, read straight from the rollups"""
+    if habitat and habitat not in HABITATS:
+        # The habitat becomes a projection key, so only known ones get that far
+        raise ValueError(f"Unknown habitat {habitat!r}")
+    query = {"granularity": granularity}
+    if since or until:
+        query["start"] = {}
+        if since:
+            query["start"]["$gte"] = period_start(since, granularity)
+        if until:
+            query["start"]["$lte"] = until
+    projection = {"start": 1, "total": 1, "by_habitat": 1}
+    if habitat:
+        projection = {"start": 1, f"by_habitat.{habitat}": 1}
+
+    # Newest `limit` periods, returned in chronological order
+    documents = await db.catch_rollups.find(query, projection).sort("start", -1).limit(limit).to_list(limit)
+    points = []
+    for document in reversed(documents):
+        by_habitat = document.get("by_habitat", {})
+        if habitat:
+            points.append({"period": document["start"], "catches": by_habitat.get(habitat, 0)})
+        else:
+            points.append({
+                "period": document["start"],
+                "catches": document.get("total", 0),
+                "by_habitat": {h: by_habitat.get(h, 0) for h in HABITATS},
+            })
+    return points
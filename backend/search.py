@@ -0,0 +1,214 @@
+import unicodedata
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Relative weight of a trigram match in each indexed field
+FIELD_WEIGHTS = (("name", 3.0), ("scientificName", 2.0), ("description", 0.5))
+
+# Share of the query trigrams a field must contain for the fish to match
+MIN_SIMILARITY = 0.5
+
+# Trigrams found in more than this share of the catalog (and at least
+# COMMON_MIN_POSTINGS fish) are only checked against candidates found
+# through rarer trigrams, unless that cannot produce an exact top-k
+COMMON_RATIO = 0.02
+COMMON_MIN_POSTINGS = 256
+
+# Above this share of the catalog the sparse candidate pass is skipped
+SPARSE_MAX_RATIO = 0.1
+
+# Compact the index once this share of the ordinals belongs to removed fish
+COMPACT_RATIO = 0.5
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip accents and turn punctuation into spaces"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(
+        char if char.isalnum() else " "
+        for char in decomposed
+        if not unicodedata.combining(char)
+    )
+
+
+def trigrams(text: str) -> set:
+    """Padded word trigrams, so prefixes and short words still match"""
+    grams = set()
+    for word in normalize(text).split():
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+class SearchIndex:
+    """Trigram inverted index over name, scientificName and description.
+
+    Each field keeps trigram -> sorted array of fish ordinals. Queries first
+    score only the fish reached through rare trigrams and fall back to a
+    dense numpy count over the whole catalog when that cannot be exact,
+    which keeps typo-tolerant lookups in the low milliseconds even for 100k
+    species. Updates are incremental: a changed
+    fish gets a fresh ordinal and the old one is masked out until the index
+    is compacted.
+    """
+
+    def __init__(self):
+        self.version = None
+        self._reset()
+
+    def _reset(self):
+        self._postings: List[Dict[str, array]] = [{} for _ in FIELD_WEIGHTS]
+        self._fish: List[Optional[dict]] = []
+        self._ordinal: Dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._habitat = np.zeros(0, dtype=np.int16)
+        self._habitat_codes: Dict[str, int] = {}
+        self._dead = 0
+        # Per field, the trigrams whose posting arrays were copied from the
+        # index this one was derived by synced(); None when it owns them all
+        self._copied: Optional[List[set]] = None
+
+    def __len__(self):
+        return len(self._ordinal)
+
+    def sync(self, fish_list: List[dict], version):
+        """Bring the index in line with a catalog snapshot, touching only changed fish"""
+        if version == self.version:
+            return
+        current = {fish["_id"]: fish for fish in fish_list}
+        for fish_id in list(self._ordinal):
+            fish = current.get(fish_id)
+            if fish is None or fish != self._fish[self._ordinal[fish_id]]:
+                self._remove(fish_id)
+        for fish_id, fish in current.items():
+            if fish_id not in self._ordinal:
+                self._add(fish)
+
+        if self._dead and self._dead >= COMPACT_RATIO * len(self._fish):
+            self._reset()
+            for fish in fish_list:
+                self._add(fish)
+        self.version = version
+
+    def synced(self, fish_list: List[dict], version) -> "SearchIndex":
+        """A copy of the index brought in line with a snapshot, leaving this one untouched.
+
+        Searches can keep using this index while the copy is built in
+        another thread. Posting arrays are shared with the copy and only
+        duplicated when they gain an ordinal, so a small catalog change
+        stays cheap.
+        """
+        if version == self.version:
+            return self
+        index = SearchIndex.__new__(SearchIndex)
+        index.version = self.version
+        index._postings = [dict(postings) for postings in self._postings]
+        index._fish = list(self._fish)
+        index._ordinal = dict(self._ordinal)
+        index._alive = self._alive.copy()
+        index._habitat = self._habitat.copy()
+        index._habitat_codes = dict(self._habitat_codes)
+        index._dead = self._dead
+        index._copied = [set() for _ in FIELD_WEIGHTS]
+        index.sync(fish_list, version)
+        return index
+
+    def _add(self, fish: dict):
+        ordinal = len(self._fish)
+        self._fish.append(fish)
+        self._ordinal[fish["_id"]] = ordinal
+        if ordinal >= len(self._alive):
+            capacity = max(1024, 2 * len(self._alive))
+            self._alive = np.resize(self._alive, capacity)
+            self._habitat = np.resize(self._habitat, capacity)
+        self._alive[ordinal] = True
+        habitat = fish.get("habitat")
+        self._habitat[ordinal] = self._habitat_codes.setdefault(habitat, len(self._habitat_codes) + 1)
+        for i, (postings, (field, _)) in enumerate(zip(self._postings, FIELD_WEIGHTS)):
+            for gram in trigrams(fish.get(field) or ""):
+                posting = postings.get(gram)
+                if posting is None or (self._copied is not None and gram not in self._copied[i]):
+                    # New, or still shared with the index this one was copied from
+                    posting = postings[gram] = array("q", posting if posting is not None else ())
+                    if self._copied is not None:
+                        self._copied[i].add(gram)
+                posting.append(ordinal)
+
+    def _remove(self, fish_id: str):
+        ordinal = self._ordinal.pop(fish_id)
+        self._fish[ordinal] = None
+        self._alive[ordinal] = False
+        self._dead += 1
+
+    def search(self, query: str, limit: int = 20, habitat: Optional[str] = None) -> List[Tuple[dict, float]]:
+        """Best matching fish for a free-text query, highest score first"""
+        query_grams = trigrams(query)
+        if not query_grams or not self._ordinal:
+            return []
+
+        qn = len(query_grams)
+        common_limit = max(COMMON_MIN_POSTINGS, int(COMMON_RATIO * len(self._ordinal)))
+        fields = []
+        for postings, (_, weight) in zip(self._postings, FIELD_WEIGHTS):
+            hits = [np.frombuffer(postings[gram], dtype=np.int64) for gram in query_grams if gram in postings]
+            rare = [hit for hit in hits if len(hit) <= common_limit]
+            common = [hit for hit in hits if len(hit) > common_limit]
+            fields.append((weight, rare, common))
+
+        # Fish without any rare trigram hit can score at most this much
+        outside_best = max(len(common) for _, _, common in fields) / qn
+        outside_score = sum(weight * len(common) for weight, _, common in fields) / qn
+
+        rare_hits = [hit for _, rare, _ in fields for hit in rare]
+        if rare_hits:
+            candidates = np.unique(np.concatenate(rare_hits))
+            if len(candidates) <= SPARSE_MAX_RATIO * len(self._fish):
+                best, score = self._score_candidates(candidates, fields)
+                ranked = self._rank(candidates, best / qn, score / qn, limit, habitat)
+                # The sparse pass is exact unless fish outside it could still rank
+                if outside_best < MIN_SIMILARITY or (
+                    len(ranked) == limit and ranked[-1][1] > outside_score
+                ):
+                    return ranked
+
+        size = len(self._fish)
+        best = np.zeros(size, dtype=np.int64)
+        score = np.zeros(size, dtype=np.float64)
+        for weight, rare, common in fields:
+            if not rare and not common:
+                continue
+            counts = np.bincount(np.concatenate(rare + common), minlength=size)
+            np.maximum(best, counts, out=best)
+            score += weight * counts
+        return self._rank(np.arange(size), best / qn, score / qn, limit, habitat)
+
+    def _score_candidates(self, candidates: np.ndarray, fields) -> Tuple[np.ndarray, np.ndarray]:
+        """Per-field trigram hit counts restricted to a sorted candidate set"""
+        best = np.zeros(len(candidates), dtype=np.int64)
+        score = np.zeros(len(candidates), dtype=np.float64)
+        for weight, rare, common in fields:
+            counts = np.zeros(len(candidates), dtype=np.int64)
+            for hit in rare:
+                # Rare postings are subsets of the candidates
+                counts[np.searchsorted(candidates, hit)] += 1
+            for hit in common:
+                # Postings are sorted, so membership is a binary search
+                positions = np.minimum(np.searchsorted(hit, candidates), len(hit) - 1)
+                counts += hit[positions] == candidates
+            np.maximum(best, counts, out=best)
+            score += weight * counts
+        return best, score
+
+    def _rank(self, ordinals, similarity, score, limit, habitat) -> List[Tuple[dict, float]]:
+        matches = (similarity >= MIN_SIMILARITY) & self._alive[ordinals]
+        if habitat:
+            matches &= self._habitat[ordinals] == self._habitat_codes.get(habitat, -1)
+        selected = np.flatnonzero(matches)
+        if len(selected) > limit:
+            selected = selected[np.argpartition(-score[selected], limit - 1)[:limit]]
+        # Ties fall back to catalog order so results are stable
+        ranked = sorted(selected, key=lambda i: (-score[i], ordinals[i]))
+        return [(self._fish[ordinals[i]], float(score[i])) for i in ranked]
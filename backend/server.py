@@ -1,28 +1,173 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Header, Query, Request
+from fastapi.responses import FileResponse, ORJSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError
 import os
+import asyncio
 import logging
 from pathlib import Path
+import orjson
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Literal, Optional
 import uuid
-from datetime import datetime
+import base64
+import hashlib
+import hmac
+import socket
+import binascii
+from datetime import datetime, timedelta
+
+import changelog
+import export
+import geo
+import images
+import importer
+import indexes
+import leases
+import metrics
+import profiling
+import progress
+import recommend
+import rollups
+import shared_catalog
+import stats
+from admission import AdmissionMiddleware
+from blobstore import BlobStore, BlobTooLarge, InvalidUpload, parse_range
+from jobs import JobQueue
+from repository import MongoSettings, Repository
+from search import SearchIndex
+from writes import InsertCoalescer
+from catalog import CatalogCache, CatalogSnapshot, cached_response, encode_cursor, etag_matches, page_query, parse_fields, shape_fish
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Opt-in request profiling: requests sending X-Debug-Profile: <PROFILE_TOKEN>,
+# plus 1 in PROFILE_SAMPLE_EVERY requests, are sampled every
+# PROFILE_INTERVAL_MS and written to PROFILE_DIR as speedscope or collapsed
+# stacks. With neither set the middleware is not installed at all. Listing
+# and downloading profiles, and GET /api/admin/jobs, take the same header,
+# so need PROFILE_TOKEN.
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+PROFILE_SAMPLE_EVERY = int(os.environ.get('PROFILE_SAMPLE_EVERY', '0'))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', '1'))
+PROFILE_FORMAT = os.environ.get('PROFILE_FORMAT', 'speedscope')
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', '200'))
+# Also record the Mongo commands each profiled request sends
+PROFILE_TRACE_MONGO = os.environ.get('PROFILE_TRACE_MONGO', '1') == '1'
+profiler = None
+if PROFILE_TOKEN or PROFILE_SAMPLE_EVERY > 0:
+    profiler = profiling.Profiler(
+        Path(os.environ.get('PROFILE_DIR', ROOT_DIR / 'profiles')),
+        interval=PROFILE_INTERVAL_MS / 1000,
+        fmt=PROFILE_FORMAT,
+        max_profiles=PROFILE_MAX_FILES,
+    )
+
+# MongoDB, connected on first use. Pool size, timeouts and the catalog read
+# preference come from MONGO_* / CATALOG_READ_PREFERENCE; MONGO_URL=memory://
+# runs on an in-process database
+mongo_listeners = [metrics.mongo_listener]
+if profiler is not None and PROFILE_TRACE_MONGO:
+    mongo_listeners.append(profiling.mongo_tracer)
+db = Repository(MongoSettings.from_env(), event_listeners=mongo_listeners)
+
+# Seconds clients may reuse a catalog response before revalidating it
+CATALOG_MAX_AGE = int(os.environ.get('CATALOG_MAX_AGE', '60'))
+
+# How often a worker checks the catalog revision for changes made elsewhere
+CATALOG_REFRESH_SECONDS = float(os.environ.get('CATALOG_REFRESH_SECONDS', '5'))
+
+# How often a worker checks whether the recommendation counts changed
+RECOMMEND_REFRESH_SECONDS = float(os.environ.get('RECOMMEND_REFRESH_SECONDS', '30'))
+
+# Multi-worker mode: when set, one worker per host (the lease holder) writes
+# the encoded catalog to this file, e.g. under /dev/shm, and every worker
+# serves it from a read-only mapping instead of holding its own copy. Workers
+# notice a new catalog from the file's revision header.
+CATALOG_SHARED_PATH = os.environ.get('CATALOG_SHARED_PATH', '')
+
+# Seconds a worker holds the seeding or publishing lease without renewing it
+# before another worker may take over
+LEASE_SECONDS = float(os.environ.get('LEASE_SECONDS', '30'))
+
+# Stored catches keep the id of their catches.created job in pending_job
+# until a sweep, every PENDING_JOB_SWEEP_SECONDS, finds the job queued.
+# Catches whose job never got queued (the enqueue failed after the insert)
+# are enqueued by the sweep once PENDING_JOB_GRACE_SECONDS have passed.
+PENDING_JOB_SWEEP_SECONDS = float(os.environ.get('PENDING_JOB_SWEEP_SECONDS', '60'))
+PENDING_JOB_GRACE_SECONDS = float(os.environ.get('PENDING_JOB_GRACE_SECONDS', '60'))
+PENDING_JOB_SWEEP_BATCH = 1000
+
+# Page size limits for paginated /api/fish requests
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Maximum number of catches accepted by one POST /api/catches/batch
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', '500'))
+
+# Documents fetched per round trip when streaming GET /api/catches/export
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '1000'))
+# The export holds every user's catches, so it needs X-Export-Token:
+# <EXPORT_TOKEN>; while EXPORT_TOKEN is unset it is refused to everyone
+EXPORT_TOKEN = os.environ.get('EXPORT_TOKEN', '')
+
+# Largest search radius in metres for GET /api/catches/nearby
+MAX_NEARBY_RADIUS = float(os.environ.get('MAX_NEARBY_RADIUS', '100000'))
+
+# Content-addressed storage for catch photos
+blob_store = BlobStore(
+    Path(os.environ.get('BLOB_DIR', ROOT_DIR / 'blobs')),
+    max_bytes=int(os.environ.get('BLOB_MAX_BYTES', str(20 * 1024 * 1024))),
+)
+
+# Group commit for unlock writes: concurrent inserts are buffered for up to
+# INSERT_COALESCE_MS (or INSERT_COALESCE_MAX_DOCS documents) and written with
+# one insert_many. 0 disables coalescing.
+INSERT_COALESCE_MS = float(os.environ.get('INSERT_COALESCE_MS', '0'))
+INSERT_COALESCE_MAX_DOCS = int(os.environ.get('INSERT_COALESCE_MAX_DOCS', '256'))
+catch_writes = InsertCoalescer(lambda: db.user_catches, INSERT_COALESCE_MS, INSERT_COALESCE_MAX_DOCS)
+job_writes = InsertCoalescer(lambda: db.jobs, INSERT_COALESCE_MS, INSERT_COALESCE_MAX_DOCS)
+
+# Background jobs (post-unlock work): concurrent workers per process, process
+# pool size for CPU-bound jobs, and attempts before a job is dead-lettered
+job_queue = JobQueue(
+    lambda: db,
+    workers=int(os.environ.get('JOB_WORKERS', '4')),
+    process_workers=int(os.environ.get('JOB_PROCESS_WORKERS', '2')),
+    max_attempts=int(os.environ.get('JOB_MAX_ATTEMPTS', '5')),
+    insert=job_writes.insert_one,
+)
+
+# Admission control: largest accepted request body, per-client write rate
+# and burst, and how many writes may run at once before new ones wait up to
+# WRITE_QUEUE_TIMEOUT seconds and are then refused with 503. JSON bodies are
+# buffered whole, so they stay small; photos go through POST /api/blobs,
+# which streams to disk and gets the blob-sized limit and its own slots.
+MAX_BODY_BYTES = int(os.environ.get('MAX_BODY_BYTES', str(1024 * 1024)))
+# Room for the multipart boundaries and part headers around the file
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', str(blob_store.max_bytes + 64 * 1024)))
+MAX_INFLIGHT_UPLOADS = int(os.environ.get('MAX_INFLIGHT_UPLOADS', '8'))
+# Per-client rate limiting is off by default (0). Clients are told apart by
+# their address, so behind a proxy or ingress it also needs
+# TRUST_FORWARDED_FOR=1; otherwise every user shares the proxy's bucket.
+WRITE_RATE_PER_SECOND = float(os.environ.get('WRITE_RATE_PER_SECOND', '0'))
+WRITE_BURST = float(os.environ.get('WRITE_BURST', '50'))
+MAX_INFLIGHT_WRITES = int(os.environ.get('MAX_INFLIGHT_WRITES', '64'))
+WRITE_QUEUE_TIMEOUT = float(os.environ.get('WRITE_QUEUE_TIMEOUT', '0.5'))
+# Rate limit by the first X-Forwarded-For address (only behind a trusted proxy)
+TRUST_FORWARDED_FOR = os.environ.get('TRUST_FORWARDED_FOR', '0') == '1'
 
 # Create the main app without a prefix
 app = FastAPI()
 
-# Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+# Create a router with the /api prefix; responses are encoded with orjson
+api_router = APIRouter(prefix="/api", default_response_class=ORJSONResponse)
+
+# Habitat query parameters: unknown values are answered with 422
+Habitat = Literal[stats.HABITATS]
 
 # Fish Models
 class UserCatch(BaseModel):
@@ -40,15 +185,33 @@ class Fish(BaseModel):
     referenceImage: str
     isUnlocked: bool = False
     userCatch: Optional[UserCatch] = None
+    # Stable position of the species in per-user progress bitmaps
+    ordinal: Optional[int] = None
 
     class Config:
         populate_by_name = True
 
 class UnlockFishRequest(BaseModel):
-    photo: str
+    # Either a blob digest returned by POST /api/blobs, or a legacy inline
+    # photo (data: URL) that the server moves into the blob store
+    photo: Optional[str] = None
+    photo_blob: Optional[str] = None
+    # Set by clients that track progress server-side
+    user_id: Optional[str] = Field(None, min_length=1, max_length=128)
     location: str
     equipment: str
     date: str
+    # Optional position of the catch in WGS84 degrees; send both or neither
+    lat: Optional[float] = Field(None, ge=-90, le=90)
+    lon: Optional[float] = Field(None, ge=-180, le=180)
+
+class CatchBatchItem(UnlockFishRequest):
+    # Generated by the client once per catch, so replays are recognised
+    idempotency_key: str = Field(..., min_length=1, max_length=128)
+    fish_id: str
+
+class CatchBatchRequest(BaseModel):
+    catches: List[CatchBatchItem] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
 
 # Italian Fish Database - simplified for stability
 FISH_DATABASE = [
@@ -213,107 +376,847 @@ for i in range(21, 151):
 
 # Initialize fish database on startup
 async def initialize_fish_database():
-    """Initialize the fish database with all Italian species"""
+    """Seed the catalog with FISH_DATABASE, applying only what changed since the last seed.
+
+    The hash of the seed data is kept in catalog_meta; when it matches,
+    startup costs one small read. Otherwise species are upserted by
+    scientific name, so existing _ids and ordinals stay put and new species
+    get ids derived from their scientific name.
+    """
     try:
-        # Check if fish already exist
-        existing_count = await db.fish.count_documents({})
-        if existing_count > 0:
-            print(f"Fish database already initialized with {existing_count} species")
+        seed_hash = hashlib.sha256(orjson.dumps(FISH_DATABASE, option=orjson.OPT_SORT_KEYS)).hexdigest()
+        meta = await db.catalog_meta.find_one({"_id": changelog.META_ID}, {"seed_hash": 1})
+        if meta and meta.get("seed_hash") == seed_hash:
+            logger.info("Fish database already up to date with the seed data")
             return
-        
-        # Insert all fish
-        fish_documents = []
-        for fish_data in FISH_DATABASE:
-            fish_doc = {
-                "_id": str(uuid.uuid4()),
-                **fish_data
-            }
-            fish_documents.append(fish_doc)
-        
-        result = await db.fish.insert_many(fish_documents)
-        print(f"Initialized fish database with {len(result.inserted_ids)} species")
+
+        report = await importer.import_species(
+            db,
+            enumerate(FISH_DATABASE, start=1),
+            lambda fish: {field: fish[field] for field in importer.CATALOG_FIELDS},
+        )
+        await db.catalog_meta.update_one(
+            {"_id": changelog.META_ID}, {"$set": {"seed_hash": seed_hash}}, upsert=True
+        )
+        catalog_cache.invalidate()
+        logger.info(
+            "Seeded fish database: %d new, %d updated, %d unchanged species",
+            report.inserted, report.updated, report.unchanged,
+        )
         
     except Exception as e:
-        print(f"Error initializing fish database: {e}")
+        logger.error("Error initializing fish database: %s", e)
+
+async def load_catalog():
+    """Load the full catalog from Mongo, shaped like the Fish response model"""
+    async with db.catalog_session() as session:
+        if session is not None:
+            # Anchor the session at the primary's current revision first
+            await changelog.current_revision(db, session=session)
+        fish_cursor = db.catalog.fish.find({}, session=session)
+        fish_list = await fish_cursor.to_list(None)
+    return [Fish(**fish).model_dump(by_alias=True) for fish in fish_list]
+
+async def publish_catalog():
+    """Write the current catalog to the shared file for every worker on this host"""
+    revision = await changelog.current_revision(db)
+    fish = await load_catalog()
+    await run_in_threadpool(shared_catalog.publish, Path(CATALOG_SHARED_PATH), revision, fish)
+
+async def load_shared_catalog():
+    """The published catalog, or the catalog from Mongo while nothing was published yet"""
+    snapshot = await run_in_threadpool(shared_catalog.open_snapshot, Path(CATALOG_SHARED_PATH))
+    return snapshot if snapshot is not None else await load_catalog()
+
+async def shared_catalog_revision():
+    revision = shared_catalog.read_revision(Path(CATALOG_SHARED_PATH))
+    return revision if revision is not None else await changelog.current_revision(db)
+
+def shared_or_private_snapshot(version, data):
+    if isinstance(data, shared_catalog.SharedCatalogSnapshot):
+        return data
+    return CatalogSnapshot(version, data)
+
+if CATALOG_SHARED_PATH:
+    catalog_cache = CatalogCache(
+        load_shared_catalog,
+        version_reader=shared_catalog_revision,
+        refresh_interval=CATALOG_REFRESH_SECONDS,
+        snapshot_factory=shared_or_private_snapshot,
+    )
+else:
+    catalog_cache = CatalogCache(
+        load_catalog,
+        version_reader=lambda: changelog.current_revision(db),
+        refresh_interval=CATALOG_REFRESH_SECONDS,
+    )
+
+# Leases that keep workers from stepping on each other: startup (seeding,
+# indexes, counters) runs in one worker at a time, and one worker per host
+# publishes the shared catalog
+worker_id = leases.worker_id()
+startup_lease = leases.Lease(lambda: db, "startup", worker_id, LEASE_SECONDS)
+publisher_lease = leases.Lease(lambda: db, f"catalog-publisher:{socket.gethostname()}", worker_id, LEASE_SECONDS)
+publisher_task = None
+sweeper_task = None
+
+async def publish_catalog_loop():
+    """Republish the shared catalog whenever its revision moves, while holding the publisher lease"""
+    while True:
+        try:
+            if await publisher_lease.try_acquire():
+                revision = await changelog.current_revision(db)
+                if revision != shared_catalog.read_revision(Path(CATALOG_SHARED_PATH)):
+                    await publish_catalog()
+                    logger.info("Published catalog revision %s to %s", revision, CATALOG_SHARED_PATH)
+        except Exception as e:
+            logger.error("Error publishing shared catalog: %s", e)
+        await asyncio.sleep(min(CATALOG_REFRESH_SECONDS, LEASE_SECONDS / 3))
+
+async def load_affinity():
+    """Catalog snapshot and affinity counts the recommendation matrix is built from"""
+    return await catalog_cache.get(), await db.species_affinity.find({}).to_list(None)
+
+async def affinity_version():
+    return await recommend.current_version(db), (await catalog_cache.get()).version
+
+def build_affinity_matrix(version, data):
+    snapshot, documents = data
+    # Runs in the thread pool, so decoding a shared catalog stays off the event loop too
+    return recommend.AffinityMatrix(version, (snapshot.fish, documents))
+
+# In-memory recommendation matrix. Every catch moves the counts' version, so
+# under write traffic it is rebuilt every RECOMMEND_REFRESH_SECONDS: in a
+# thread, while requests keep using the previous matrix
+recommend_cache = CatalogCache(
+    load_affinity,
+    version_reader=affinity_version,
+    refresh_interval=RECOMMEND_REFRESH_SECONDS,
+    snapshot_factory=build_affinity_matrix,
+    build_in_thread=True,
+    serve_stale=True,
+)
+
+# Full-text index over the catalog snapshot. When the snapshot changes a
+# synced copy is built in a thread and swapped in; searches keep using the
+# previous index meanwhile
+search_index = SearchIndex()
+search_sync = None
+
+def refresh_search_index(snapshot):
+    """Start syncing the search index with a snapshot unless it is current; returns the sync task"""
+    global search_sync
+    if search_index.version != snapshot.etag and (search_sync is None or search_sync.done()):
+        search_sync = asyncio.ensure_future(sync_search_index(snapshot))
+    return search_sync
+
+async def sync_search_index(snapshot):
+    global search_index
+    # snapshot.fish decodes a shared catalog on first use, so it runs in the thread too
+    search_index = await run_in_threadpool(lambda: search_index.synced(snapshot.fish, snapshot.etag))
 
 # API Routes
 @api_router.get("/fish", response_model=List[Fish])
-async def get_all_fish():
-    """Get all fish species"""
+async def get_all_fish(
+    habitat: Optional[str] = None,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    if_none_match: Optional[str] = Header(None),
+):
+    """Get all fish species.
+
+    Without query parameters the whole catalog is served from the in-memory
+    snapshot. With habitat, fields, cursor or limit the request becomes a
+    keyset-paginated Mongo query ordered by (name, _id); the cursor for the
+    next page is returned in the X-Next-Cursor header.
+    """
+    if habitat is None and fields is None and cursor is None and limit is None:
+        try:
+            snapshot = await catalog_cache.get()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error fetching fish: {str(e)}")
+        return cached_response(snapshot.body, snapshot.etag, if_none_match, CATALOG_MAX_AGE)
+
+    try:
+        projection = parse_fields(fields)
+        query = page_query(habitat, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    page_size = limit or DEFAULT_PAGE_SIZE
     try:
-        fish_cursor = db.fish.find({})
-        fish_list = await fish_cursor.to_list(1000)
-        return [Fish(**fish) for fish in fish_list]
+        fish_cursor = db.catalog.fish.find(query, projection).sort([("name", 1), ("_id", 1)]).limit(page_size + 1)
+        fish_list = await fish_cursor.to_list(page_size + 1)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching fish: {str(e)}")
 
+    headers = {}
+    if len(fish_list) > page_size:
+        fish_list = fish_list[:page_size]
+        headers["X-Next-Cursor"] = encode_cursor(fish_list[-1])
+    if projection is None:
+        fish_list = [shape_fish(fish) for fish in fish_list]
+    return ORJSONResponse(content=fish_list, headers=headers)
+
+@api_router.get("/fish/search")
+async def search_fish(
+    q: str = Query(..., min_length=1, max_length=100),
+    habitat: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+):
+    """Accent-insensitive, typo-tolerant search over name, scientific name and description"""
+    try:
+        snapshot = await catalog_cache.get()
+        sync = refresh_search_index(snapshot)
+        if search_index.version is None:
+            # Nothing built yet: wait for the first build, which runs off the event loop
+            await asyncio.shield(sync)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching fish: {str(e)}")
+    return [
+        {**fish, "score": round(score, 3)}
+        for fish, score in search_index.search(q, limit=limit, habitat=habitat)
+    ]
+
+@api_router.get("/fish/changes")
+async def get_fish_changes(since: Optional[int] = Query(None, ge=0)):
+    """Catalog changes since a revision the client already has.
+
+    Returns the species upserted and deleted after `since` plus the new
+    revision. Without `since`, or when it is older than the retained change
+    log, the full catalog is returned with "full": true.
+    """
+    try:
+        changes = await changelog.changes_since(db, since) if since is not None else None
+        if changes is not None:
+            return {
+                "revision": changes["revision"],
+                "full": False,
+                "upserted": [Fish(**fish).model_dump(by_alias=True) for fish in changes["upserted"]],
+                "deleted": changes["deleted"],
+            }
+        snapshot = await catalog_cache.get()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching fish changes: {str(e)}")
+    return {"revision": snapshot.version, "full": True, "upserted": snapshot.fish, "deleted": []}
+
 @api_router.get("/fish/{fish_id}", response_model=Fish)
-async def get_fish(fish_id: str):
+async def get_fish(fish_id: str, if_none_match: Optional[str] = Header(None)):
     """Get a specific fish by ID"""
     try:
-        fish = await db.fish.find_one({"_id": fish_id})
-        if not fish:
-            raise HTTPException(status_code=404, detail="Fish not found")
-        return Fish(**fish)
+        snapshot = await catalog_cache.get()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching fish: {str(e)}")
+    body = snapshot.item_bodies.get(fish_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Fish not found")
+    return cached_response(body, snapshot.item_etags[fish_id], if_none_match, CATALOG_MAX_AGE)
+
+def recommendation_item(fish: dict, score: float) -> dict:
+    return {
+        "_id": fish["_id"],
+        "name": fish["name"],
+        "habitat": fish["habitat"],
+        "referenceImage": fish["referenceImage"],
+        "score": round(score, 4),
+    }
+
+@api_router.get("/fish/{fish_id}/related")
+async def get_related_fish(fish_id: str, limit: int = Query(10, ge=1, le=recommend.RELATED_LIMIT)):
+    """Species most often caught by the same users, or with the same equipment and locations"""
+    try:
+        snapshot = await catalog_cache.get()
+        matrix = await recommend_cache.get()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching related fish: {str(e)}")
+    species = snapshot.habitat_and_ordinal(fish_id)
+    if species is None:
+        raise HTTPException(status_code=404, detail="Fish not found")
+    _, ordinal = species
+    related = matrix.related(ordinal, limit) if ordinal is not None else []
+    return {"fish_id": fish_id, "related": [recommendation_item(item, score) for item, score in related]}
+
+async def fish_exists(fish_id: str) -> bool:
+    """Whether a species is in the catalog; checked in Mongo too, as the snapshot may lag an import"""
+    snapshot = await catalog_cache.get()
+    if fish_id in snapshot.item_etags:
+        return True
+    return await db.catalog.fish.find_one({"_id": fish_id}, {"_id": 1}) is not None
+
+def store_inline_photo(photo: str) -> str:
+    """Decode a data: URL photo into the blob store and return its digest"""
+    _, _, encoded = photo.partition(",")
+    return blob_store.put_bytes(base64.b64decode(encoded, validate=True))
+
+async def resolve_photo_blob(catch_data: UnlockFishRequest) -> Optional[str]:
+    """Blob digest for the catch photo, storing inline photos on the way"""
+    if catch_data.photo_blob:
+        if not await run_in_threadpool(blob_store.exists, catch_data.photo_blob):
+            raise HTTPException(status_code=400, detail="Unknown photo blob")
+        return catch_data.photo_blob
+    if catch_data.photo and catch_data.photo.startswith("data:"):
+        try:
+            digest = await run_in_threadpool(store_inline_photo, catch_data.photo)
+        except (binascii.Error, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid inline photo")
+        except BlobTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        await enqueue_photo_variants(digest)
+        return digest
+    return None
+
+def catch_position(catch_data: UnlockFishRequest) -> Optional[dict]:
+    """GeoJSON point for the catch, or None when it was sent without coordinates"""
+    if (catch_data.lat is None) != (catch_data.lon is None):
+        raise HTTPException(status_code=400, detail="lat and lon must be sent together")
+    if catch_data.lat is None:
+        return None
+    return geo.point(catch_data.lat, catch_data.lon)
+
+def photo_variants_payload(digest: str) -> dict:
+    return {"source": str(blob_store.path_for(digest)), "target": str(blob_store.variant_dir(digest))}
+
+async def enqueue_photo_variants(digest: str):
+    """Render the thumbnails of a newly stored photo in the background"""
+    await job_queue.enqueue("photo.variants", photo_variants_payload(digest))
+
+# Decoding and resizing is CPU-bound, so it runs in the job process pool
+job_queue.handler("photo.variants", cpu=True)(images.render_job)
+
+CREATED_CATCH_FIELDS = ("fish_id", "user_id", "caught_at", "created_at", "geo", "equipment", "location")
+
+def created_catch(catch: dict) -> dict:
+    """The fields of a stored catch that post-unlock jobs need"""
+    return {
+        "_id": catch["_id"],
+        "fish_id": catch["fish_id"],
+        "user_id": catch["user_id"],
+        "caught_at": catch["caught_at"],
+        "created_at": catch["created_at"],
+        "geo": catch.get("geo"),
+        "equipment": catch["equipment"],
+        "location": catch["location"],
+    }
+
+async def enqueue_created_catches(catches: List[dict], job_id: str):
+    """Queue catches.created for stored catches under the job id kept in their pending_job.
+
+    The catches are stored already, so a failure is logged rather than
+    raised; sweep_pending_jobs() enqueues the job later.
+    """
+    try:
+        await job_queue.enqueue("catches.created", {"catches": [created_catch(catch) for catch in catches]}, job_id=job_id)
+    except Exception as e:
+        logger.error("Error enqueueing catches.created job %s, leaving it to the sweep: %s", job_id, e)
+
+async def sweep_pending_jobs() -> int:
+    """Clear pending_job markers older than the grace period, enqueueing the jobs that never got queued.
+
+    The job id is fixed when the catch is stored, so a sweep that races a
+    slow enqueue adds nothing. Returns the number of jobs enqueued.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=PENDING_JOB_GRACE_SECONDS)
+    projection = {field: 1 for field in CREATED_CATCH_FIELDS + ("pending_job",)}
+    enqueued = 0
+    while True:
+        catches = await db.user_catches.find(
+            {"pending_job": {"$exists": True}, "created_at": {"$lt": cutoff}}, projection
+        ).limit(PENDING_JOB_SWEEP_BATCH).to_list(PENDING_JOB_SWEEP_BATCH)
+        if not catches:
+            return enqueued
+        by_job = {}
+        for catch in catches:
+            by_job.setdefault(catch["pending_job"], []).append(catch)
+        queued = {job["_id"] async for job in db.jobs.find({"_id": {"$in": list(by_job)}}, {"_id": 1})}
+        for job_id, group in by_job.items():
+            if job_id not in queued:
+                logger.warning("Enqueueing catches.created job %s for %d catches it never reached", job_id, len(group))
+                await job_queue.enqueue(
+                    "catches.created", {"catches": [created_catch(catch) for catch in group]}, job_id=job_id
+                )
+                enqueued += 1
+        await db.user_catches.update_many(
+            {"_id": {"$in": [catch["_id"] for catch in catches]}}, {"$unset": {"pending_job": ""}}
+        )
+        if len(catches) < PENDING_JOB_SWEEP_BATCH:
+            return enqueued
+
+async def sweep_pending_jobs_loop():
+    while True:
+        await asyncio.sleep(PENDING_JOB_SWEEP_SECONDS)
+        try:
+            await sweep_pending_jobs()
+        except Exception as e:
+            logger.error("Error sweeping pending catch jobs: %s", e)
+
+async def mark_applied(step: str, catches: List[dict], **fields):
+    """Record on the stored catches that a step of catches.created went through"""
+    update = {"$addToSet": {"applied": step}}
+    if fields:
+        update["$set"] = fields
+    await db.user_catches.update_many({"_id": {"$in": [catch["_id"] for catch in catches]}}, update)
+
+@job_queue.handler("catches.created")
+async def process_created_catches(payload: dict):
+    """Update counters, rollups, heatmap tiles, user progress and recommendation counts for new catches.
+
+    Each step marks the catches it has applied in user_catches.applied, and a
+    retried job skips those, so a failure in a later step does not count the
+    catches again in the earlier ones. Only a step interrupted between its
+    own write and its marker can repeat; stats reconcile and the rebuild
+    commands correct that.
+    """
+    catches = payload["catches"]
+    stored = {
+        catch["_id"]: catch
+        async for catch in db.user_catches.find(
+            {"_id": {"$in": [catch["_id"] for catch in catches]}}, {"applied": 1, "first_unlock": 1}
+        )
+    }
+
+    def pending(step: str, group: List[dict]) -> List[dict]:
+        return [catch for catch in group if step not in stored.get(catch["_id"], {}).get("applied", [])]
+
+    # Looked up in the snapshot's index, so a shared catalog is not decoded for this
+    snapshot = await catalog_cache.get()
+    habitat_of = lambda fish_id: (snapshot.habitat_and_ordinal(fish_id) or (None, None))[0]
+    ordinal_of = lambda fish_id: (snapshot.habitat_and_ordinal(fish_id) or (None, None))[1]
+
+    todo = pending("rollups", catches)
+    if todo:
+        await rollups.record_catches(db, todo, habitat_of)
+        await mark_applied("rollups", todo)
+    todo = pending("heatmap", catches)
+    if todo:
+        await geo.record_catches(db, todo, habitat_of)
+        await mark_applied("heatmap", todo)
+
+    by_fish = {}
+    for catch in pending("stats", catches):
+        by_fish.setdefault(catch["fish_id"], []).append(catch)
+    for fish_id, group in by_fish.items():
+        await stats.record_catch(db, fish_id, habitat_of(fish_id), len(group))
+        await mark_applied("stats", group)
+
+    for catch in pending("progress", catches):
+        ordinal = ordinal_of(catch["fish_id"])
+        first_unlock = False
+        if catch["user_id"] and ordinal is not None:
+            first_unlock = await progress.mark_unlocked(db, catch["user_id"], ordinal, habitat_of(catch["fish_id"]))
+        # Kept with the marker: the recommendation step pairs first unlocks
+        # only, and a retry can no longer tell them from the progress bitmap
+        await mark_applied("progress", [catch], first_unlock=first_unlock)
+        stored.setdefault(catch["_id"], {})["first_unlock"] = first_unlock
+
+    todo = pending("recommendations", catches)
+    if todo:
+        unlocked = {}
+        for catch in todo:
+            if stored.get(catch["_id"], {}).get("first_unlock"):
+                unlocked.setdefault(catch["user_id"], set()).add(ordinal_of(catch["fish_id"]))
+        await recommend.record_catches(db, todo, ordinal_of, unlocked)
+        await mark_applied("recommendations", todo)
+
+@job_queue.handler("recommendations.rebuild")
+async def rebuild_recommendations(payload: dict):
+    """Recompute the recommendation counts from every stored catch"""
+    counted = await recommend.rebuild(db)
+    logger.info("Recommendation counts rebuilt from %d catches", counted)
 
 @api_router.post("/fish/{fish_id}/unlock")
 async def unlock_fish(fish_id: str, catch_data: UnlockFishRequest):
     """Unlock a fish with user catch data"""
     try:
-        # Store user catch data in a separate collection
-        result = await db.user_catches.insert_one({
+        known = await fish_exists(fish_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error unlocking fish: {str(e)}")
+    if not known:
+        raise HTTPException(status_code=404, detail="Fish not found")
+    geo_point = catch_position(catch_data)
+    photo_blob = await resolve_photo_blob(catch_data)
+    try:
+        # Store user catch data in a separate collection; photos live in the
+        # blob store and the catch only keeps a reference to them
+        job_id = str(uuid.uuid4())
+        catch = {
             "_id": str(uuid.uuid4()),
             "fish_id": fish_id,
-            "photo": catch_data.photo,
+            "user_id": catch_data.user_id,
+            "photo_blob": photo_blob,
             "location": catch_data.location,
             "equipment": catch_data.equipment,
             "date": catch_data.date,
-            "created_at": datetime.utcnow()
-        })
-        
-        if result.inserted_id:
-            return {"success": True, "message": "Fish unlocked successfully"}
-        else:
+            "caught_at": rollups.parse_catch_date(catch_data.date),
+            "created_at": datetime.utcnow(),
+            "pending_job": job_id,
+        }
+        if photo_blob is None and catch_data.photo:
+            # Non-inline photos (e.g. remote URLs) are small enough to keep as is
+            catch["photo"] = catch_data.photo
+        if geo_point:
+            # Only catches with a position are in the 2dsphere index
+            catch["geo"] = geo_point
+        inserted_id = await catch_writes.insert_one(catch)
+        if not inserted_id:
             raise HTTPException(status_code=500, detail="Failed to unlock fish")
-            
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error unlocking fish: {str(e)}")
 
-@api_router.get("/stats")
-async def get_stats():
-    """Get overall app statistics"""
+    # Counters and progress are updated by a background job
+    await enqueue_created_catches([catch], job_id)
+    return {"success": True, "message": "Fish unlocked successfully"}
+
+@api_router.post("/catches/batch")
+async def sync_catches(batch: CatchBatchRequest):
+    """Store a batch of offline catches in one unordered insert.
+
+    Each catch carries a client idempotency key backed by a unique index, so
+    replaying a batch never creates duplicates. The response reports, per
+    catch, whether it was created, already known, or failed.
+    """
+    results = [{"idempotency_key": item.idempotency_key, "status": "created"} for item in batch.catches]
+    documents = []
+    positions = []
+    now = datetime.utcnow()
+    job_id = str(uuid.uuid4())
     try:
-        total_fish = await db.fish.count_documents({})
-        total_catches = await db.user_catches.count_documents({})
-        
-        # Count by habitat
-        marine_fish = await db.fish.count_documents({"habitat": "mare"})
-        river_fish = await db.fish.count_documents({"habitat": "fiume"})
-        lake_fish = await db.fish.count_documents({"habitat": "lago"})
-        
-        return {
-            "total_fish": total_fish,
-            "total_catches": total_catches,
-            "marine_fish": marine_fish,
-            "river_fish": river_fish,
-            "lake_fish": lake_fish
+        unknown = {fish_id for fish_id in {item.fish_id for item in batch.catches} if not await fish_exists(fish_id)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error syncing catches: {str(e)}")
+    for position, item in enumerate(batch.catches):
+        if item.fish_id in unknown:
+            results[position].update(status="error", detail="Fish not found")
+            continue
+        try:
+            geo_point = catch_position(item)
+            photo_blob = await resolve_photo_blob(item)
+        except HTTPException as e:
+            results[position].update(status="error", detail=e.detail)
+            continue
+        catch = {
+            "_id": str(uuid.uuid4()),
+            "idempotency_key": item.idempotency_key,
+            "fish_id": item.fish_id,
+            "user_id": item.user_id,
+            "photo_blob": photo_blob,
+            "location": item.location,
+            "equipment": item.equipment,
+            "date": item.date,
+            "caught_at": rollups.parse_catch_date(item.date),
+            "created_at": now,
+            "pending_job": job_id,
         }
+        if photo_blob is None and item.photo:
+            catch["photo"] = item.photo
+        if geo_point:
+            catch["geo"] = geo_point
+        documents.append(catch)
+        positions.append(position)
+
+    if documents:
+        try:
+            await db.user_catches.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                result = results[positions[error["index"]]]
+                if error.get("code") == 11000:
+                    result["status"] = "duplicate"
+                else:
+                    result.update(status="error", detail=error.get("errmsg", "Write failed"))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error syncing catches: {str(e)}")
+
+    created = [document for document, position in zip(documents, positions)
+               if results[position]["status"] == "created"]
+    if created:
+        await enqueue_created_catches(created, job_id)
+
+    return {
+        "results": results,
+        "created": sum(1 for result in results if result["status"] == "created"),
+        "duplicates": sum(1 for result in results if result["status"] == "duplicate"),
+        "errors": sum(1 for result in results if result["status"] == "error"),
+    }
+
+@api_router.get("/catches/export")
+async def export_catches(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    since: Optional[datetime] = None,
+    after_id: Optional[str] = None,
+    include_photos: bool = False,
+    x_export_token: Optional[str] = Header(None),
+):
+    """Stream every catch in _id order as NDJSON or CSV.
+
+    The cursor is read one batch at a time, so memory use does not depend on
+    the size of the collection. An interrupted export resumes by passing the
+    last _id received as after_id.
+    """
+    require_token(x_export_token, EXPORT_TOKEN, "X-Export-Token")
+    projection = {field: 0 for field in export.JOB_FIELDS}
+    if not include_photos:
+        projection["photo"] = 0
+    cursor = db.user_catches.find(
+        export.export_query(since, after_id), projection, batch_size=EXPORT_BATCH_SIZE
+    ).sort("_id", 1)
+    if format == "csv":
+        columns = export.CSV_COLUMNS + (["photo"] if include_photos else [])
+        body = export.iter_csv(cursor, EXPORT_BATCH_SIZE, columns)
+    else:
+        body = export.iter_ndjson(cursor, EXPORT_BATCH_SIZE)
+    return StreamingResponse(
+        body,
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="catches.{format}"'},
+    )
+
+@api_router.get("/catches/nearby")
+async def get_nearby_catches(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius: float = Query(5000, gt=0, le=MAX_NEARBY_RADIUS),
+    fish_id: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Catches within `radius` metres of a position, nearest first, from the 2dsphere index.
+
+    Only fish_id, geo, date and distance_m are returned, never who made the
+    catch or its photo.
+    """
+    if db.settings.in_memory:
+        raise HTTPException(status_code=501, detail="Nearby catches need MongoDB's $geoNear, which memory:// does not implement")
+    try:
+        catches = await geo.nearby(db, lat, lon, radius, fish_id, limit)
+        return {"catches": catches, "count": len(catches)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching nearby catches: {str(e)}")
+
+@api_router.get("/catches/heatmap/{z}/{x}/{y}")
+async def get_heatmap_tile(z: int, x: int, y: int, habitat: Optional[Habitat] = None):
+    """Catch counts over a grid of cells in one Web Mercator map tile, precomputed on unlock"""
+    if not 0 <= z <= geo.MAX_TILE_ZOOM:
+        raise HTTPException(status_code=404, detail=f"Heatmap tiles go up to zoom {geo.MAX_TILE_ZOOM}")
+    if not (0 <= x < 1 << z and 0 <= y < 1 << z):
+        raise HTTPException(status_code=404, detail="Tile out of range")
+    try:
+        return await geo.heatmap_tile(db, z, x, y, habitat)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching heatmap tile: {str(e)}")
+
+@api_router.post("/blobs", status_code=201)
+async def upload_blob(request: Request):
+    """Upload a catch photo as multipart/form-data (first file part)"""
+    try:
+        digest, size = await blob_store.put_multipart(
+            request.headers.get("content-type", ""), request.stream()
+        )
+    except InvalidUpload as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except BlobTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    await enqueue_photo_variants(digest)
+    return {"blob": digest, "size": size}
+
+@api_router.get("/blobs/{digest}")
+async def get_blob(
+    digest: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None),
+):
+    """Serve a stored blob, honouring single byte-range requests"""
+    # Disk reads run in the thread pool, here and (as StreamingResponse
+    # iterates a plain iterator there) for the body
+    blob = await run_in_threadpool(blob_store.describe, digest)
+    if blob is None:
+        raise HTTPException(status_code=404, detail="Blob not found")
+    size, content_type = blob
+
+    etag = f'"{digest}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        # Content addressed, so the bytes behind a URL never change
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+
+    status_code = 200
+    start, end = 0, size - 1
+    if byte_range is not None:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        blob_store.iter_range(digest, start, end),
+        status_code=status_code,
+        media_type=content_type,
+        headers=headers,
+    )
+
+@api_router.get("/blobs/{digest}/variants/{variant}")
+async def get_blob_variant(digest: str, variant: str, if_none_match: Optional[str] = Header(None)):
+    """Serve a resized photo, e.g. /variants/128.webp for list thumbnails"""
+    try:
+        size, fmt = images.parse_variant(variant)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if not await run_in_threadpool(blob_store.exists, digest):
+        raise HTTPException(status_code=404, detail="Blob not found")
+
+    etag = f'"{digest}-{variant}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    path = blob_store.variant_dir(digest) / images.variant_name(size, fmt)
+    if not await run_in_threadpool(path.is_file):
+        # The background job has not run yet (or the cache was cleared)
+        try:
+            payload = photo_variants_payload(digest)
+            await job_queue.run_in_process(images.render_variants, payload["source"], payload["target"])
+        except images.UnsupportedImage:
+            raise HTTPException(status_code=415, detail="Blob is not a supported image")
+    return FileResponse(path, media_type=images.VARIANT_FORMATS[fmt][1], headers=headers)
+
+@api_router.get("/users/{user_id}/progress")
+async def get_user_progress(user_id: str):
+    """Unlocked species as a base64 bitmap over catalog ordinals, with counts by habitat"""
+    try:
+        return await progress.get_progress(db, user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching progress: {str(e)}")
+
+@api_router.get("/users/{user_id}/recommendations")
+async def get_user_recommendations(
+    user_id: str,
+    limit: int = Query(10, ge=1, le=100),
+    habitat: Optional[str] = None,
+):
+    """Species the user is likely to catch next, from the in-memory affinity matrix"""
+    try:
+        user_progress = await db.user_progress.find_one({"_id": user_id}, {"bitmap": 1})
+        matrix = await recommend_cache.get()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching recommendations: {str(e)}")
+    caught = recommend.unpack_ordinals(bytes(user_progress["bitmap"]) if user_progress else b"")
+    recommendations = matrix.recommend(caught, limit, habitat)
+    return {"user_id": user_id, "recommendations": [recommendation_item(item, score) for item, score in recommendations]}
+
+@api_router.get("/stats")
+async def get_stats(include: Optional[Literal["fish"]] = None):
+    """Get overall app statistics; ?include=fish adds catch counts per species"""
+    include_fish = include == "fish"
+    try:
+        counters = await stats.get_counters(db, include_fish)
+        return stats.to_response(counters, include_fish)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching stats: {str(e)}")
 
+@api_router.get("/stats/timeline")
+async def get_stats_timeline(
+    granularity: Literal["day", "month"] = "day",
+    habitat: Optional[Habitat] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(366, ge=1, le=3660),
+):
+    """Catches per day or month (optionally for one habitat), newest `limit` periods"""
+    try:
+        points = await rollups.timeline(db, granularity, habitat, since, until, limit)
+        return {"granularity": granularity, "habitat": habitat, "points": points}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching timeline: {str(e)}")
+
+@api_router.get("/admin/jobs")
+async def get_jobs(x_debug_profile: Optional[str] = Header(None)):
+    """Background job counts by status and the most recent dead-lettered jobs"""
+    # Dead-lettered payloads carry catch data, so this takes the admin token too
+    require_profile_token(x_debug_profile)
+    try:
+        return await job_queue.summary()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching jobs: {str(e)}")
+
+def require_token(token: Optional[str], expected: str, header: str):
+    """403 unless the request sent the expected token; an unset token closes the route"""
+    if not (expected and token and hmac.compare_digest(token.encode("latin-1"), expected.encode("latin-1"))):
+        raise HTTPException(status_code=403, detail=f"Missing or invalid {header} token")
+
+def require_profile_token(token: Optional[str]):
+    """Profiles hold stack traces, request paths and Mongo commands, so only PROFILE_TOKEN holders read them"""
+    require_token(token, PROFILE_TOKEN, "X-Debug-Profile")
+
+@api_router.get("/admin/profiles")
+async def get_profiles(x_debug_profile: Optional[str] = Header(None)):
+    """Request profiles written by the profiling middleware, newest first"""
+    if profiler is None:
+        return {"enabled": False, "profiles": []}
+    require_profile_token(x_debug_profile)
+    profiles = await run_in_threadpool(profiler.list_profiles)
+    return {"enabled": True, "profiles": profiles}
+
+@api_router.get("/admin/profiles/{filename}")
+async def get_profile(filename: str, x_debug_profile: Optional[str] = Header(None)):
+    """Download a profile file; speedscope files open at https://www.speedscope.app"""
+    require_profile_token(x_debug_profile)
+    path = profiler.profile_path(filename) if profiler is not None else None
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    media_type = "text/plain; charset=utf-8" if path.suffix == ".txt" else "application/json"
+    return FileResponse(path, media_type=media_type, filename=filename)
+
+@api_router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus metrics: per-route HTTP latency and MongoDB command timings"""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
 # Include the router in the main app
 app.include_router(api_router)
 
+# Inside CORS, so rejections still carry the CORS headers browsers need
+app.add_middleware(
+    AdmissionMiddleware,
+    max_body_bytes=MAX_BODY_BYTES,
+    rate=WRITE_RATE_PER_SECOND,
+    burst=WRITE_BURST,
+    max_inflight_writes=MAX_INFLIGHT_WRITES,
+    queue_timeout=WRITE_QUEUE_TIMEOUT,
+    trust_forwarded=TRUST_FORWARDED_FOR,
+    upload_paths=["/api/blobs"],
+    max_upload_bytes=MAX_UPLOAD_BYTES,
+    max_inflight_uploads=MAX_INFLIGHT_UPLOADS,
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "Retry-After", "X-Profile-Id"],
 )
 
+if profiler is not None:
+    # Outside admission control and CORS, so the profile covers them too
+    app.add_middleware(
+        profiling.ProfilingMiddleware,
+        profiler=profiler,
+        token=PROFILE_TOKEN,
+        sample_every=PROFILE_SAMPLE_EVERY,
+    )
+
+# Outermost, so the timings include CORS handling
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -323,9 +1226,43 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize the database on startup"""
-    await initialize_fish_database()
+    """Initialize the database on startup.
+
+    Workers take turns: the first one seeds, creates indexes and builds the
+    counters, and the ones after it find that work done.
+    """
+    global publisher_task, sweeper_task
+    async with startup_lease.hold():
+        await initialize_fish_database()
+        await changelog.assign_missing_ordinals(db)
+        await indexes.apply_indexes(db)
+        if await stats.get_counters(db) is None:
+            await stats.reconcile(db)
+        if await recommend.current_version(db) is None and not await db.jobs.find_one(
+            {"name": "recommendations.rebuild", "status": {"$in": ["pending", "running"]}}
+        ):
+            # Existing catches are counted in the background
+            await job_queue.enqueue("recommendations.rebuild", {})
+        if CATALOG_SHARED_PATH and (
+            shared_catalog.read_revision(Path(CATALOG_SHARED_PATH)) != await changelog.current_revision(db)
+        ):
+            # Publish before any worker serves requests, so none starts on a private copy
+            await publish_catalog()
+    await job_queue.start()
+    if not CATALOG_SHARED_PATH:
+        # Build the search index in the background, ahead of the first search.
+        # With a shared catalog only workers that serve searches decode it.
+        refresh_search_index(await catalog_cache.get())
+    if CATALOG_SHARED_PATH:
+        publisher_task = asyncio.ensure_future(publish_catalog_loop())
+    sweeper_task = asyncio.ensure_future(sweep_pending_jobs_loop())
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    if publisher_task is not None:
+        publisher_task.cancel()
+        await publisher_lease.release()
+    if sweeper_task is not None:
+        sweeper_task.cancel()
+    await job_queue.stop()
+    db.close()
\ No newline at end of file
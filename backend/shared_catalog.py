@@ -0,0 +1,227 @@
+import bisect
+import mmap
+import os
+import struct
+import time
+from functools import cached_property
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import orjson
+
+from catalog import encode_json, make_etag
+
+# File layout: a fixed prefix (magic, catalog revision, header length), a
+# small JSON header, a table of fixed-width index records sorted by fish id,
+# then the pre-encoded response bodies. Workers map the file read-only and
+# binary-search the table in place, so the index and the bodies live once in
+# the page cache however many workers serve them, and a worker's own memory
+# does not grow with the catalog.
+MAGIC = b"FDXCAT03"
+PREFIX = struct.Struct("<8sQQ")
+
+# Index record after the fish id: body offset and length, habitat code
+# (NO_HABITAT when unset), ordinal (NO_ORDINAL when unset); the ETag follows
+RECORD = struct.Struct("<QIBq")
+NO_HABITAT = 255
+NO_ORDINAL = -1
+
+
+def publish(path: Path, revision: int, fish: List[dict]):
+    """Write the catalog at a revision to path, atomically replacing the previous file.
+
+    Workers that mapped the old file keep reading it until they notice the
+    new revision, since os.replace() does not touch the old inode.
+    """
+    body = encode_json(fish)
+    chunks = [body]
+    offset = len(body)
+    habitats: List[str] = []
+    entries = []
+    for item in fish:
+        item_body = encode_json(item)
+        habitat = item.get("habitat")
+        if habitat is not None and habitat not in habitats:
+            habitats.append(habitat)
+        entries.append((
+            item["_id"].encode("utf-8"),
+            offset,
+            len(item_body),
+            habitats.index(habitat) if habitat is not None else NO_HABITAT,
+            item["ordinal"] if item.get("ordinal") is not None else NO_ORDINAL,
+            make_etag(item_body).encode("ascii"),
+        ))
+        chunks.append(item_body)
+        offset += len(item_body)
+    if len(habitats) >= NO_HABITAT:
+        raise ValueError(f"At most {NO_HABITAT} habitats fit in a published catalog")
+
+    key_width = max((len(entry[0]) for entry in entries), default=0)
+    etag_width = max((len(entry[5]) for entry in entries), default=0)
+    entries.sort()
+    table = b"".join(
+        key.ljust(key_width, b"\0") + RECORD.pack(item_offset, length, habitat, ordinal) + etag.ljust(etag_width)
+        for key, item_offset, length, habitat, ordinal, etag in entries
+    )
+    header = orjson.dumps({
+        "etag": make_etag(body),
+        "body": [0, len(body)],
+        "count": len(entries),
+        "key_width": key_width,
+        "etag_width": etag_width,
+        "habitats": habitats,
+    })
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(temporary, "wb") as f:
+        f.write(PREFIX.pack(MAGIC, revision, len(header)))
+        f.write(header)
+        f.write(table)
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(temporary, path)
+
+
+def read_revision(path: Path) -> Optional[int]:
+    """Catalog revision of the published file; None if there is none (or it is not one of ours)"""
+    try:
+        with open(path, "rb") as f:
+            prefix = f.read(PREFIX.size)
+    except FileNotFoundError:
+        return None
+    if len(prefix) < PREFIX.size:
+        return None
+    magic, revision, _ = PREFIX.unpack(prefix)
+    return revision if magic == MAGIC else None
+
+
+class _Keys:
+    """The sorted fish ids of the index table, as a sequence bisect can search"""
+
+    def __init__(self, buffer: mmap.mmap, start: int, count: int, key_width: int, record_width: int):
+        self._buffer = buffer
+        self._start = start
+        self._count = count
+        self._key_width = key_width
+        self._record_width = record_width
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, position: int) -> bytes:
+        start = self._start + position * self._record_width
+        return self._buffer[start:start + self._key_width]
+
+
+class _MappedBodies:
+    """fish_id -> response body, read from the mapping on demand"""
+
+    def __init__(self, snapshot: "SharedCatalogSnapshot"):
+        self._snapshot = snapshot
+
+    def get(self, fish_id: str, default=None) -> Optional[bytes]:
+        record = self._snapshot._record(fish_id)
+        if record is None:
+            return default
+        start = self._snapshot._base + record[0]
+        return self._snapshot._buffer[start:start + record[1]]
+
+
+class _MappedEtags:
+    """fish_id -> ETag, read from the mapping on demand"""
+
+    def __init__(self, snapshot: "SharedCatalogSnapshot"):
+        self._snapshot = snapshot
+
+    def get(self, fish_id: str, default=None) -> Optional[str]:
+        record = self._snapshot._record(fish_id)
+        return record[4] if record is not None else default
+
+    def __getitem__(self, fish_id: str) -> str:
+        etag = self.get(fish_id)
+        if etag is None:
+            raise KeyError(fish_id)
+        return etag
+
+    def __contains__(self, fish_id: str) -> bool:
+        return self._snapshot._record(fish_id) is not None
+
+
+class SharedCatalogSnapshot:
+    """A CatalogSnapshot backed by a published catalog file.
+
+    Responses are sliced out of the read-only mapping (a copy per response,
+    nothing per worker), and single species are found by a binary search
+    over the mapped index table. The decoded fish list, which search and
+    recommendations need, is only built in the workers that use it.
+    """
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, revision, header_length = PREFIX.unpack_from(self._buffer)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a published catalog")
+        header = orjson.loads(self._buffer[PREFIX.size:PREFIX.size + header_length])
+        self._table_start = table_start = PREFIX.size + header_length
+        self._key_width = header["key_width"]
+        self._etag_width = header["etag_width"]
+        self._record_width = self._key_width + RECORD.size + self._etag_width
+        self._keys = _Keys(self._buffer, table_start, header["count"], self._key_width, self._record_width)
+        self._habitats = header["habitats"]
+        self._base = table_start + header["count"] * self._record_width
+        self._body_range = header["body"]
+
+        self.version = revision
+        self.checked_at = time.monotonic()
+        self.etag = header["etag"]
+        self.item_bodies = _MappedBodies(self)
+        self.item_etags = _MappedEtags(self)
+
+    def _record(self, fish_id: str) -> Optional[Tuple[int, int, Optional[str], Optional[int], str]]:
+        """(offset, length, habitat, ordinal, etag) of a species, or None if it is not in the catalog"""
+        key = fish_id.encode("utf-8")
+        if len(key) > self._key_width:
+            return None
+        key = key.ljust(self._key_width, b"\0")
+        position = bisect.bisect_left(self._keys, key)
+        if position == len(self._keys) or self._keys[position] != key:
+            return None
+        start = self._table_start + position * self._record_width + self._key_width
+        offset, length, habitat, ordinal = RECORD.unpack_from(self._buffer, start)
+        etag_start = start + RECORD.size
+        etag = self._buffer[etag_start:etag_start + self._etag_width].decode("ascii").rstrip()
+        return (
+            offset,
+            length,
+            self._habitats[habitat] if habitat != NO_HABITAT else None,
+            ordinal if ordinal != NO_ORDINAL else None,
+            etag,
+        )
+
+    @property
+    def body(self) -> bytes:
+        start = self._base + self._body_range[0]
+        return self._buffer[start:start + self._body_range[1]]
+
+    def habitat_and_ordinal(self, fish_id: str) -> Optional[Tuple[Optional[str], Optional[int]]]:
+        """Habitat and ordinal of a species from the mapped index, without decoding the catalog"""
+        record = self._record(fish_id)
+        return (record[2], record[3]) if record is not None else None
+
+    @cached_property
+    def fish(self) -> List[dict]:
+        return orjson.loads(self.body)
+
+    @cached_property
+    def by_id(self) -> Dict[str, dict]:
+        return {item["_id"]: item for item in self.fish}
+
+
+def open_snapshot(path: Path) -> Optional[SharedCatalogSnapshot]:
+    """Map the published catalog; None while nothing was published"""
+    try:
+        return SharedCatalogSnapshot(path)
+    except (FileNotFoundError, ValueError, struct.error):
+        return None
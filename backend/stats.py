@@ -0,0 +1,102 @@
+from datetime import datetime
+from typing import Iterable, Optional
+
+# All counters live in a single document so /api/stats is one _id lookup
+STATS_ID = "global"
+
+HABITATS = ("mare", "fiume", "lago")
+
+
+async def record_catch(db, fish_id: str, habitat: Optional[str], count: int = 1):
+    """Count new catches of a fish in the counters document"""
+    inc = {
+        "total_catches": count,
+        f"catches_by_fish.{fish_id}": count,
+    }
+    if habitat:
+        inc[f"catches_by_habitat.{habitat}"] = count
+    await db.stats.update_one({"_id": STATS_ID}, {"$inc": inc}, upsert=True)
+
+
+async def record_species(db, habitats: Iterable[str], removed: Iterable[str] = ()):
+    """Count catalog species added to (and removed from) habitats in the counters document"""
+    inc = {}
+    changes = [(habitat, 1) for habitat in habitats] + [(habitat, -1) for habitat in removed]
+    for habitat, delta in changes:
+        inc["total_fish"] = inc.get("total_fish", 0) + delta
+        key = f"fish_by_habitat.{habitat}"
+        inc[key] = inc.get(key, 0) + delta
+    if inc:
+        await db.stats.update_one({"_id": STATS_ID}, {"$inc": inc}, upsert=True)
+
+
+async def get_counters(db, include_fish: bool = True) -> Optional[dict]:
+    """The counters document; without include_fish the per-species counts are not read"""
+    projection = None if include_fish else {"catches_by_fish": 0}
+    return await db.stats.find_one({"_id": STATS_ID}, projection)
+
+
+async def reconcile(db) -> dict:
+    """Rebuild the counters document from the fish and user_catches collections.
+
+    Catalog totals come from a single $facet over fish; catches are grouped
+    per fish_id and folded into habitats using the catalog. Increments that
+    land while this runs may be lost, so run it when writes are quiet.
+    """
+    facets = await db.fish.aggregate([
+        {"$facet": {
+            "total": [{"$count": "n"}],
+            "by_habitat": [{"$group": {"_id": "$habitat", "n": {"$sum": 1}}}],
+        }}
+    ]).to_list(1)
+    facet = facets[0] if facets else {"total": [], "by_habitat": []}
+
+    habitat_of = {}
+    async for fish in db.fish.find({}, {"habitat": 1}):
+        habitat_of[fish["_id"]] = fish.get("habitat")
+
+    catches_by_fish = {}
+    catches_by_habitat = {}
+    total_catches = 0
+    async for group in db.user_catches.aggregate([
+        {"$group": {"_id": "$fish_id", "n": {"$sum": 1}}}
+    ]):
+        total_catches += group["n"]
+        catches_by_fish[group["_id"]] = group["n"]
+        habitat = habitat_of.get(group["_id"])
+        if habitat:
+            catches_by_habitat[habitat] = catches_by_habitat.get(habitat, 0) + group["n"]
+
+    counters = {
+        "_id": STATS_ID,
+        "total_fish": facet["total"][0]["n"] if facet["total"] else 0,
+        "fish_by_habitat": {group["_id"]: group["n"] for group in facet["by_habitat"]},
+        "total_catches": total_catches,
+        "catches_by_fish": catches_by_fish,
+        "catches_by_habitat": catches_by_habitat,
+        "reconciled_at": datetime.utcnow(),
+    }
+    await db.stats.replace_one({"_id": STATS_ID}, counters, upsert=True)
+    return counters
+
+
+def to_response(counters: Optional[dict], include_fish: bool = False) -> dict:
+    """Shape the counters document like the /api/stats response.
+
+    Per-species catch counts grow with the catalog, so they are only added
+    with include_fish.
+    """
+    counters = counters or {}
+    fish_by_habitat = counters.get("fish_by_habitat", {})
+    catches_by_habitat = counters.get("catches_by_habitat", {})
+    response = {
+        "total_fish": counters.get("total_fish", 0),
+        "total_catches": counters.get("total_catches", 0),
+        "marine_fish": fish_by_habitat.get("mare", 0),
+        "river_fish": fish_by_habitat.get("fiume", 0),
+        "lake_fish": fish_by_habitat.get("lago", 0),
+        "catches_by_habitat": {habitat: catches_by_habitat.get(habitat, 0) for habitat in HABITATS},
+    }
+    if include_fish:
+        response["catches_by_fish"] = counters.get("catches_by_fish", {})
+    return response
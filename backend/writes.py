@@ -0,0 +1,91 @@
+import asyncio
+import time
+from typing import Callable, List, Tuple
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError, WriteConcernError, WriteError
+
+import metrics
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+insert_batch_size = metrics.registry.histogram(
+    "fishdex_coalesced_insert_batch_size", "Documents per coalesced insert_many", ("collection",),
+    buckets=BATCH_SIZE_BUCKETS,
+)
+insert_wait = metrics.registry.histogram(
+    "fishdex_coalesced_insert_wait_seconds", "Time from queueing a document to its insert result", ("collection",)
+)
+
+
+class InsertCoalescer:
+    """Group commit for single-document inserts into one collection.
+
+    Documents are buffered for up to window_ms (or until max_docs are
+    waiting) and written with one unordered insert_many. Each caller gets
+    the outcome of its own document: the _id on success, or the matching
+    DuplicateKeyError/WriteError, just as from insert_one. A window of 0
+    turns coalescing off and every call is a plain insert_one.
+    """
+
+    def __init__(self, get_collection: Callable, window_ms: float = 0, max_docs: int = 256):
+        self._get_collection = get_collection
+        self.window = window_ms / 1000
+        self.max_docs = max_docs
+        self._pending: List[Tuple[dict, asyncio.Future, float]] = []
+        self._timer = None
+        self._flushes = set()
+
+    async def insert_one(self, document: dict):
+        collection = self._get_collection()
+        if self.window <= 0:
+            return (await collection.insert_one(document)).inserted_id
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((document, future, time.perf_counter()))
+        if len(self._pending) >= self.max_docs:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._start_flush)
+        return await future
+
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._flush(batch))
+            # Keep a reference until the write finishes
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch):
+        collection = self._get_collection()
+        insert_batch_size.observe(len(batch), collection.name)
+        outcomes = [None] * len(batch)
+        try:
+            await collection.insert_many([document for document, _, _ in batch], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                error_class = DuplicateKeyError if error.get("code") == 11000 else WriteError
+                outcomes[error["index"]] = error_class(error.get("errmsg", "Write failed"), error.get("code"), error)
+            if e.details.get("writeConcernErrors"):
+                # The remaining documents may or may not have been written
+                concern = e.details["writeConcernErrors"][0]
+                for index, outcome in enumerate(outcomes):
+                    if outcome is None:
+                        outcomes[index] = WriteConcernError(concern.get("errmsg"), concern.get("code"), concern)
+        except Exception as e:
+            outcomes = [e] * len(batch)
+
+        now = time.perf_counter()
+        for (document, future, queued_at), outcome in zip(batch, outcomes):
+            insert_wait.observe(now - queued_at, collection.name)
+            if future.done():
+                # The caller went away (e.g. the request was cancelled)
+                continue
+            if outcome is None:
+                future.set_result(document["_id"])
+            else:
+                future.set_exception(outcome)
@@ -1,4 +1,5 @@
 import { create } from 'zustand';
+import { Platform } from 'react-native';
 import AsyncStorage from '@react-native-async-storage/async-storage';
 
 export interface Fish {
@@ -9,6 +10,7 @@ export interface Fish {
   description: string;
   referenceImage: string;
   isUnlocked: boolean;
+  ordinal?: number | null;
   userCatch?: {
     photo: string;
     location: string;
@@ -17,6 +19,27 @@ export interface Fish {
   };
 }
 
+// Cattura in attesa di essere inviata al server (modalità offline). La foto
+// inline viene caricata a parte e sostituita dal digest in photo_blob
+interface PendingCatch extends Omit<NonNullable<Fish['userCatch']>, 'photo'> {
+  photo?: string;
+  photo_blob?: string;
+  idempotency_key: string;
+  fish_id: string;
+  user_id?: string;
+}
+
+// Cattura rifiutata dal server: non viene più inviata, resta solo per diagnosi
+interface FailedCatch extends PendingCatch {
+  error: string;
+}
+
+// Copia locale del catalogo con la revisione a cui corrisponde
+interface CachedCatalog {
+  revision: number;
+  fish: Fish[];
+}
+
 interface FishStore {
   fish: Fish[];
   loading: boolean;
@@ -24,9 +47,88 @@ interface FishStore {
   loadFish: () => Promise<void>;
   unlockFish: (fishId: string, catchData: NonNullable<Fish['userCatch']>) => Promise<boolean>;
   resetProgress: () => Promise<void>;
+  syncPendingCatches: () => Promise<void>;
 }
 
 const API_BASE_URL = process.env.EXPO_PUBLIC_BACKEND_URL;
+const PENDING_CATCHES_KEY = 'pendingCatches';
+const CATALOG_CACHE_KEY = 'catalogCache';
+const FAILED_CATCHES_KEY = 'failedCatches';
+const USER_ID_KEY = 'userId';
+const SYNC_BATCH_SIZE = 100;
+// Byte massimi per richiesta di sincronizzazione, molto sotto il limite di 1 MB del server per i corpi JSON
+const SYNC_BATCH_BYTES = 256 * 1024;
+
+const newIdempotencyKey = () =>
+  `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+
+// Identificativo anonimo del dispositivo, usato per i progressi sul server.
+// Vive in AsyncStorage: una reinstallazione dell'app ne crea uno nuovo
+const getUserId = async () => {
+  let userId = await AsyncStorage.getItem(USER_ID_KEY);
+  if (!userId) {
+    userId = `u-${newIdempotencyKey()}`;
+    await AsyncStorage.setItem(USER_ID_KEY, userId);
+  }
+  return userId;
+};
+
+// Ordinali dei pesci sbloccati secondo la bitmap dei progressi sul server
+const fetchUnlockedOrdinals = async (): Promise<Set<number>> => {
+  const unlocked = new Set<number>();
+  try {
+    const userId = await getUserId();
+    const response = await fetch(`${API_BASE_URL}/api/users/${userId}/progress`);
+    if (!response.ok) return unlocked;
+    const { bitmap } = await response.json();
+    const bytes = atob(bitmap);
+    for (let i = 0; i < bytes.length; i++) {
+      const byte = bytes.charCodeAt(i);
+      for (let bit = 0; bit < 8; bit++) {
+        if (byte & (1 << bit)) unlocked.add(i * 8 + bit);
+      }
+    }
+  } catch (error) {
+    // Senza rete restano validi i progressi salvati sul dispositivo
+    console.error('Errore caricamento progressi:', error);
+  }
+  return unlocked;
+};
+
+// Carica una foto inline (data: URL) con POST /api/blobs. Restituisce il
+// digest, null se il server la rifiuta; lancia un errore se conviene riprovare
+const uploadPhoto = async (photo: string): Promise<string | null> => {
+  const form = new FormData();
+  if (Platform.OS === 'web') {
+    form.append('file', await (await fetch(photo)).blob(), 'cattura.jpg');
+  } else {
+    // React Native legge il contenuto dall'URI, anche da un data: URL
+    form.append('file', { uri: photo, name: 'cattura.jpg', type: 'image/jpeg' } as any);
+  }
+  const response = await fetch(`${API_BASE_URL}/api/blobs`, { method: 'POST', body: form });
+  if (response.ok) return (await response.json()).blob;
+  if (response.status === 400 || response.status === 413) return null;
+  throw new Error(`Caricamento foto non riuscito (${response.status})`);
+};
+
+// Divide le catture in richieste da al massimo SYNC_BATCH_SIZE catture e SYNC_BATCH_BYTES byte
+const syncBatches = (catches: PendingCatch[]): PendingCatch[][] => {
+  const batches: PendingCatch[][] = [];
+  let batch: PendingCatch[] = [];
+  let bytes = 0;
+  for (const item of catches) {
+    const size = JSON.stringify(item).length;
+    if (batch.length > 0 && (batch.length >= SYNC_BATCH_SIZE || bytes + size > SYNC_BATCH_BYTES)) {
+      batches.push(batch);
+      batch = [];
+      bytes = 0;
+    }
+    batch.push(item);
+    bytes += size;
+  }
+  if (batch.length > 0) batches.push(batch);
+  return batches;
+};
 
 export const useFishStore = create<FishStore>((set, get) => ({
   fish: [],
@@ -36,24 +138,55 @@ export const useFishStore = create<FishStore>((set, get) => ({
   loadFish: async () => {
     set({ loading: true, error: null });
     try {
-      // Carica pesci dal server
-      const response = await fetch(`${API_BASE_URL}/api/fish`);
+      // Scarica solo le modifiche al catalogo dall'ultima revisione salvata
+      const savedCatalog = await AsyncStorage.getItem(CATALOG_CACHE_KEY);
+      const cachedCatalog: CachedCatalog | null = savedCatalog ? JSON.parse(savedCatalog) : null;
+      const query = cachedCatalog ? `?since=${cachedCatalog.revision}` : '';
+
+      const response = await fetch(`${API_BASE_URL}/api/fish/changes${query}`);
       if (!response.ok) throw new Error('Errore nel caricamento dei pesci');
       
-      const serverFish = await response.json();
+      const changes = await response.json();
+      let serverFish: Fish[];
+      if (changes.full || !cachedCatalog) {
+        serverFish = changes.upserted;
+      } else {
+        const changedIds = new Set<string>([
+          ...changes.deleted,
+          ...changes.upserted.map((f: Fish) => f._id),
+        ]);
+        serverFish = [
+          ...cachedCatalog.fish.filter(f => !changedIds.has(f._id)),
+          ...changes.upserted,
+        ];
+      }
+      if (changes.full || !cachedCatalog || changes.revision !== cachedCatalog.revision) {
+        await AsyncStorage.setItem(
+          CATALOG_CACHE_KEY,
+          JSON.stringify({ revision: changes.revision, fish: serverFish })
+        );
+      }
       
       // Carica progressi dell'utente da AsyncStorage
       const savedProgress = await AsyncStorage.getItem('fishProgress');
       const userProgress = savedProgress ? JSON.parse(savedProgress) : {};
       
+      const serverUnlocked = await fetchUnlockedOrdinals();
+      
       // Combina dati server con progressi utente
       const combinedFish = serverFish.map((fish: Fish) => ({
         ...fish,
-        isUnlocked: userProgress[fish._id]?.isUnlocked || false,
+        isUnlocked:
+          userProgress[fish._id]?.isUnlocked ||
+          (fish.ordinal != null && serverUnlocked.has(fish.ordinal)) ||
+          false,
         userCatch: userProgress[fish._id]?.userCatch || null,
       }));
       
       set({ fish: combinedFish, loading: false });
+
+      // Invia le catture rimaste in coda durante l'ultima sessione offline
+      get().syncPendingCatches();
     } catch (error) {
       console.error('Errore caricamento pesci:', error);
       set({ error: 'Errore nel caricamento dei pesci', loading: false });
@@ -84,14 +217,18 @@ export const useFishStore = create<FishStore>((set, get) => ({
       
       await AsyncStorage.setItem('fishProgress', JSON.stringify(userProgress));
       
-      // Salva anche sul server
-      await fetch(`${API_BASE_URL}/api/fish/${fishId}/unlock`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify(catchData),
+      // Accoda la cattura e prova a sincronizzarla con il server
+      const savedPending = await AsyncStorage.getItem(PENDING_CATCHES_KEY);
+      const pending: PendingCatch[] = savedPending ? JSON.parse(savedPending) : [];
+      pending.push({
+        ...catchData,
+        fish_id: fishId,
+        user_id: await getUserId(),
+        idempotency_key: newIdempotencyKey(),
       });
+      await AsyncStorage.setItem(PENDING_CATCHES_KEY, JSON.stringify(pending));
+
+      await get().syncPendingCatches();
       
       return true;
     } catch (error) {
@@ -100,9 +237,94 @@ export const useFishStore = create<FishStore>((set, get) => ({
     }
   },
 
+  syncPendingCatches: async () => {
+    const uploaded = new Map<string, string>();
+    const synced = new Set<string>();
+    const failed = new Map<string, string>();
+    try {
+      const savedPending = await AsyncStorage.getItem(PENDING_CATCHES_KEY);
+      const pending: PendingCatch[] = savedPending ? JSON.parse(savedPending) : [];
+      if (pending.length === 0) return;
+
+      // Prima le foto: inline renderebbero le richieste troppo grandi
+      const ready: PendingCatch[] = [];
+      for (const item of pending) {
+        if (item.photo_blob || !item.photo?.startsWith('data:')) {
+          ready.push(item);
+          continue;
+        }
+        const digest = await uploadPhoto(item.photo);
+        if (digest === null) {
+          failed.set(item.idempotency_key, 'Foto rifiutata dal server');
+          continue;
+        }
+        uploaded.set(item.idempotency_key, digest);
+        const { photo, ...rest } = item;
+        ready.push({ ...rest, photo_blob: digest });
+      }
+
+      for (const batch of syncBatches(ready)) {
+        const response = await fetch(`${API_BASE_URL}/api/catches/batch`, {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+          },
+          body: JSON.stringify({ catches: batch }),
+        });
+        if (!response.ok) break;
+
+        const { results } = await response.json();
+        for (const result of results) {
+          // I duplicati sono già sul server: un nuovo invio non servirebbe
+          if (result.status === 'created' || result.status === 'duplicate') {
+            synced.add(result.idempotency_key);
+          } else if (result.status === 'error') {
+            // Un nuovo invio verrebbe rifiutato allo stesso modo
+            failed.set(result.idempotency_key, String(result.detail ?? 'Errore'));
+          }
+        }
+      }
+    } catch (error) {
+      // Offline: la coda verrà inviata al prossimo tentativo
+      console.error('Errore sincronizzazione catture:', error);
+    }
+
+    try {
+      if (uploaded.size === 0 && synced.size === 0 && failed.size === 0) return;
+      // Rilegge la coda: nel frattempo potrebbero essere state aggiunte catture
+      const latestPending = await AsyncStorage.getItem(PENDING_CATCHES_KEY);
+      const remaining: PendingCatch[] = [];
+      const parked: FailedCatch[] = [];
+      for (const item of (latestPending ? JSON.parse(latestPending) : []) as PendingCatch[]) {
+        const key = item.idempotency_key;
+        if (synced.has(key)) continue;
+        if (failed.has(key)) {
+          parked.push({ ...item, error: failed.get(key)! });
+        } else if (uploaded.has(key)) {
+          // La foto è già sul server: al prossimo tentativo basta il digest
+          const { photo, ...rest } = item;
+          remaining.push({ ...rest, photo_blob: uploaded.get(key) });
+        } else {
+          remaining.push(item);
+        }
+      }
+      if (parked.length > 0) {
+        const savedFailed = await AsyncStorage.getItem(FAILED_CATCHES_KEY);
+        const failedCatches: FailedCatch[] = savedFailed ? JSON.parse(savedFailed) : [];
+        await AsyncStorage.setItem(FAILED_CATCHES_KEY, JSON.stringify([...failedCatches, ...parked]));
+      }
+      await AsyncStorage.setItem(PENDING_CATCHES_KEY, JSON.stringify(remaining));
+    } catch (error) {
+      console.error('Errore salvataggio coda catture:', error);
+    }
+  },
+
   resetProgress: async () => {
     try {
-      await AsyncStorage.removeItem('fishProgress');
+      // I progressi sul server sono legati all'identificativo anonimo: con uno
+      // nuovo la bitmap riparte da zero. Anche le catture in coda vengono
+      // scartate, altrimenti al prossimo invio sbloccherebbero di nuovo i pesci
+      await AsyncStorage.multiRemove(['fishProgress', PENDING_CATCHES_KEY, USER_ID_KEY]);
       const { fish } = get();
       const resetFish = fish.map(f => ({
         ...f,
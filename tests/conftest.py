@@ -0,0 +1,32 @@
+import asyncio
+import os
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Set before server.py is imported anywhere: load_dotenv() does not override
+# variables that already exist, so the suite never touches a real database
+os.environ["MONGO_URL"] = "memory://"
+os.environ.setdefault("BLOB_DIR", tempfile.mkdtemp(prefix="fishdex-test-blobs-"))
+os.environ.setdefault("WRITE_RATE_PER_SECOND", "0")
+
+from repository import MongoSettings, Repository  # noqa: E402
+
+
+def run(coro):
+    """Run a coroutine to completion on a fresh event loop"""
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def db():
+    """An empty in-memory database of its own"""
+    repository = Repository(MongoSettings(url="memory://", db_name=f"test_{uuid.uuid4().hex}"))
+    yield repository
+    repository.close()
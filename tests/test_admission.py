@@ -0,0 +1,165 @@
+import asyncio
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from admission import AdmissionMiddleware, TokenBucket
+from tests.conftest import run
+
+
+class Body(BaseModel):
+    text: str
+
+
+def make_client(max_body_bytes=1000, rate=0.0, burst=1.0, trust_forwarded=False):
+    app = FastAPI()
+
+    @app.post("/json")
+    async def post_json(body: Body):
+        return {"length": len(body.text)}
+
+    @app.post("/stream")
+    async def post_stream(request: Request):
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+        return {"length": size}
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+        return {"length": size}
+
+    @app.get("/read")
+    async def read():
+        return {"ok": True}
+
+    app.add_middleware(
+        AdmissionMiddleware,
+        max_body_bytes=max_body_bytes,
+        rate=rate,
+        burst=burst,
+        max_inflight_writes=4,
+        queue_timeout=0.1,
+        trust_forwarded=trust_forwarded,
+        upload_paths=["/upload"],
+        max_upload_bytes=10 * max_body_bytes,
+        max_inflight_uploads=2,
+    )
+    return TestClient(app)
+
+
+def chunked(*parts):
+    # A generator body is sent without Content-Length
+    def body():
+        yield from parts
+    return body()
+
+
+def test_token_bucket_allows_the_burst_then_waits():
+    bucket = TokenBucket(rate=1.0, burst=2.0)
+    assert bucket.take("a") == 0
+    assert bucket.take("a") == 0
+    assert bucket.take("a") > 0
+    # Buckets are per key
+    assert bucket.take("b") == 0
+
+
+def test_declared_length_over_the_cap_is_413():
+    client = make_client()
+    response = client.post("/json", json={"text": "x" * 2000})
+    assert response.status_code == 413
+
+
+def test_chunked_json_body_over_the_cap_is_413():
+    client = make_client()
+    response = client.post(
+        "/json",
+        content=chunked(b'{"text": "' + b"x" * 800, b"x" * 800 + b'"}'),
+        headers={"content-type": "application/json"},
+    )
+    assert response.status_code == 413
+    assert response.json() == {"detail": "Request body too large"}
+
+
+def test_chunked_stream_over_the_cap_is_413():
+    client = make_client()
+    response = client.post("/stream", content=chunked(b"x" * 800, b"x" * 800))
+    assert response.status_code == 413
+
+
+def test_bodies_under_the_cap_pass():
+    client = make_client()
+    assert client.post("/json", json={"text": "hello"}).json() == {"length": 5}
+    assert client.post("/stream", content=chunked(b"x" * 400, b"x" * 400)).json() == {"length": 800}
+
+
+def test_writes_over_the_rate_are_429_with_retry_after():
+    client = make_client(rate=1.0, burst=2.0)
+    statuses = [client.post("/json", json={"text": "x"}).status_code for _ in range(3)]
+    assert statuses == [200, 200, 429]
+    limited = client.post("/json", json={"text": "x"})
+    assert int(limited.headers["retry-after"]) >= 1
+    # Reads are never rate limited
+    assert client.get("/read").status_code == 200
+
+
+def test_forwarded_clients_get_their_own_bucket():
+    client = make_client(rate=1.0, burst=1.0, trust_forwarded=True)
+    first = client.post("/json", json={"text": "x"}, headers={"x-forwarded-for": "10.0.0.1"})
+    second = client.post("/json", json={"text": "x"}, headers={"x-forwarded-for": "10.0.0.2, 172.16.0.1"})
+    again = client.post("/json", json={"text": "x"}, headers={"x-forwarded-for": "10.0.0.1"})
+    assert (first.status_code, second.status_code, again.status_code) == (200, 200, 429)
+
+
+def test_upload_paths_get_the_upload_limit():
+    client = make_client()
+    assert client.post("/upload", content=b"x" * 5000).json() == {"length": 5000}
+    assert client.post("/upload", content=chunked(b"x" * 5000, b"x" * 5000)).json() == {"length": 10000}
+    assert client.post("/upload", content=chunked(b"x" * 6000, b"x" * 6000)).status_code == 413
+    assert client.post("/upload", content=b"x" * 12000).status_code == 413
+    # Other routes keep the small limit
+    assert client.post("/stream", content=b"x" * 5000).status_code == 413
+
+
+def test_uploads_do_not_take_write_slots():
+    release = asyncio.Event()
+
+    async def app(scope, receive, send):
+        if scope["path"] == "/upload":
+            await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    middleware = AdmissionMiddleware(
+        app, max_body_bytes=1000, rate=0.0, burst=1.0, max_inflight_writes=1, queue_timeout=0.05,
+        upload_paths=["/upload"], max_upload_bytes=10000, max_inflight_uploads=1,
+    )
+
+    async def request(path):
+        statuses = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                statuses.append(message["status"])
+
+        scope = {"type": "http", "method": "POST", "path": path, "headers": [], "client": ("10.0.0.1", 1)}
+        await middleware(scope, receive, send)
+        return statuses[0]
+
+    async def scenario():
+        slow_upload = asyncio.ensure_future(request("/upload"))
+        await asyncio.sleep(0.01)
+        write = await request("/unlock")
+        second_upload = await request("/upload")
+        release.set()
+        return write, second_upload, await slow_upload
+
+    # A stuck upload leaves writes alone; only other uploads wait for it
+    assert run(scenario()) == (200, 503, 200)
@@ -0,0 +1,115 @@
+import hashlib
+import threading
+
+import pytest
+
+from blobstore import BlobStore, BlobTooLarge, InvalidUpload, parse_range
+from tests.conftest import run
+
+BOUNDARY = "fishdexboundary"
+JPEG = b"\xff\xd8\xff\xe0" + b"x" * 5000
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(tmp_path, max_bytes=10_000)
+
+
+def multipart(*parts):
+    body = b""
+    for headers, data in parts:
+        body += f"--{BOUNDARY}\r\n{headers}\r\n\r\n".encode() + data + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+def file_part(data, name="photo"):
+    return f'Content-Disposition: form-data; name="{name}"; filename="catch.jpg"', data
+
+
+def field_part(value):
+    return 'Content-Disposition: form-data; name="note"', value
+
+
+async def chunks(body, size=7):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+def put(store, body, content_type=f"multipart/form-data; boundary={BOUNDARY}"):
+    return run(store.put_multipart(content_type, chunks(body)))
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=990-5000", (990, 999)),
+    ("bytes=0-1,5-6", None),
+    ("items=0-1", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=5-2", "bytes=-0", "bytes=a-b"])
+def test_unsatisfiable_ranges(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
+
+
+def test_multipart_stores_the_first_file_part(store):
+    body = multipart(field_part(b"ignored"), file_part(JPEG), file_part(b"second file"))
+    digest, size = put(store, body)
+    assert digest == hashlib.sha256(JPEG).hexdigest()
+    assert size == len(JPEG)
+    assert store.path_for(digest).read_bytes() == JPEG
+    assert store.content_type(digest) == "image/jpeg"
+    assert b"".join(store.iter_range(digest, 4, 9)) == JPEG[4:10]
+
+
+def test_same_content_is_stored_once(store):
+    first, _ = put(store, multipart(file_part(JPEG)))
+    second, _ = put(store, multipart(file_part(JPEG)))
+    assert first == second
+    assert list(store.tmp_dir.iterdir()) == []
+
+
+def test_oversized_upload_leaves_nothing_behind(store):
+    with pytest.raises(BlobTooLarge):
+        put(store, multipart(file_part(b"x" * 20_000)))
+    assert list(store.tmp_dir.iterdir()) == []
+
+
+@pytest.mark.parametrize("body, content_type", [
+    (multipart(field_part(b"no file")), f"multipart/form-data; boundary={BOUNDARY}"),
+    (multipart(file_part(JPEG)), "application/json"),
+    (multipart(file_part(JPEG)), "multipart/form-data"),
+])
+def test_invalid_uploads(store, body, content_type):
+    with pytest.raises(InvalidUpload):
+        put(store, body, content_type)
+
+
+def test_describe(store):
+    digest, size = put(store, multipart(file_part(JPEG)))
+    assert store.describe(digest) == (size, "image/jpeg")
+    assert store.describe("0" * 64) is None
+    assert store.describe("../etc/passwd") is None
+
+
+def test_disk_writes_run_off_the_event_loop(store, monkeypatch):
+    threads = set()
+    write = store.writer
+    def tracking_writer():
+        writer = write()
+        original = writer.write
+        def tracked(data):
+            threads.add(threading.get_ident())
+            original(data)
+        writer.write = tracked
+        return writer
+    monkeypatch.setattr(store, "writer", tracking_writer)
+    put(store, multipart(file_part(JPEG)))
+    assert threads and threading.get_ident() not in threads
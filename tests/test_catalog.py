@@ -0,0 +1,85 @@
+import asyncio
+
+import catalog
+from tests.conftest import run
+
+
+def test_etag_matches_weak_lists_and_wildcards():
+    etag = '"abc"'
+    assert catalog.etag_matches('"abc"', etag)
+    assert catalog.etag_matches('W/"abc"', etag)
+    assert catalog.etag_matches('"old", W/"abc"', etag)
+    assert catalog.etag_matches(" * ", etag)
+    assert not catalog.etag_matches('"abcd"', etag)
+    assert not catalog.etag_matches("", etag)
+    assert not catalog.etag_matches(None, etag)
+
+
+def test_cached_response_is_empty_304_when_current():
+    snapshot = catalog.CatalogSnapshot(1, [{"_id": "a", "name": "Luccio"}])
+    fresh = catalog.cached_response(snapshot.body, snapshot.etag, None, 60)
+    current = catalog.cached_response(snapshot.body, snapshot.etag, snapshot.etag, 60)
+    assert fresh.status_code == 200 and fresh.body == snapshot.body
+    assert current.status_code == 304 and current.body == b""
+    assert current.headers["etag"] == snapshot.etag
+
+
+def test_snapshot_etags_follow_the_content():
+    first = catalog.CatalogSnapshot(1, [{"_id": "a", "name": "Luccio"}])
+    same = catalog.CatalogSnapshot(2, [{"_id": "a", "name": "Luccio"}])
+    changed = catalog.CatalogSnapshot(3, [{"_id": "a", "name": "Persico"}])
+    assert first.etag == same.etag
+    assert first.item_etags["a"] == same.item_etags["a"]
+    assert first.etag != changed.etag
+
+
+def test_concurrent_misses_share_one_load():
+    loads = []
+
+    async def loader():
+        loads.append(True)
+        await asyncio.sleep(0.01)
+        return [{"_id": "a", "name": "Luccio"}]
+
+    async def scenario():
+        cache = catalog.CatalogCache(loader)
+        snapshots = await asyncio.gather(*(cache.get() for _ in range(10)))
+        cached = await cache.get()
+        cache.invalidate()
+        reloaded = await cache.get()
+        return snapshots, cached, reloaded
+
+    snapshots, cached, reloaded = run(scenario())
+    assert all(snapshot is snapshots[0] for snapshot in snapshots)
+    assert cached is snapshots[0]
+    assert reloaded is not snapshots[0]
+    assert len(loads) == 2
+
+
+def test_version_check_keeps_the_snapshot_and_survives_errors():
+    version = {"value": 1, "fail": False}
+    loads = []
+
+    async def loader():
+        loads.append(True)
+        return [{"_id": "a", "name": "Luccio"}]
+
+    async def version_reader():
+        if version["fail"]:
+            raise ConnectionError("Mongo went away")
+        return version["value"]
+
+    async def scenario():
+        cache = catalog.CatalogCache(loader, version_reader, refresh_interval=0)
+        first = await cache.get()
+        unchanged = await cache.get()
+        version["fail"] = True
+        while_down = await cache.get()
+        version.update(value=2, fail=False)
+        moved = await cache.get()
+        return first, unchanged, while_down, moved
+
+    first, unchanged, while_down, moved = run(scenario())
+    assert unchanged is first and while_down is first
+    assert moved.version == 2
+    assert len(loads) == 2
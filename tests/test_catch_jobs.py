@@ -0,0 +1,164 @@
+import uuid
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+import geo
+import recommend
+import server
+from tests.conftest import run
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    async def seed():
+        await server.initialize_fish_database()
+        await server.changelog.assign_missing_ordinals(server.db)
+        server.catalog_cache.invalidate()
+        return (await server.catalog_cache.get()).fish
+
+    return run(seed())
+
+
+def stored_catch(fish: dict, user_id: str) -> dict:
+    return {
+        "_id": str(uuid.uuid4()),
+        "fish_id": fish["_id"],
+        "user_id": user_id,
+        "location": "Lago di Garda",
+        "equipment": "Spinning",
+        "date": "16/10/2026",
+        "caught_at": datetime(2026, 10, 16),
+        "created_at": datetime.utcnow(),
+        "geo": geo.point(45.6, 10.6),
+    }
+
+
+async def counts(fish: dict, user_id: str) -> dict:
+    db = server.db
+    stats = await db.stats.find_one({"_id": server.stats.STATS_ID}) or {}
+    rollup = await db.catch_rollups.find_one({"_id": "day:2026-10-16"}) or {}
+    tile = await db.catch_tiles.find_one({"_id": geo.tile_id(0, 0, 0)}) or {}
+    affinity = await db.species_affinity.find_one({"_id": fish["ordinal"]}) or {}
+    user = await server.progress.get_progress(db, user_id)
+    return {
+        "stats": stats.get("catches_by_fish", {}).get(fish["_id"], 0),
+        "rollup": rollup.get("by_fish", {}).get(fish["_id"], 0),
+        "tile": tile.get("total", 0),
+        "catchers": affinity.get("catchers", 0),
+        "unlocked": user["unlocked"],
+    }
+
+
+def test_a_retried_job_counts_each_catch_once(catalog, monkeypatch):
+    fish = catalog[5]
+    user_id = f"u-{uuid.uuid4().hex}"
+    catch = stored_catch(fish, user_id)
+    record_catches = recommend.record_catches
+    calls = []
+
+    async def fail_once(*args, **kwargs):
+        calls.append(True)
+        if len(calls) == 1:
+            raise RuntimeError("Mongo went away")
+        return await record_catches(*args, **kwargs)
+
+    monkeypatch.setattr(recommend, "record_catches", fail_once)
+
+    async def scenario():
+        before = await counts(fish, user_id)
+        await server.db.user_catches.insert_one(dict(catch))
+        payload = {"catches": [server.created_catch(catch)]}
+        with pytest.raises(RuntimeError):
+            await server.process_created_catches(payload)
+        await server.process_created_catches(payload)
+        # A duplicate delivery after success changes nothing either
+        await server.process_created_catches(payload)
+        return before, await counts(fish, user_id)
+
+    before, after = run(scenario())
+    assert after["stats"] == before["stats"] + 1
+    assert after["rollup"] == before["rollup"] + 1
+    assert after["tile"] == before["tile"] + 1
+    assert after["unlocked"] == 1
+    # The first unlock survives the retry and still counts the user as a catcher
+    assert after["catchers"] == before["catchers"] + 1
+
+
+def test_job_bookkeeping_is_not_exported(catalog):
+    catch = stored_catch(catalog[6], f"u-{uuid.uuid4().hex}")
+
+    async def scenario():
+        await server.db.user_catches.insert_one(dict(catch))
+        await server.process_created_catches({"catches": [server.created_catch(catch)]})
+        stored = await server.db.user_catches.find_one({"_id": catch["_id"]})
+        projection = {field: 0 for field in server.export.JOB_FIELDS}
+        exported = await server.db.user_catches.find_one({"_id": catch["_id"]}, projection)
+        return stored, exported
+
+    stored, exported = run(scenario())
+    assert set(stored["applied"]) == {"rollups", "heatmap", "stats", "progress", "recommendations"}
+    assert stored["first_unlock"] is True
+    assert "applied" not in exported and "first_unlock" not in exported
+
+
+def test_job_summary_needs_the_admin_token(monkeypatch):
+    client = TestClient(server.app)
+    assert client.get("/api/admin/jobs").status_code == 403
+    monkeypatch.setattr(server, "PROFILE_TOKEN", "s3cret")
+    assert client.get("/api/admin/jobs", headers={"X-Debug-Profile": "guess"}).status_code == 403
+    response = client.get("/api/admin/jobs", headers={"X-Debug-Profile": "s3cret"})
+    assert response.status_code == 200
+
+
+def test_unlock_survives_a_failed_enqueue_and_the_sweep_queues_it(catalog, monkeypatch):
+    fish = catalog[7]
+    user_id = f"u-{uuid.uuid4().hex}"
+    enqueue = server.job_queue.enqueue
+
+    async def unavailable(*args, **kwargs):
+        raise ConnectionError("jobs collection unavailable")
+
+    monkeypatch.setattr(server.job_queue, "enqueue", unavailable)
+    response = TestClient(server.app).post(f"/api/fish/{fish['_id']}/unlock", json={
+        "location": "Lago di Garda", "equipment": "Spinning", "date": "16/10/2026", "user_id": user_id,
+    })
+    assert response.status_code == 200
+    monkeypatch.setattr(server.job_queue, "enqueue", enqueue)
+    monkeypatch.setattr(server, "PENDING_JOB_GRACE_SECONDS", -1)
+
+    async def scenario():
+        catch = await server.db.user_catches.find_one({"user_id": user_id})
+        missing = await server.db.jobs.find_one({"_id": catch["pending_job"]})
+        swept = await server.sweep_pending_jobs()
+        job = await server.db.jobs.find_one({"_id": catch["pending_job"]})
+        again = await server.sweep_pending_jobs()
+        cleared = await server.db.user_catches.find_one({"_id": catch["_id"]})
+        return catch, missing, swept, job, again, cleared
+
+    catch, missing, swept, job, again, cleared = run(scenario())
+    assert missing is None
+    assert swept == 1
+    assert [queued["_id"] for queued in job["payload"]["catches"]] == [catch["_id"]]
+    assert again == 0
+    assert "pending_job" not in cleared
+
+
+def test_sweep_leaves_queued_jobs_alone(catalog, monkeypatch):
+    monkeypatch.setattr(server, "PENDING_JOB_GRACE_SECONDS", -1)
+    catch = stored_catch(catalog[8], f"u-{uuid.uuid4().hex}")
+    job_id = str(uuid.uuid4())
+
+    async def scenario():
+        await server.db.user_catches.insert_one(dict(catch, pending_job=job_id))
+        await server.enqueue_created_catches([catch], job_id)
+        # Enqueueing under the same id again adds nothing
+        await server.enqueue_created_catches([catch], job_id)
+        jobs = await server.db.jobs.count_documents({"_id": job_id})
+        swept = await server.sweep_pending_jobs()
+        return jobs, swept, await server.db.user_catches.find_one({"_id": catch["_id"]})
+
+    jobs, swept, stored = run(scenario())
+    assert (jobs, swept) == (1, 0)
+    assert "pending_job" not in stored
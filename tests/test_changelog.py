@@ -0,0 +1,101 @@
+import asyncio
+
+import changelog
+from tests.conftest import run
+
+
+async def write_revision(db, upserted=(), deleted=(), name=None):
+    """One catalog write the way the importer does it"""
+    revision = await changelog.next_revision(db)
+    for fish_id in upserted:
+        await db.fish.update_one(
+            {"_id": fish_id}, {"$set": {"name": name or fish_id, "_rev": revision}}, upsert=True
+        )
+    for fish_id in deleted:
+        await db.fish.delete_one({"_id": fish_id})
+    await changelog.log_changes(db, revision, upserted=upserted, deleted=deleted)
+    await changelog.commit_revision(db, revision)
+    return revision
+
+
+def test_changes_since_returns_latest_operation_per_species(db):
+    async def scenario():
+        first = await write_revision(db, upserted=["a", "b"])
+        await write_revision(db, upserted=["c"])
+        await write_revision(db, deleted=["b"])
+        return first, await changelog.changes_since(db, first)
+
+    first, changes = run(scenario())
+    assert changes["revision"] == first + 2
+    assert [fish["_id"] for fish in changes["upserted"]] == ["c"]
+    assert changes["deleted"] == ["b"]
+
+
+def test_changes_since_current_revision_is_empty(db):
+    async def scenario():
+        revision = await write_revision(db, upserted=["a"])
+        return revision, await changelog.changes_since(db, revision)
+
+    revision, changes = run(scenario())
+    assert changes == {"revision": revision, "upserted": [], "deleted": []}
+
+
+def test_changes_since_outside_the_log_is_none(db):
+    async def scenario():
+        revision = await write_revision(db, upserted=["a"])
+        ahead = await changelog.changes_since(db, revision + 1)
+        await db.catalog_meta.update_one({"_id": changelog.META_ID}, {"$set": {"log_start": revision}})
+        behind = await changelog.changes_since(db, revision - 1)
+        return ahead, behind
+
+    ahead, behind = run(scenario())
+    assert ahead is None
+    assert behind is None
+
+
+def test_allocated_revision_is_invisible_until_committed(db):
+    async def scenario():
+        committed = await write_revision(db, upserted=["a"], name="old")
+        revision = await changelog.next_revision(db)
+        seen_while_writing = (
+            await changelog.current_revision(db),
+            (await changelog.changes_since(db, committed))["revision"],
+        )
+        await db.fish.update_one({"_id": "a"}, {"$set": {"name": "new", "_rev": revision}})
+        await changelog.log_changes(db, revision, upserted=["a"])
+        await changelog.commit_revision(db, revision)
+        return committed, revision, seen_while_writing, await changelog.changes_since(db, committed)
+
+    committed, revision, seen_while_writing, changes = run(scenario())
+    assert seen_while_writing == (committed, committed)
+    assert changes["revision"] == revision
+    assert [fish["name"] for fish in changes["upserted"]] == ["new"]
+
+
+def test_revisions_commit_in_order(db):
+    async def scenario():
+        earlier = await changelog.next_revision(db)
+        later = await changelog.next_revision(db)
+        # The later writer finishes first and has to wait for the earlier one
+        commit_later = asyncio.ensure_future(changelog.commit_revision(db, later))
+        await asyncio.sleep(0.2)
+        waiting = (not commit_later.done(), await changelog.current_revision(db))
+        await changelog.commit_revision(db, earlier)
+        await commit_later
+        return earlier, later, waiting, await changelog.current_revision(db)
+
+    earlier, later, waiting, final = run(scenario())
+    assert waiting == (True, earlier - 1)
+    assert final == later
+
+
+def test_catalogs_from_before_commits_count_as_committed(db):
+    async def scenario():
+        await db.catalog_meta.insert_one({"_id": changelog.META_ID, "revision": 7, "log_start": 0})
+        before = await changelog.current_revision(db)
+        revision = await changelog.next_revision(db)
+        during = await changelog.current_revision(db)
+        await changelog.commit_revision(db, revision)
+        return before, during, await changelog.current_revision(db)
+
+    assert run(scenario()) == (7, 7, 8)
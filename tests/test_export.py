@@ -0,0 +1,74 @@
+import csv
+import io
+from datetime import datetime, timedelta, timezone
+
+import orjson
+from fastapi.testclient import TestClient
+
+import export
+import server
+from tests.conftest import run
+
+CATCHES = [
+    {"_id": f"c{i}", "fish_id": "luccio", "user_id": "u1", "location": "Lago, \"Nord\"",
+     "date": "16/10/2026", "created_at": datetime(2026, 10, 16, 8, i), "applied": ["stats"]}
+    for i in range(5)
+]
+
+
+class ListCursor:
+    """Hands out documents to_list(length) at a time, like a Motor cursor"""
+
+    def __init__(self, documents):
+        self._documents = [dict(document) for document in documents]
+
+    async def to_list(self, length):
+        batch, self._documents = self._documents[:length], self._documents[length:]
+        return batch
+
+
+async def collect(body):
+    return [chunk async for chunk in body]
+
+
+def test_csv_streams_one_chunk_per_batch():
+    chunks = run(collect(export.iter_csv(ListCursor(CATCHES), 2, export.CSV_COLUMNS)))
+    assert len(chunks) == 3
+    rows = list(csv.DictReader(io.StringIO(b"".join(chunks).decode("utf-8"))))
+    assert [row["_id"] for row in rows] == ["c0", "c1", "c2", "c3", "c4"]
+    assert rows[1]["location"] == 'Lago, "Nord"'
+    assert rows[1]["created_at"] == "2026-10-16T08:01:00"
+    # Missing columns are empty, extra fields are dropped
+    assert rows[0]["photo_blob"] == ""
+    assert "applied" not in rows[0]
+
+
+def test_csv_of_nothing_is_just_the_header():
+    assert run(collect(export.iter_csv(ListCursor([]), 2, export.CSV_COLUMNS))) == [(",".join(export.CSV_COLUMNS) + "\r\n").encode()]
+
+
+def test_ndjson_resumes_after_the_last_id(db):
+    async def scenario():
+        await db.user_catches.insert_many([dict(catch) for catch in CATCHES])
+        query = export.export_query(None, "c2")
+        cursor = db.user_catches.find(query).sort("_id", 1)
+        return await collect(export.iter_ndjson(cursor, 10))
+
+    (chunk,) = run(scenario())
+    assert [orjson.loads(line)["_id"] for line in chunk.splitlines()] == ["c3", "c4"]
+
+
+def test_export_query_compares_aware_times_in_utc():
+    since = datetime(2026, 10, 16, 10, tzinfo=timezone(timedelta(hours=2)))
+    assert export.export_query(since, None) == {"created_at": {"$gte": datetime(2026, 10, 16, 8)}}
+    assert export.export_query(None, None) == {}
+
+
+def test_export_route_needs_the_export_token(monkeypatch):
+    client = TestClient(server.app)
+    assert client.get("/api/catches/export").status_code == 403
+    monkeypatch.setattr(server, "EXPORT_TOKEN", "s3cret")
+    assert client.get("/api/catches/export", headers={"X-Export-Token": "guess"}).status_code == 403
+    response = client.get("/api/catches/export?format=csv", headers={"X-Export-Token": "s3cret"})
+    assert response.status_code == 200
+    assert response.text.startswith("_id,fish_id,user_id")
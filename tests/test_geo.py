@@ -0,0 +1,57 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import geo
+import server
+from tests.conftest import run
+
+HABITAT_OF = {"luccio": "lago", "spigola": "mare"}.get
+
+
+def catch(fish_id, lat, lon):
+    return {"fish_id": fish_id, "geo": geo.point(lat, lon)}
+
+
+def test_tile_cells_nest_across_zooms():
+    cells = geo.tile_cells(45.6, 10.6)
+    assert cells[0] == (0, 0, 0, cells[0][3])
+    for (z, x, y, _), (_, child_x, child_y, _) in zip(cells, cells[1:]):
+        assert (child_x >> 1, child_y >> 1) == (x, y)
+    # The poles are clamped onto the map
+    assert geo.tile_cells(90, 180)[-1][1:3] == geo.tile_cells(89, 179.9999)[-1][1:3]
+
+
+def test_heatmap_tiles_count_per_cell_and_habitat(db):
+    async def scenario():
+        await geo.record_catches(db, [
+            catch("luccio", 45.6, 10.6),
+            catch("luccio", 45.6, 10.6),
+            catch("spigola", -33.9, 18.4),
+            {"fish_id": "luccio"},
+        ], HABITAT_OF)
+        return await geo.heatmap_tile(db, 0, 0, 0, None), await geo.heatmap_tile(db, 0, 0, 0, "lago")
+
+    world, lakes = run(scenario())
+    assert world["total"] == 3
+    assert sorted(count for _, _, count in world["cells"]) == [1, 2]
+    assert lakes["total"] == 2
+    assert [count for _, _, count in lakes["cells"]] == [2]
+
+
+def test_heatmap_rejects_unknown_habitats(db):
+    with pytest.raises(ValueError):
+        run(geo.heatmap_tile(db, 0, 0, 0, "$where"))
+    client = TestClient(server.app)
+    assert client.get("/api/catches/heatmap/0/0/0?habitat=lago").status_code == 200
+    assert client.get("/api/catches/heatmap/0/0/0?habitat=by_habitat.x").status_code == 422
+
+
+def test_nearby_returns_only_public_fields():
+    near, _, project = geo.nearby_pipeline(45.6, 10.6, 500, "luccio", 10)
+    assert near["$geoNear"]["query"] == {"fish_id": "luccio"}
+    assert project == {"$project": {"_id": 0, "fish_id": 1, "geo": 1, "date": 1, "distance_m": 1}}
+
+
+def test_nearby_is_not_implemented_on_the_memory_backend():
+    response = TestClient(server.app).get("/api/catches/nearby?lat=45.6&lon=10.6")
+    assert response.status_code == 501
@@ -0,0 +1,92 @@
+import importer
+from tests.conftest import run
+
+
+def validate(record: dict) -> dict:
+    if not record.get("scientificName"):
+        raise ValueError("scientificName: Field required")
+    return {name: record.get(name) or "" for name in importer.CATALOG_FIELDS}
+
+
+def species(name, scientific_name, habitat="lago", description=""):
+    return {"name": name, "scientificName": scientific_name, "habitat": habitat,
+            "description": description, "referenceImage": ""}
+
+
+def records(*items):
+    return list(enumerate(items, start=1))
+
+
+def test_read_records_streams_jsonl_and_csv(tmp_path):
+    jsonl = tmp_path / "species.jsonl"
+    jsonl.write_text('{"name": "Luccio"}\n\nnot json\n[1]\n', encoding="utf-8")
+    csv = tmp_path / "species.csv"
+    csv.write_text("name,habitat\nLuccio,lago\nSpigola,mare\n", encoding="utf-8")
+
+    lines = list(importer.read_records(jsonl))
+    assert lines[0] == (1, {"name": "Luccio"})
+    assert [line for line, _ in lines[1:]] == [3, 4]
+    assert all(isinstance(record, ValueError) for _, record in lines[1:])
+    assert list(importer.read_records(csv)) == [
+        (2, {"name": "Luccio", "habitat": "lago"}),
+        (3, {"name": "Spigola", "habitat": "mare"}),
+    ]
+
+
+def test_import_upserts_by_scientific_name(db):
+    async def scenario():
+        first = await importer.import_species(db, records(
+            species("Luccio", "Esox lucius"),
+            species("Spigola", "Dicentrarchus labrax", "mare"),
+        ), validate, chunk_size=1)
+        before = {fish["scientificName"]: fish async for fish in db.fish.find()}
+        second = await importer.import_species(db, records(
+            species("Luccio", "Esox lucius"),
+            species("Branzino", "Dicentrarchus labrax", "mare"),
+            species("Trota", "Salmo trutta", "fiume"),
+        ), validate)
+        after = {fish["scientificName"]: fish async for fish in db.fish.find()}
+        return first, second, before, after
+
+    first, second, before, after = run(scenario())
+    assert (first.inserted, first.updated, first.unchanged) == (2, 0, 0)
+    assert (second.inserted, second.updated, second.unchanged) == (1, 1, 1)
+
+    bass = after["Dicentrarchus labrax"]
+    assert bass["name"] == "Branzino"
+    assert bass["_id"] == before["Dicentrarchus labrax"]["_id"] == importer.species_id("Dicentrarchus labrax")
+    assert bass["ordinal"] == before["Dicentrarchus labrax"]["ordinal"]
+    assert sorted(fish["ordinal"] for fish in after.values()) == [0, 1, 2]
+
+
+def test_each_writing_chunk_gets_a_revision(db):
+    async def scenario():
+        await importer.import_species(db, records(
+            species("Luccio", "Esox lucius"), species("Trota", "Salmo trutta", "fiume"),
+        ), validate, chunk_size=1)
+        revisions = {fish["name"]: fish["_rev"] async for fish in db.fish.find()}
+        # Nothing changed, so no new revision is taken
+        await importer.import_species(db, records(species("Luccio", "Esox lucius")), validate)
+        return revisions, await importer.changelog.current_revision(db)
+
+    revisions, current = run(scenario())
+    assert revisions == {"Luccio": 1, "Trota": 2}
+    assert current == 2
+
+
+def test_invalid_records_are_counted_and_reported(db):
+    async def scenario():
+        return await importer.import_species(db, [
+            (1, species("Luccio", "Esox lucius")),
+            (2, ValueError("Invalid JSON: unexpected character")),
+            (3, species("Senza nome", "")),
+            (4, species("Pesce\nvolante", "Exocoetus volitans", "cielo")),
+        ], validate)
+
+    report = run(scenario())
+    assert (report.read, report.inserted, report.invalid) == (4, 1, 3)
+    assert report.errors == [
+        (2, "Invalid JSON: unexpected character"),
+        (3, "scientificName: Field required"),
+        (4, "Unknown habitat 'cielo'"),
+    ]
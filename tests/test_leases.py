@@ -0,0 +1,59 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from leases import Lease
+from tests.conftest import run
+
+
+def test_only_one_owner_holds_a_lease(db):
+    async def scenario():
+        first = Lease(lambda: db, "startup", "worker-1")
+        second = Lease(lambda: db, "startup", "worker-2")
+        taken = (await first.try_acquire(), await second.try_acquire(), await first.try_acquire())
+        await second.release()
+        still_held = await second.try_acquire()
+        await first.release()
+        return taken, still_held, await second.try_acquire()
+
+    taken, still_held, after_release = run(scenario())
+    assert taken == (True, False, True)
+    assert not still_held
+    assert after_release
+
+
+def test_expired_leases_change_hands(db):
+    async def scenario():
+        dead = Lease(lambda: db, "startup", "worker-1")
+        await dead.try_acquire()
+        await db.leases.update_one(
+            {"_id": "startup"}, {"$set": {"expires_at": datetime.utcnow() - timedelta(seconds=1)}}
+        )
+        taken = await Lease(lambda: db, "startup", "worker-2").try_acquire()
+        return taken, await db.leases.find_one({"_id": "startup"})
+
+    taken, lease = run(scenario())
+    assert taken
+    assert lease["owner"] == "worker-2"
+
+
+def test_hold_waits_renews_and_releases(db):
+    async def scenario():
+        events = []
+
+        async def hold(owner):
+            lease = Lease(lambda: db, "startup", owner, ttl_seconds=0.06)
+            async with lease.hold(poll_interval=0.01):
+                events.append(f"{owner} in")
+                # Longer than the TTL: only renewals keep the other worker out
+                await asyncio.sleep(0.15)
+                events.append(f"{owner} out")
+
+        await asyncio.gather(hold("worker-1"), hold("worker-2"))
+        return events, await db.leases.count_documents({})
+
+    events, remaining = run(scenario())
+    assert events in (
+        ["worker-1 in", "worker-1 out", "worker-2 in", "worker-2 out"],
+        ["worker-2 in", "worker-2 out", "worker-1 in", "worker-1 out"],
+    )
+    assert remaining == 0
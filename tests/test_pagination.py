@@ -0,0 +1,35 @@
+import pytest
+
+import catalog
+
+
+def test_cursor_round_trips_unicode_names():
+    cursor = catalog.encode_cursor({"_id": "fish-7", "name": "Cefalo dorato è"})
+    assert "=" not in cursor
+    assert catalog.decode_cursor(cursor) == ("Cefalo dorato è", "fish-7")
+
+
+@pytest.mark.parametrize("cursor", ["", "not base64!", "WzFd", catalog.encode_cursor({"_id": 1, "name": "x"})])
+def test_bad_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        catalog.decode_cursor(cursor)
+
+
+def test_parse_fields_always_keeps_the_cursor_keys():
+    assert catalog.parse_fields(None) is None
+    assert catalog.parse_fields(" , ") == {"_id": 1, "name": 1}
+    assert catalog.parse_fields("habitat, ordinal") == {"_id": 1, "name": 1, "habitat": 1, "ordinal": 1}
+
+
+def test_parse_fields_rejects_unknown_fields():
+    with pytest.raises(ValueError, match="userCatch"):
+        catalog.parse_fields("habitat,userCatch")
+
+
+def test_page_query_continues_after_the_cursor():
+    cursor = catalog.encode_cursor({"_id": "b", "name": "Luccio"})
+    assert catalog.page_query(None, None) == {}
+    assert catalog.page_query("mare", cursor) == {
+        "habitat": "mare",
+        "$or": [{"name": {"$gt": "Luccio"}}, {"name": "Luccio", "_id": {"$gt": "b"}}],
+    }
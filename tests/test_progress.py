@@ -0,0 +1,76 @@
+import asyncio
+import base64
+
+import progress
+from tests.conftest import run
+
+
+def test_bits_grow_the_bitmap():
+    bitmap = progress.set_bit(b"", 9)
+    assert bitmap == b"\x00\x02"
+    assert progress.test_bit(bitmap, 9)
+    assert not progress.test_bit(bitmap, 8)
+    assert not progress.test_bit(bitmap, 100)
+
+
+def test_first_unlock_sets_the_bit_once(db):
+    async def scenario():
+        first = await progress.mark_unlocked(db, "u1", 3, "mare")
+        again = await progress.mark_unlocked(db, "u1", 3, "mare")
+        return first, again, await progress.get_progress(db, "u1")
+
+    first, again, state = run(scenario())
+    assert (first, again) == (True, False)
+    assert state["unlocked"] == 1
+    assert state["by_habitat"] == {"mare": 1}
+    assert progress.test_bit(base64.b64decode(state["bitmap"]), 3)
+
+
+def test_concurrent_unlocks_keep_every_bit(db):
+    async def scenario():
+        results = await asyncio.gather(*(
+            progress.mark_unlocked(db, "u1", ordinal, "lago" if ordinal % 2 else "fiume")
+            for ordinal in range(20)
+        ))
+        return results, await progress.get_progress(db, "u1")
+
+    results, state = run(scenario())
+    assert all(results)
+    bitmap = base64.b64decode(state["bitmap"])
+    assert all(progress.test_bit(bitmap, ordinal) for ordinal in range(20))
+    assert state["unlocked"] == 20
+    assert state["by_habitat"] == {"lago": 10, "fiume": 10}
+
+
+class RacingCollection:
+    """Runs `race` once, right after the first find_one has read the document"""
+
+    def __init__(self, collection, race):
+        self._collection = collection
+        self._race = race
+
+    async def find_one(self, *args, **kwargs):
+        document = await self._collection.find_one(*args, **kwargs)
+        if self._race is not None:
+            race, self._race = self._race, None
+            await race()
+        return document
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+
+def test_stale_version_retries_instead_of_overwriting(db, monkeypatch):
+    async def scenario():
+        await progress.mark_unlocked(db, "u1", 1, "mare")
+        # Another writer sets bit 2 between our read and our swap
+        racing = RacingCollection(db.user_progress, lambda: progress.mark_unlocked(db, "u1", 2, "mare"))
+        monkeypatch.setattr(db, "user_progress", racing, raising=False)
+        unlocked = await progress.mark_unlocked(db, "u1", 5, "mare")
+        return unlocked, await progress.get_progress(db, "u1")
+
+    unlocked, state = run(scenario())
+    assert unlocked
+    bitmap = base64.b64decode(state["bitmap"])
+    assert [ordinal for ordinal in range(8) if progress.test_bit(bitmap, ordinal)] == [1, 2, 5]
+    assert state["unlocked"] == 3
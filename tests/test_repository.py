@@ -0,0 +1,42 @@
+import pytest
+
+from repository import MongoSettings, Repository
+from tests.conftest import run
+
+
+def test_nothing_connects_until_first_use():
+    repository = Repository(MongoSettings(url="memory://", db_name="lazy"))
+    assert repository._client is None
+    assert repository.fish.name == "fish"
+    assert repository["jobs"].name == "jobs"
+    assert repository._client is not None
+    repository.close()
+    assert repository._client is None
+
+
+def test_missing_url_fails_on_first_use_only():
+    repository = Repository(MongoSettings(url="", db_name="nowhere"))
+    with pytest.raises(RuntimeError, match="MONGO_URL"):
+        repository.fish
+
+
+def test_memory_backend_round_trips_and_reads_the_catalog_from_the_primary(db):
+    async def scenario():
+        await db.fish.insert_one({"_id": "luccio", "name": "Luccio"})
+        async with db.catalog_session() as session:
+            found = await db.catalog.fish.find_one({"_id": "luccio"}, session=session)
+        return session, found
+
+    session, found = run(scenario())
+    assert session is None
+    assert found["name"] == "Luccio"
+
+
+def test_settings_from_env(monkeypatch):
+    monkeypatch.setenv("MONGO_URL", "mongodb://db:27017")
+    monkeypatch.setenv("MONGO_MAX_POOL_SIZE", "12")
+    monkeypatch.setenv("MONGO_SOCKET_TIMEOUT_MS", "2500")
+    settings = MongoSettings.from_env()
+    assert not settings.in_memory
+    assert settings.client_options()["maxPoolSize"] == 12
+    assert settings.client_options()["socketTimeoutMS"] == 2500
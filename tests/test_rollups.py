@@ -0,0 +1,83 @@
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+import rollups
+import server
+from tests.conftest import run
+
+HABITAT_OF = {"luccio": "lago", "spigola": "mare", "ignoto": None}.get
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("16/10/2026", datetime(2026, 10, 16)),
+    (" 2026-10-16 ", datetime(2026, 10, 16)),
+    ("16-10-2026", datetime(2026, 10, 16)),
+    ("16.10.2026", datetime(2026, 10, 16)),
+    ("2026-10-16T18:45:00+02:00", datetime(2026, 10, 16)),
+    ("ieri", None),
+    ("31/02/2026", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_catch_date(value, expected):
+    assert rollups.parse_catch_date(value) == expected
+
+
+def catch(fish_id, caught_at, created_at=datetime(2026, 10, 20)):
+    return {"fish_id": fish_id, "caught_at": caught_at, "created_at": created_at}
+
+
+def test_timeline_counts_by_period_and_habitat(db):
+    async def scenario():
+        await rollups.record_catches(db, [
+            catch("luccio", datetime(2026, 9, 30)),
+            catch("luccio", datetime(2026, 10, 1)),
+            catch("spigola", datetime(2026, 10, 1)),
+            catch("ignoto", None, created_at=datetime(2026, 10, 2, 9, 30)),
+        ], HABITAT_OF)
+        days = await rollups.timeline(db, "day", None, None, None, 10)
+        months = await rollups.timeline(db, "month", "lago", None, None, 10)
+        latest = await rollups.timeline(db, "day", None, None, None, 2)
+        since = await rollups.timeline(db, "day", "mare", datetime(2026, 10, 1, 12), None, 10)
+        return days, months, latest, since
+
+    days, months, latest, since = run(scenario())
+    assert [(point["period"].day, point["catches"]) for point in days] == [(30, 1), (1, 2), (2, 1)]
+    assert days[1]["by_habitat"] == {"mare": 1, "fiume": 0, "lago": 1}
+    assert months == [
+        {"period": datetime(2026, 9, 1), "catches": 1},
+        {"period": datetime(2026, 10, 1), "catches": 1},
+    ]
+    # The newest periods, still oldest first
+    assert [point["period"].day for point in latest] == [1, 2]
+    assert since == [{"period": datetime(2026, 10, 1), "catches": 1}, {"period": datetime(2026, 10, 2), "catches": 0}]
+
+
+def test_rebuild_matches_incremental_rollups(db):
+    async def scenario():
+        await db.fish.insert_many([{"_id": "luccio", "habitat": "lago"}, {"_id": "spigola", "habitat": "mare"}])
+        await db.user_catches.insert_many([
+            {"_id": "a", "fish_id": "luccio", "date": "01/10/2026", "created_at": datetime(2026, 10, 5)},
+            {"_id": "b", "fish_id": "spigola", "date": "non so", "created_at": datetime(2026, 10, 5, 8)},
+        ])
+        counted = await rollups.rebuild(db)
+        backfilled = await db.user_catches.find_one({"_id": "a"})
+        return counted, backfilled, await rollups.timeline(db, "day", None, None, None, 10)
+
+    counted, backfilled, days = run(scenario())
+    assert counted == 2
+    assert backfilled["caught_at"] == datetime(2026, 10, 1)
+    assert [(point["period"], point["catches"], point["by_habitat"]["lago"]) for point in days] == [
+        (datetime(2026, 10, 1), 1, 1),
+        (datetime(2026, 10, 5), 1, 0),
+    ]
+
+
+def test_timeline_rejects_unknown_habitats(db):
+    with pytest.raises(ValueError):
+        run(rollups.timeline(db, "day", "lago.x", None, None, 10))
+    client = TestClient(server.app)
+    assert client.get("/api/stats/timeline?habitat=lago").status_code == 200
+    assert client.get("/api/stats/timeline?habitat=$where").status_code == 422
@@ -0,0 +1,83 @@
+import search
+from search import SearchIndex
+
+CATALOG = [
+    {"_id": "1", "name": "Luccio", "scientificName": "Esox lucius", "habitat": "lago",
+     "description": "Predatore dalle acque dolci"},
+    {"_id": "2", "name": "Persico reale", "scientificName": "Perca fluviatilis", "habitat": "lago",
+     "description": "Pesce a strisce verticali"},
+    {"_id": "3", "name": "Spigola", "scientificName": "Dicentrarchus labrax", "habitat": "mare",
+     "description": "Detta anche branzino"},
+    {"_id": "4", "name": "Trota fario", "scientificName": "Salmo trutta", "habitat": "fiume",
+     "description": "Vive in acque fredde e ossigenate"},
+]
+
+
+def names(results):
+    return [fish["name"] for fish, _ in results]
+
+
+def built(fish_list=CATALOG, version=1):
+    index = SearchIndex()
+    index.sync(fish_list, version)
+    return index
+
+
+def test_normalize_strips_accents_and_punctuation():
+    assert search.normalize("Pesce-Àngelo, d'acqua") == "pesce angelo  d acqua"
+
+
+def test_search_tolerates_typos_and_accents():
+    index = built()
+    assert names(index.search("lucio"))[0] == "Luccio"
+    assert names(index.search("spìgola")) == ["Spigola"]
+    assert names(index.search("trutta")) == ["Trota fario"]
+
+
+def test_name_matches_outrank_description_matches():
+    index = built([
+        {"_id": "a", "name": "Branzino", "description": ""},
+        {"_id": "b", "name": "Spigola", "description": "Detta anche branzino"},
+    ])
+    assert names(index.search("branzino")) == ["Branzino", "Spigola"]
+
+
+def test_habitat_filter_and_limit():
+    index = built()
+    assert names(index.search("acque", habitat="fiume")) == ["Trota fario"]
+    assert names(index.search("acque", habitat="oceano")) == []
+    assert len(index.search("acque", limit=1)) == 1
+
+
+def test_empty_queries_and_indexes_return_nothing():
+    assert built().search("  !! ") == []
+    assert SearchIndex().search("luccio") == []
+
+
+def test_sync_applies_changes_and_removals():
+    index = built()
+    renamed = [dict(CATALOG[0], name="Luccio europeo"), *CATALOG[1:3]]
+    index.sync(renamed, 2)
+    assert len(index) == 3
+    assert names(index.search("europeo")) == ["Luccio europeo"]
+    assert index.search("fario") == []
+    # Syncing the same version again is a no-op
+    index.sync(CATALOG, 2)
+    assert index.search("fario") == []
+
+
+def test_sync_compacts_once_most_fish_are_gone():
+    index = built()
+    index.sync(CATALOG[:1], 2)
+    assert len(index._fish) == 1
+    assert names(index.search("luccio")) == ["Luccio"]
+
+
+def test_synced_leaves_the_original_untouched():
+    index = built()
+    added = CATALOG + [{"_id": "5", "name": "Luccioperca", "scientificName": "Sander lucioperca"}]
+    copy = index.synced(added, 2)
+    assert index.synced(CATALOG, 1) is index
+    assert names(copy.search("luccioperca"))[0] == "Luccioperca"
+    assert "Luccioperca" not in names(index.search("luccioperca"))
+    assert (index.version, copy.version) == (1, 2)
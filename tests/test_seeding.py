@@ -0,0 +1,36 @@
+import importer
+import server
+from tests.conftest import run
+
+
+def test_seeding_is_incremental_and_deterministic():
+    async def scenario():
+        await server.initialize_fish_database()
+        revision = await server.changelog.current_revision(server.db)
+        # An unchanged seed costs one read and takes no revision
+        await server.initialize_fish_database()
+        fish = await server.db.fish.find().to_list(None)
+        return revision, await server.changelog.current_revision(server.db), fish
+
+    revision, again, fish = run(scenario())
+    assert again == revision
+    assert len(fish) == len(server.FISH_DATABASE)
+    assert all(item["_id"] == importer.species_id(item["scientificName"]) for item in fish)
+    assert sorted(item["ordinal"] for item in fish) == list(range(len(fish)))
+
+
+def test_changed_seed_data_only_rewrites_what_changed(monkeypatch):
+    async def scenario():
+        await server.initialize_fish_database()
+        before = {item["_id"]: item async for item in server.db.fish.find()}
+        edited = [dict(server.FISH_DATABASE[0], description="Nuova descrizione"), *server.FISH_DATABASE[1:]]
+        monkeypatch.setattr(server, "FISH_DATABASE", edited)
+        await server.initialize_fish_database()
+        after = {item["_id"]: item async for item in server.db.fish.find()}
+        return edited[0], before, after
+
+    changed, before, after = run(scenario())
+    changed_id = importer.species_id(changed["scientificName"])
+    assert after[changed_id]["description"] == "Nuova descrizione"
+    assert after[changed_id]["ordinal"] == before[changed_id]["ordinal"]
+    assert [fish_id for fish_id in after if after[fish_id]["_rev"] != before[fish_id]["_rev"]] == [changed_id]
@@ -0,0 +1,75 @@
+import orjson
+import pytest
+
+import catalog
+import shared_catalog
+
+FISH = [
+    {"_id": "c-luccio", "name": "Luccio", "habitat": "lago", "ordinal": 2},
+    {"_id": "a-spigola", "name": "Spigola", "habitat": "mare", "ordinal": 0},
+    {"_id": "b-trota", "name": "Trota fario", "habitat": "fiume", "ordinal": 1},
+    {"_id": "pesce-àngelo", "name": "Pesce angelo", "habitat": None, "ordinal": None},
+]
+
+
+@pytest.fixture
+def published(tmp_path):
+    path = tmp_path / "catalog.bin"
+    shared_catalog.publish(path, 7, FISH)
+    return path
+
+
+def test_snapshot_serves_the_same_bytes_as_an_in_process_one(published):
+    shared = shared_catalog.open_snapshot(published)
+    local = catalog.CatalogSnapshot(7, FISH)
+    assert shared.version == 7
+    assert (shared.body, shared.etag) == (local.body, local.etag)
+    for item in FISH:
+        assert shared.item_bodies.get(item["_id"]) == local.item_bodies[item["_id"]]
+        assert shared.item_etags[item["_id"]] == local.item_etags[item["_id"]]
+    assert shared.fish == FISH
+    assert shared.by_id["b-trota"]["name"] == "Trota fario"
+
+
+def test_index_lookups_binary_search_the_mapping(published):
+    shared = shared_catalog.open_snapshot(published)
+    assert shared.habitat_and_ordinal("c-luccio") == ("lago", 2)
+    assert shared.habitat_and_ordinal("pesce-àngelo") == (None, None)
+    assert "b-trota" in shared.item_etags
+    for missing in ("", "b-trot", "b-trota-x", "z", "a-spigola" * 10):
+        assert missing not in shared.item_etags
+        assert shared.habitat_and_ordinal(missing) is None
+        assert shared.item_bodies.get(missing) is None
+    with pytest.raises(KeyError):
+        shared.item_etags["z"]
+    # Looking species up never decodes the catalog
+    assert "fish" not in vars(shared)
+
+
+def test_empty_catalogs_publish_too(tmp_path):
+    path = tmp_path / "catalog.bin"
+    shared_catalog.publish(path, 1, [])
+    shared = shared_catalog.open_snapshot(path)
+    assert shared.fish == []
+    assert shared.habitat_and_ordinal("a") is None
+
+
+def test_republishing_replaces_the_file_under_open_mappings(published):
+    before = shared_catalog.open_snapshot(published)
+    shared_catalog.publish(published, 8, FISH[:1])
+    after = shared_catalog.open_snapshot(published)
+    assert shared_catalog.read_revision(published) == 8
+    assert before.version == 7 and before.habitat_and_ordinal("b-trota") == ("fiume", 1)
+    assert after.version == 8 and after.habitat_and_ordinal("b-trota") is None
+    assert list(published.parent.iterdir()) == [published]
+
+
+def test_missing_or_foreign_files_are_not_snapshots(tmp_path):
+    missing = tmp_path / "missing.bin"
+    foreign = tmp_path / "foreign.bin"
+    foreign.write_bytes(orjson.dumps({"not": "a catalog"}) * 4)
+    short = tmp_path / "short.bin"
+    short.write_bytes(b"FDX")
+    for path in (missing, foreign, short):
+        assert shared_catalog.read_revision(path) is None
+        assert shared_catalog.open_snapshot(path) is None
@@ -0,0 +1,51 @@
+from fastapi.testclient import TestClient
+
+import server
+import stats
+from tests.conftest import run
+
+
+def test_counters_follow_catches_and_species(db):
+    async def scenario():
+        await stats.record_species(db, ["mare", "lago", "lago"])
+        await stats.record_catch(db, "luccio", "lago", 2)
+        await stats.record_catch(db, "spigola", "mare")
+        await stats.record_catch(db, "ignoto", None)
+        return await stats.get_counters(db)
+
+    response = stats.to_response(run(scenario()), include_fish=True)
+    assert response == {
+        "total_fish": 3,
+        "total_catches": 4,
+        "marine_fish": 1,
+        "river_fish": 0,
+        "lake_fish": 2,
+        "catches_by_habitat": {"mare": 1, "fiume": 0, "lago": 2},
+        "catches_by_fish": {"luccio": 2, "spigola": 1, "ignoto": 1},
+    }
+
+
+def test_reconcile_matches_incremental_counters(db):
+    async def scenario():
+        await db.fish.insert_many([{"_id": "luccio", "habitat": "lago"}, {"_id": "spigola", "habitat": "mare"}])
+        await db.user_catches.insert_many([{"fish_id": "luccio"}, {"fish_id": "luccio"}, {"fish_id": "spigola"}])
+        await stats.reconcile(db)
+        return await stats.get_counters(db)
+
+    response = stats.to_response(run(scenario()), include_fish=True)
+    assert (response["total_fish"], response["total_catches"]) == (2, 3)
+    assert response["catches_by_habitat"] == {"mare": 1, "fiume": 0, "lago": 2}
+    assert response["catches_by_fish"] == {"luccio": 2, "spigola": 1}
+
+
+def test_per_species_counts_are_opt_in():
+    client = TestClient(server.app)
+    default = client.get("/api/stats").json()
+    assert "catches_by_fish" not in default
+    assert set(default) >= {"total_fish", "total_catches", "marine_fish", "river_fish", "lake_fish"}
+    assert "catches_by_fish" in client.get("/api/stats?include=fish").json()
+    assert client.get("/api/stats?include=users").status_code == 422
+    assert stats.to_response(None) == {
+        "total_fish": 0, "total_catches": 0, "marine_fish": 0, "river_fish": 0, "lake_fish": 0,
+        "catches_by_habitat": {"mare": 0, "fiume": 0, "lago": 0},
+    }
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from tests.conftest import run
+from writes import InsertCoalescer
+
+
+class FailingCollection:
+    name = "failing"
+
+    async def insert_many(self, documents, ordered=True):
+        raise ConnectionError("connection reset")
+
+
+def test_each_caller_gets_its_own_outcome(db):
+    async def scenario():
+        await db.user_catches.insert_one({"_id": "taken"})
+        coalescer = InsertCoalescer(lambda: db.user_catches, window_ms=50)
+        return await asyncio.gather(
+            coalescer.insert_one({"_id": "a"}),
+            coalescer.insert_one({"_id": "taken"}),
+            coalescer.insert_one({"_id": "b"}),
+            return_exceptions=True,
+        )
+
+    first, duplicate, last = run(scenario())
+    assert first == "a"
+    assert isinstance(duplicate, DuplicateKeyError)
+    assert last == "b"
+
+
+def test_documents_are_written_in_one_batch(db):
+    async def scenario():
+        coalescer = InsertCoalescer(lambda: db.user_catches, window_ms=50, max_docs=3)
+        ids = await asyncio.gather(*(coalescer.insert_one({"_id": str(i)}) for i in range(3)))
+        return ids, await db.user_catches.count_documents({})
+
+    ids, stored = run(scenario())
+    assert ids == ["0", "1", "2"]
+    assert stored == 3
+
+
+def test_a_failed_batch_fails_every_caller():
+    async def scenario():
+        coalescer = InsertCoalescer(lambda: FailingCollection(), window_ms=50)
+        return await asyncio.gather(
+            coalescer.insert_one({"_id": "a"}), coalescer.insert_one({"_id": "b"}), return_exceptions=True
+        )
+
+    outcomes = run(scenario())
+    assert all(isinstance(outcome, ConnectionError) for outcome in outcomes)
+
+
+def test_without_a_window_inserts_directly(db):
+    async def scenario():
+        coalescer = InsertCoalescer(lambda: db.user_catches)
+        assert await coalescer.insert_one({"_id": "a"}) == "a"
+        with pytest.raises(DuplicateKeyError):
+            await coalescer.insert_one({"_id": "a"})
+
+    run(scenario())